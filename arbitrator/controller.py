@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+
+from common.redis_client import WeaverFleetStats
+
+# Queue depth thresholds used until the Weavers have reported enough latency samples.
+_FALLBACK_THRESHOLDS = ((100, 16), (50, 8), (10, 4))
+
+
+@dataclass
+class BatchSizeDecision:
+    batch_size: int
+    reason: str
+    arrival_rate: float
+    replicas: int
+    queue_depth: int
+    # Expected queue wait + service time per candidate batch size (seconds; inf when unstable).
+    expected_cost: dict[int, float] = field(default_factory=dict)
+
+    def as_stats(self) -> dict[str, str | int | float]:
+        stats: dict[str, str | int | float] = {
+            "batch_size": self.batch_size,
+            "reason": self.reason,
+            "arrival_rate": round(self.arrival_rate, 4),
+            "replicas": self.replicas,
+            "queue_depth": self.queue_depth,
+        }
+        for size, cost in self.expected_cost.items():
+            stats[f"expected_cost_{size}"] = round(cost, 4) if math.isfinite(cost) else "inf"
+        return stats
+
+
+def fit_service_time(latency_by_batch_size: dict[int, float]) -> tuple[float, float] | None:
+    """
+    Least-squares fit of `latency = fixed + per_job * batch_size` over the reported sizes.
+
+    Returns None until at least two distinct batch sizes have been measured.
+    """
+    if len(latency_by_batch_size) < 2:
+        return None
+    sizes = list(latency_by_batch_size)
+    mean_b = sum(sizes) / len(sizes)
+    mean_s = sum(latency_by_batch_size.values()) / len(sizes)
+    var_b = sum((b - mean_b) ** 2 for b in sizes)
+    per_job = sum((b - mean_b) * (latency_by_batch_size[b] - mean_s) for b in sizes) / var_b
+    per_job = max(per_job, 0.0)
+    fixed = max(mean_s - per_job * mean_b, 0.0)
+    return fixed, per_job
+
+
+def pool_throughput(fleet: WeaverFleetStats) -> float:
+    """Jobs per second a pool serves at its best measured batch size; 0 until it has reported."""
+    best = max((size / seconds for size, seconds in fleet.latency_by_batch_size.items() if seconds > 0), default=0.0)
+    return fleet.replicas * best
+
+
+class BatchSizeController:
+    """
+    Picks the batch size that minimises expected queue wait plus service time.
+
+    Each batch is treated as one service unit of a deterministic-service queue (M/D/1) spread
+    over the live Weaver replicas:
+
+        S(b)   service time of a batch of b, from measured latencies (measured value if present,
+               otherwise the linear fit)
+        mu(b)  = replicas * b / S(b)                     job throughput
+        rho    = arrival_rate / mu(b)
+        cost   = depth / mu(b) + rho / (2 (1 - rho)) * S(b) + S(b)
+
+    Batch sizes with rho >= 1 cannot keep up; when no size can, the one with the highest
+    throughput wins. A new size only replaces the current one when it is cheaper by more than
+    `hysteresis` and the current one has been held for `min_dwell_seconds`, so noise in the
+    arrival-rate estimate does not make the fleet flap between sizes.
+    """
+
+    def __init__(
+        self,
+        ladder: tuple[int, ...],
+        hysteresis: float = 0.15,
+        min_dwell_seconds: float = 5.0,
+        rate_smoothing: float = 0.2,
+    ) -> None:
+        self._ladder = ladder
+        self._hysteresis = hysteresis
+        self._min_dwell_seconds = min_dwell_seconds
+        self._rate_smoothing = rate_smoothing
+        self._arrival_rate = 0.0
+        self._last_sample: tuple[float, int, int] | None = None
+        self._current: int | None = None
+        self._changed_at = 0.0
+
+    @property
+    def arrival_rate(self) -> float:
+        return self._arrival_rate
+
+    def observe(self, now: float, queue_depth: int, popped_total: int) -> None:
+        """Update the arrival-rate estimate: jobs that entered = change in depth + jobs popped."""
+        if self._last_sample is not None:
+            last_time, last_depth, last_popped = self._last_sample
+            elapsed = now - last_time
+            if elapsed <= 0:
+                return
+            popped = popped_total - last_popped
+            if popped < 0:
+                # Counter was reset; skip this interval.
+                popped = 0
+            instant = max(0.0, (queue_depth - last_depth + popped) / elapsed)
+            self._arrival_rate += self._rate_smoothing * (instant - self._arrival_rate)
+        self._last_sample = (now, queue_depth, popped_total)
+
+    def decide(self, now: float, queue_depth: int, fleet: WeaverFleetStats) -> BatchSizeDecision:
+        fit = fit_service_time(fleet.latency_by_batch_size)
+        if fit is None or fleet.replicas == 0:
+            return self._commit(now, self._fallback(queue_depth), "fallback_thresholds", queue_depth, fleet, {})
+
+        costs = {
+            size: self._expected_cost(size, queue_depth, fleet.replicas, fleet.latency_by_batch_size, fit)
+            for size in self._ladder
+        }
+        if all(math.isinf(cost) for cost in costs.values()):
+            best = max(self._ladder, key=lambda size: self._throughput(size, fleet.replicas, fleet.latency_by_batch_size, fit))
+            return self._commit(now, best, "overloaded_max_throughput", queue_depth, fleet, costs)
+
+        best = min(costs, key=lambda size: costs[size])
+        current = self._current
+        if current is None or current not in costs:
+            return self._commit(now, best, "initial", queue_depth, fleet, costs)
+        if best == current:
+            return self._commit(now, current, "hold", queue_depth, fleet, costs)
+        if math.isinf(costs[current]):
+            return self._commit(now, best, "current_unstable", queue_depth, fleet, costs)
+        if now - self._changed_at < self._min_dwell_seconds:
+            return self._commit(now, current, "hold_dwell", queue_depth, fleet, costs)
+        if costs[best] < costs[current] * (1 - self._hysteresis):
+            return self._commit(now, best, "cheaper", queue_depth, fleet, costs)
+        return self._commit(now, current, "hold_hysteresis", queue_depth, fleet, costs)
+
+    def _commit(
+        self,
+        now: float,
+        batch_size: int,
+        reason: str,
+        queue_depth: int,
+        fleet: WeaverFleetStats,
+        costs: dict[int, float],
+    ) -> BatchSizeDecision:
+        if batch_size != self._current:
+            self._current = batch_size
+            self._changed_at = now
+        return BatchSizeDecision(
+            batch_size=batch_size,
+            reason=reason,
+            arrival_rate=self._arrival_rate,
+            replicas=fleet.replicas,
+            queue_depth=queue_depth,
+            expected_cost=costs,
+        )
+
+    def _fallback(self, queue_depth: int) -> int:
+        for threshold, size in _FALLBACK_THRESHOLDS:
+            if queue_depth > threshold:
+                return size
+        return 1
+
+    @staticmethod
+    def _service_time(size: int, measured: dict[int, float], fit: tuple[float, float]) -> float:
+        if size in measured:
+            return measured[size]
+        fixed, per_job = fit
+        return fixed + per_job * size
+
+    def _throughput(self, size: int, replicas: int, measured: dict[int, float], fit: tuple[float, float]) -> float:
+        service_time = self._service_time(size, measured, fit)
+        return replicas * size / service_time if service_time > 0 else math.inf
+
+    def _expected_cost(
+        self,
+        size: int,
+        queue_depth: int,
+        replicas: int,
+        measured: dict[int, float],
+        fit: tuple[float, float],
+    ) -> float:
+        service_time = self._service_time(size, measured, fit)
+        throughput = self._throughput(size, replicas, measured, fit)
+        utilisation = self._arrival_rate / throughput
+        if utilisation >= 1.0:
+            return math.inf
+        queueing = utilisation / (2 * (1 - utilisation)) * service_time
+        return queue_depth / throughput + queueing + service_time
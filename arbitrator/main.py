@@ -1,41 +1,119 @@
 from common.config import load_settings
 from common.redis_client import RedisClient
 from common.log_utils import get_logger, setup_logging
+from common.metrics import start_metrics_server
+from .controller import BatchSizeController, pool_throughput
+from . import metrics
 import time
 
+# Lower bound between two evaluations triggered by queue notifications.
+_MIN_EVAL_GAP_SECONDS = 0.2
+# Re-write the current batch size at least this often so a Redis restart cannot leave it unset.
+_REFRESH_SECONDS = 30.0
+# Pools whose capacity is always reported, next to the one batch sizes are chosen for (`WEAVER_POOL`).
+_REPORTED_POOLS = ("gpu", "cpu")
+
+
+def _wait_for_queue_change(pubsub, timeout: float) -> bool:
+    """Block until the queue key changes or `timeout` elapses; drains any backlog of notifications."""
+    if pubsub is None:
+        time.sleep(timeout)
+        return False
+    message = pubsub.get_message(timeout=max(timeout, 0.0))
+    if message is None:
+        return False
+    while pubsub.get_message(timeout=0) is not None:
+        pass
+    return True
+
+
 def main() -> None:
     settings = load_settings()
     setup_logging(settings.log_level)
     logger = get_logger("arbitrator.main")
+    start_metrics_server(settings.metrics_port, logger)
 
-    redis_client = RedisClient(settings.redis_url)
+    redis_client = RedisClient.from_settings(settings)
     if not redis_client.ping():
         raise RuntimeError("Redis ping failed")
 
     logger.info("Arbitrator worker started")
     batch_size = redis_client.get_config_batch_size()
     redis_client.set_config_batch_size(batch_size)
+    metrics.BATCH_SIZE.set(batch_size)
     logger.info("Batch size set to %s", batch_size)
-    cooldown_time = 1 # 1 second
-    last_adjustment = time.time()
+
+    controller = BatchSizeController(
+        settings.batch_size_ladder,
+        hysteresis=settings.arbitrator_hysteresis,
+        min_dwell_seconds=settings.arbitrator_min_dwell_seconds,
+    )
+    pubsub = redis_client.subscribe_queue_changes(settings.redis_queue)
+    if pubsub is None:
+        logger.warning(
+            "Keyspace notifications unavailable; polling queue depth every %ss",
+            settings.arbitrator_eval_interval_seconds,
+        )
+
+    last_eval = 0.0
+    last_write = time.monotonic()
     while True:
-        queue_depth = redis_client.get_queue_depth(settings.redis_queue)
-        if queue_depth is None:
-            queue_depth = 0
+        timeout = last_eval + settings.arbitrator_eval_interval_seconds - time.monotonic()
+        changed = _wait_for_queue_change(pubsub, timeout)
+        now = time.monotonic()
+        if changed and now - last_eval < _MIN_EVAL_GAP_SECONDS:
+            time.sleep(_MIN_EVAL_GAP_SECONDS - (now - last_eval))
+            now = time.monotonic()
+        last_eval = now
+
+        started = time.perf_counter()
+        tier_depths = redis_client.get_tier_queue_depths(settings.redis_queue)
+        if tier_depths:
+            queue_depth = sum(tier_depths.values())
         else:
-            queue_depth = int(queue_depth)
-        if time.time() - last_adjustment > cooldown_time:
-            if queue_depth <= 10:
-                batch_size = 1
-            if queue_depth > 10:
-                batch_size = 4
-            if queue_depth > 50:
-                batch_size = 8
-            if queue_depth > 100:
-                batch_size = 16
-            last_adjustment = time.time()
+            queue_depth = redis_client.get_queue_depth(settings.redis_queue)
+        pools = redis_client.get_weaver_pools(
+            settings.weaver_heartbeat_ttl_seconds, include=(settings.worker_pool, *_REPORTED_POOLS)
+        )
+        fleet = pools[settings.worker_pool]
+        read_done = time.perf_counter()
+        metrics.STAGE_SECONDS.labels("read").observe(read_done - started)
+        controller.observe(now, queue_depth, fleet.popped_total)
+        decision = controller.decide(now, queue_depth, fleet)
+        decide_done = time.perf_counter()
+        metrics.STAGE_SECONDS.labels("decide").observe(decide_done - read_done)
+
+        if decision.batch_size != batch_size or now - last_write > _REFRESH_SECONDS:
+            if decision.batch_size != batch_size:
+                logger.info(
+                    "Batch size %s -> %s (%s): depth=%s arrival_rate=%.3f/s replicas=%s",
+                    batch_size,
+                    decision.batch_size,
+                    decision.reason,
+                    decision.queue_depth,
+                    decision.arrival_rate,
+                    decision.replicas,
+                )
+            batch_size = decision.batch_size
             redis_client.set_config_batch_size(batch_size)
-        time.sleep(0.1)
+            last_write = now
+        stats = decision.as_stats()
+        for pool, pool_fleet in pools.items():
+            throughput = pool_throughput(pool_fleet)
+            stats[f"{pool}_replicas"] = pool_fleet.replicas
+            stats[f"{pool}_jobs_per_second"] = round(throughput, 4)
+            metrics.POOL_REPLICAS.labels(pool).set(pool_fleet.replicas)
+            metrics.POOL_THROUGHPUT.labels(pool).set(throughput)
+        for tier, depth in tier_depths.items():
+            stats[f"queue_depth_{tier}"] = depth
+            metrics.TIER_QUEUE_DEPTH.labels(tier).set(depth)
+        redis_client.set_arbitrator_stats(stats)
+        metrics.STAGE_SECONDS.labels("write").observe(time.perf_counter() - decide_done)
+        metrics.DECISIONS.labels(decision.reason).inc()
+        metrics.BATCH_SIZE.set(batch_size)
+        metrics.QUEUE_DEPTH.set(decision.queue_depth)
+        metrics.ARRIVAL_RATE.set(decision.arrival_rate)
+        metrics.REPLICAS.set(decision.replicas)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from common.metrics import STAGE_BUCKETS
+
+# One evaluation: read queue depth and fleet stats, decide, write the batch size and stats back.
+STAGES = ("read", "decide", "write")
+
+STAGE_SECONDS = Histogram(
+    "arbitrator_stage_seconds",
+    "Seconds spent in each stage of an Arbitrator evaluation.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+DECISIONS = Counter("arbitrator_decisions_total", "Batch size evaluations, by decision reason.", ["reason"])
+BATCH_SIZE = Gauge("arbitrator_batch_size", "Batch size currently published to the Weavers.")
+QUEUE_DEPTH = Gauge("arbitrator_queue_depth", "Weaver queue depth at the last evaluation.")
+TIER_QUEUE_DEPTH = Gauge(
+    "arbitrator_tier_queue_depth",
+    "Weaver queue depth per tier at the last evaluation (WEAVER_QUEUE_BACKEND=fair).",
+    ["tier"],
+)
+ARRIVAL_RATE = Gauge("arbitrator_arrival_rate", "Estimated job arrival rate (jobs/s).")
+REPLICAS = Gauge("arbitrator_weaver_replicas", "Weavers with a live heartbeat.")
+POOL_REPLICAS = Gauge("arbitrator_pool_replicas", "Weavers with a live heartbeat, by WEAVER_POOL.", ["pool"])
+POOL_THROUGHPUT = Gauge(
+    "arbitrator_pool_jobs_per_second",
+    "Jobs per second each WEAVER_POOL can serve at its best measured batch size.",
+    ["pool"],
+)
+
+for _stage in STAGES:
+    STAGE_SECONDS.labels(_stage)
@@ -9,6 +9,13 @@ class Settings:
     redis_url: str
     redis_queue: str
     redis_events_channel: str
+    redis_progress_channel: str
+    queue_backend: str
+    queue_consumer_group: str
+    queue_visibility_timeout_seconds: int
+    queue_max_deliveries: int
+    queue_tiers: tuple[str, ...]
+    queue_tier_min_share: float
 
     ENV: str
     
@@ -22,21 +29,79 @@ class Settings:
     s3_endpoint_url: str | None
     s3_access_key_id: str | None
     s3_secret_access_key: str | None
+    s3_max_concurrency: int
+    s3_max_attempts: int
+    s3_retry_mode: str
+    s3_connect_timeout: float
+    s3_read_timeout: float
+    s3_stream_threshold_bytes: int
+    input_draft_decode: bool
 
     inference_backend: str
     catvton_model_id: str
     catvton_model_dir: str
     catvton_model_variant: str
     catvton_base_model_path: str
+    catvton_bundle_path: str | None
     mixed_precision: str
     allow_tf32: bool
+    compile_mode: str
+    vae_slicing: bool
+    vae_tiling: bool
+    attention_fused_qkv: bool
+    attention_kernel: str
+    attention_garment_merge: int
+    unet_channels_last: bool
+    memory_budget_fraction: float
+    cpu_threads: int
+    cpu_interop_threads: int
+    cpu_channels_last: bool
+    cpu_quantize_int8: bool
+    cpu_reduced_preset: bool
+    scheduler: str
     num_inference_steps: int
     guidance_scale: float
+    cfg_cutoff_fraction: float
+    cfg_uncond_reuse_interval: int
     width: int
     height: int
     seed: int
+    profile_sizes: tuple[tuple[int, int], ...]
+    profile_max_steps: int
     device: str
+    preprocess_workers: int
+    latent_cache_max_bytes: int
+    latent_cache_dir: str | None
+    latent_cache_disk_max_bytes: int
+    result_format: str
+    result_quality: int
+    result_thumbnail_width: int
+    result_encode_workers: int
+    preview_interval_steps: int
+    preview_quality: int
+    dedup_enabled: bool
+    dedup_ttl_seconds: int
+    dedup_mode: str
+    dedup_random_seed: bool
 
+    batch_size_ladder: tuple[int, ...]
+    weaver_heartbeat_ttl_seconds: int
+    arbitrator_eval_interval_seconds: float
+    arbitrator_min_dwell_seconds: float
+    arbitrator_hysteresis: float
+
+    worker_mode: str
+    devices: tuple[str, ...]
+    device_batch_timeout_seconds: float
+    prefetch_queue_depth: int
+    publish_queue_depth: int
+    continuous_max_slots: int
+    worker_pool: str
+    max_batch_size: int
+    ready_file: str | None
+
+    metrics_port: int
+    event_timings: bool
     log_level: str
 
 
@@ -54,12 +119,61 @@ def _env_bool(name: str, default: bool) -> bool:
     return raw.strip().lower() in {"1", "true", "yes", "y", "on"}
 
 
+def _env_int_list(name: str, default: str) -> tuple[int, ...]:
+    values = sorted({int(part) for part in _env(name, default).split(",") if part.strip()})
+    if not values or values[0] < 1:
+        raise ValueError(f"{name} must be a comma-separated list of positive integers")
+    return tuple(values)
+
+
+def _env_list(name: str, default: str) -> tuple[str, ...]:
+    values = tuple(part.strip() for part in _env(name, default).split(",") if part.strip())
+    if not values or len(set(values)) != len(values):
+        raise ValueError(f"{name} must be a comma-separated list of distinct names")
+    return values
+
+
+def _env_size_list(name: str, default: str) -> tuple[tuple[int, int], ...]:
+    sizes: list[tuple[int, int]] = []
+    for part in _env(name, default).split(","):
+        if not part.strip():
+            continue
+        try:
+            width, height = (int(value) for value in part.lower().split("x"))
+        except ValueError:
+            raise ValueError(f"{name} must be a comma-separated list of WIDTHxHEIGHT sizes") from None
+        if width <= 0 or height <= 0 or width % 8 or height % 8:
+            raise ValueError(f"{name}: {part.strip()} is not a positive multiple of 8 in both dimensions")
+        sizes.append((width, height))
+    return tuple(sizes)
+
+
 def load_settings() -> Settings:
     isDev = _env("ENV", "development") == "development"
+    inference_backend = _env("INFERENCE_BACKEND", "stub").lower()
+    cpu_backend = inference_backend == "cpu"
+    # Smaller images and fewer steps by default; explicit WIDTH/HEIGHT/NUM_INFERENCE_STEPS still win.
+    cpu_reduced_preset = cpu_backend and _env_bool("CPU_REDUCED_PRESET", False)
+    device = _env("DEVICE", "cpu" if cpu_backend else "cuda")
+    # One inference process per entry with WEAVER_WORKER_MODE=multi; repeats are allowed ("cpu,cpu").
+    devices = tuple(part.strip() for part in _env("WEAVER_DEVICES", device).split(",") if part.strip()) or (device,)
+    width = int(_env("WIDTH", "384" if cpu_reduced_preset else "768"))
+    height = int(_env("HEIGHT", "512" if cpu_reduced_preset else "1024"))
+    num_inference_steps = int(_env("NUM_INFERENCE_STEPS", "20" if cpu_reduced_preset else "50"))
+    # The reduced preset only changes the defaults: profiles may still ask for 768x1024 and 50 steps.
+    full_size = [(768, 1024)] if cpu_reduced_preset else []
+    max_steps = max(num_inference_steps, 50) if cpu_reduced_preset else num_inference_steps
     return Settings(
         redis_url=_env("REDIS_URL", "redis://localhost:6379/0"),
         redis_queue=_env("REDIS_WEAVER_QUEUE", "queue:weaver_jobs"),
         redis_events_channel=_env("REDIS_EVENTS_CHANNEL", "events:job_done"),
+        redis_progress_channel=_env("REDIS_PROGRESS_CHANNEL", "events:job_progress"),
+        queue_backend=_env("WEAVER_QUEUE_BACKEND", "list").lower(),
+        queue_consumer_group=_env("WEAVER_CONSUMER_GROUP", "weaver"),
+        queue_visibility_timeout_seconds=int(_env("WEAVER_QUEUE_VISIBILITY_TIMEOUT_SECONDS", "600")),
+        queue_max_deliveries=max(0, int(_env("WEAVER_QUEUE_MAX_DELIVERIES", "3"))),
+        queue_tiers=_env_list("WEAVER_QUEUE_TIERS", "interactive,bulk"),
+        queue_tier_min_share=min(1.0, max(0.0, float(_env("WEAVER_QUEUE_TIER_MIN_SHARE", "0.1")))),
         ENV=_env("ENV", "development"),
         minio_endpoint=_env("MINIO_ENDPOINT", "http://localhost:9000"),
         minio_root_user=_env("MINIO_ROOT_USER", "minioadmin"),
@@ -70,18 +184,75 @@ def load_settings() -> Settings:
         s3_endpoint_url=os.getenv("S3_ENDPOINT_URL"),
         s3_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
         s3_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        inference_backend=_env("INFERENCE_BACKEND", "stub").lower(),
+        s3_max_concurrency=max(1, int(_env("S3_MAX_CONCURRENCY", "32"))),
+        s3_max_attempts=int(_env("S3_MAX_ATTEMPTS", "5")),
+        s3_retry_mode=_env("S3_RETRY_MODE", "standard"),
+        s3_connect_timeout=float(_env("S3_CONNECT_TIMEOUT", "5")),
+        s3_read_timeout=float(_env("S3_READ_TIMEOUT", "30")),
+        s3_stream_threshold_bytes=int(_env("S3_STREAM_THRESHOLD_BYTES", str(1024 * 1024))),
+        input_draft_decode=_env_bool("INPUT_DRAFT_DECODE", True),
+        inference_backend=inference_backend,
         catvton_model_id=_env("CATVTON_MODEL_ID", "zhengchong/CatVTON-MaskFree"),
         catvton_model_dir=_env("CATVTON_MODEL_DIR", "weaver_service/models/CatVTON-MaskFree"),
         catvton_model_variant=_env("CATVTON_MODEL_VARIANT", "mix-48k-1024"),
         catvton_base_model_path=_env("CATVTON_BASE_MODEL_PATH", "timbrooks/instruct-pix2pix"),
+        catvton_bundle_path=os.getenv("CATVTON_BUNDLE_PATH") or None,
         mixed_precision=_env("MIXED_PRECISION", "bf16"),
         allow_tf32=_env_bool("ALLOW_TF32", True),
-        num_inference_steps=int(_env("NUM_INFERENCE_STEPS", "50")),
+        compile_mode=_env("COMPILE_MODE", "off").lower(),
+        vae_slicing=_env_bool("VAE_SLICING", False),
+        vae_tiling=_env_bool("VAE_TILING", False),
+        attention_fused_qkv=_env_bool("ATTENTION_FUSED_QKV", False),
+        attention_kernel=_env("ATTENTION_KERNEL", "auto").lower(),
+        attention_garment_merge=max(0, int(_env("ATTENTION_GARMENT_MERGE", "0"))),
+        unet_channels_last=_env_bool("UNET_CHANNELS_LAST", False),
+        memory_budget_fraction=min(1.0, max(0.0, float(_env("MEMORY_BUDGET_FRACTION", "0.9")))),
+        cpu_threads=max(0, int(_env("CPU_THREADS", "0"))),
+        cpu_interop_threads=max(0, int(_env("CPU_INTEROP_THREADS", "0"))),
+        cpu_channels_last=_env_bool("CPU_CHANNELS_LAST", True),
+        cpu_quantize_int8=_env_bool("CPU_QUANTIZE_INT8", False),
+        cpu_reduced_preset=cpu_reduced_preset,
+        scheduler=_env("SCHEDULER", "ddim").lower(),
+        num_inference_steps=num_inference_steps,
         guidance_scale=float(_env("GUIDANCE_SCALE", "2.5")),
-        width=int(_env("WIDTH", "768")),
-        height=int(_env("HEIGHT", "1024")),
+        cfg_cutoff_fraction=min(1.0, max(0.0, float(_env("CFG_CUTOFF_FRACTION", "1.0")))),
+        cfg_uncond_reuse_interval=max(1, int(_env("CFG_UNCOND_REUSE_INTERVAL", "1"))),
+        width=width,
+        height=height,
         seed=int(_env("SEED", "-1")),
-        device=_env("DEVICE", "cuda"),
+        # Sizes a job's inference profile may ask for; WIDTH x HEIGHT is always allowed and first.
+        profile_sizes=tuple(dict.fromkeys(((width, height), *full_size, *_env_size_list("PROFILE_SIZES", "")))),
+        profile_max_steps=max(1, int(_env("PROFILE_MAX_STEPS", str(max_steps)))),
+        device=device,
+        preprocess_workers=max(0, int(_env("PREPROCESS_WORKERS", "4"))),
+        latent_cache_max_bytes=int(_env("LATENT_CACHE_MAX_MB", "512")) * 1024 * 1024,
+        latent_cache_dir=os.getenv("LATENT_CACHE_DIR") or None,
+        latent_cache_disk_max_bytes=int(_env("LATENT_CACHE_DISK_MAX_MB", "4096")) * 1024 * 1024,
+        result_format=_env("RESULT_FORMAT", "png").lower(),
+        result_quality=min(100, max(1, int(_env("RESULT_QUALITY", "90")))),
+        result_thumbnail_width=max(0, int(_env("RESULT_THUMBNAIL_WIDTH", "0"))),
+        result_encode_workers=max(0, int(_env("RESULT_ENCODE_WORKERS", "2"))),
+        preview_interval_steps=max(0, int(_env("PREVIEW_INTERVAL_STEPS", "0"))),
+        preview_quality=min(100, max(1, int(_env("PREVIEW_QUALITY", "70")))),
+        dedup_enabled=_env_bool("DEDUP_ENABLED", True),
+        dedup_ttl_seconds=int(_env("DEDUP_TTL_SECONDS", "86400")),
+        dedup_mode=_env("DEDUP_MODE", "copy").lower(),
+        dedup_random_seed=_env_bool("DEDUP_RANDOM_SEED", False),
+        batch_size_ladder=_env_int_list("BATCH_SIZE_LADDER", "1,4,8,16"),
+        weaver_heartbeat_ttl_seconds=int(_env("WEAVER_HEARTBEAT_TTL_SECONDS", "30")),
+        arbitrator_eval_interval_seconds=float(_env("ARBITRATOR_EVAL_INTERVAL_SECONDS", "1")),
+        arbitrator_min_dwell_seconds=float(_env("ARBITRATOR_MIN_DWELL_SECONDS", "5")),
+        arbitrator_hysteresis=float(_env("ARBITRATOR_HYSTERESIS", "0.15")),
+        worker_mode=_env("WEAVER_WORKER_MODE", "sequential").lower(),
+        devices=devices,
+        device_batch_timeout_seconds=float(_env("WEAVER_DEVICE_BATCH_TIMEOUT_SECONDS", "600")),
+        prefetch_queue_depth=max(1, int(_env("WEAVER_PREFETCH_QUEUE_DEPTH", "1"))),
+        publish_queue_depth=max(1, int(_env("WEAVER_PUBLISH_QUEUE_DEPTH", "2"))),
+        continuous_max_slots=max(1, int(_env("CONTINUOUS_MAX_SLOTS", "8"))),
+        worker_pool=_env("WEAVER_POOL", "cpu" if cpu_backend else "gpu").lower(),
+        max_batch_size=max(0, int(_env("WEAVER_MAX_BATCH_SIZE", "1" if cpu_backend else "0"))),
+        ready_file=_env("WEAVER_READY_FILE", "/tmp/weaver-ready") or None,
+        metrics_port=int(_env("METRICS_PORT", "9100")),
+        event_timings=_env_bool("EVENT_TIMINGS", False),
         log_level=_env("LOG_LEVEL", "INFO"),
     )
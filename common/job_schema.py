@@ -3,7 +3,24 @@ from __future__ import annotations
 from datetime import datetime, timezone
 from typing import Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+
+
+class InferenceProfile(BaseModel):
+    """Per-job overrides of the Weaver's WIDTH/HEIGHT, NUM_INFERENCE_STEPS, GUIDANCE_SCALE and SEED."""
+
+    width: int | None = Field(default=None, gt=0, multiple_of=8)
+    height: int | None = Field(default=None, gt=0, multiple_of=8)
+    steps: int | None = Field(default=None, ge=1)
+    guidance_scale: float | None = Field(default=None, ge=0)
+    # torch generators take a signed 64-bit seed.
+    seed: int | None = Field(default=None, ge=0, le=2**63 - 1)
+
+    @model_validator(mode="after")
+    def _width_with_height(self) -> InferenceProfile:
+        if (self.width is None) != (self.height is None):
+            raise ValueError("width and height must be given together")
+        return self
 
 
 class WeaverJob(BaseModel):
@@ -13,6 +30,10 @@ class WeaverJob(BaseModel):
     user_snap_s3: str
     uncleaned_outfit_s3: str
     created_at: datetime | None = None
+    # Priority tier under WEAVER_QUEUE_BACKEND=fair (e.g. "interactive", "bulk"); set by the gateway.
+    tier: str | None = None
+    # Inference parameters for this job only; the Weaver's settings fill in whatever is unset.
+    profile: InferenceProfile | None = None
 
 class TailorJob(BaseModel):
     id: str
@@ -38,5 +59,24 @@ class WeaverJobDoneEvent(BaseModel):
     user_id: str
     vton_id: str
     result_s3_key: str | None = None
+    # Every stored rendition of the result by name ("full", "thumbnail"); "full" == result_s3_key.
+    renditions: dict[str, str] = Field(default_factory=dict)
     error: str | None = None
     finished_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # Seconds per hot-path stage ("queue_wait", "download", ..., "upload"); only with EVENT_TIMINGS.
+    timings: dict[str, float] | None = None
+
+
+class WeaverJobProgressEvent(BaseModel):
+    job_id: str
+    job_type: Literal["try_on"] = "try_on"
+    user_id: str
+    vton_id: str
+    step: int
+    total_steps: int
+    percent: float
+    # Low-resolution JPEG preview of the current estimate, base64-encoded.
+    preview_jpeg: str
+    width: int
+    height: int
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from prometheus_client import start_http_server
+
+from .log_utils import JobContextAdapter
+
+# Histogram buckets for stage durations, from a single denoising step (ms) to queue waits (minutes).
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def start_metrics_server(port: int, logger: JobContextAdapter) -> None:
+    """Serve every registered metric at `:<port>/metrics` from a daemon thread; `port <= 0` disables it."""
+    if port <= 0:
+        return
+    start_http_server(port)
+    logger.info("Serving Prometheus metrics on :%s/metrics", port)
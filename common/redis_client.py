@@ -1,14 +1,198 @@
 from __future__ import annotations
 
 import json
+import os
+import socket
+import time
+from dataclasses import dataclass, field
 from typing import Any
 
 import redis
 
+from .config import Settings
+
+# Stream entry id attached to jobs consumed from the `stream` backend; used by `ack_jobs`.
+STREAM_ID_FIELD = "_stream_id"
+# Set (to the delivery count) on reclaimed stream jobs delivered more than `max_deliveries` times;
+# the worker fails them instead of running them again.
+STREAM_DELIVERIES_EXCEEDED_FIELD = "_deliveries_exceeded"
+_STREAM_PAYLOAD_FIELD = "payload"
+
+_WEAVER_HEARTBEATS_KEY = "stats:weaver:heartbeats"
+_WEAVER_POPPED_KEY = "stats:weaver:popped"
+_WEAVER_LATENCY_KEY_PREFIX = "stats:weaver:latency:"
+_WEAVER_POOL_KEY_PREFIX = "stats:weaver:pool:"
+# Pool of workers that never reported one.
+DEFAULT_POOL = "gpu"
+_ARBITRATOR_STATS_KEY = "stats:arbitrator"
+
+# `fair` queue backend. Under the queue name as prefix:
+# - `<queue>:<tier>:user:<user_id>`: that user's pending jobs in the tier (LPUSH in, RPOP out);
+# - `<queue>:<tier>:ring`: users of the tier with pending jobs, in round-robin order;
+# - `<queue>:<tier>:deficit`: credit left to the user at the head of the ring when a batch filled;
+# - `<queue>:weights`: optional jobs-per-turn of a user (its DRR quantum, default 1), set by operators;
+# - `<queue>:depth`: pending jobs per tier;
+# - `<queue>:credit`: fractional reserved slots each lower tier has accrued but not yet used;
+# - `<queue>:<tier>:wake`: at most one token, pushed while the tier has jobs waiting, for the
+#   consumers serving that tier to block on.
+# The gateway enqueues with the same script (src/services/jobs.ts); keep the two in sync.
+# ARGV: queue, tier, user_id, payload.
+FAIR_ENQUEUE_LUA = """
+local queue, tier, user = ARGV[1], ARGV[2], ARGV[3]
+if redis.call('LPUSH', queue .. ':' .. tier .. ':user:' .. user, ARGV[4]) == 1 then
+  redis.call('RPUSH', queue .. ':' .. tier .. ':ring', user)
+end
+redis.call('HINCRBY', queue .. ':depth', tier, 1)
+if redis.call('LLEN', queue .. ':' .. tier .. ':wake') == 0 then
+  redis.call('RPUSH', queue .. ':' .. tier .. ':wake', '1')
+end
+"""
+
+# Assembles one batch of up to `config:batch_size` jobs (capped at ARGV[2] when > 0) from the
+# tiers ARGV[4..], highest priority first. Within a tier, users are served by deficit round robin.
+# Every lower tier with pending jobs accrues batch * ARGV[3] slots of credit per pop and is
+# reserved the whole slots of it, so bulk work keeps moving under sustained interactive load
+# without taking a slot from every small batch; all remaining slots go by priority. Credit is
+# spent by whatever the tier gets and dropped when the tier empties.
+# ARGV: queue, max batch size, reserved share, tiers...
+_FAIR_POP_LUA = """
+local queue, cap, share = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+local batch = tonumber(redis.call('GET', 'config:batch_size') or '1')
+if cap > 0 and batch > cap then batch = cap end
+if batch < 1 then batch = 1 end
+local tiers, depths, reserved, credits, taken_by_tier = {}, {}, {}, {}, {}
+for i = 4, #ARGV do
+  local tier = ARGV[i]
+  local depth = tonumber(redis.call('HGET', queue .. ':depth', tier) or '0')
+  tiers[#tiers + 1] = tier
+  depths[#tiers] = depth
+  reserved[#tiers] = 0
+  credits[#tiers] = 0
+  taken_by_tier[#tiers] = 0
+  if #tiers > 1 and share > 0 and depth > 0 then
+    -- Capped at one batch so a long interactive burst cannot bank a bulk takeover.
+    credits[#tiers] = math.min(batch, tonumber(redis.call('HGET', queue .. ':credit', tier) or '0') + batch * share)
+    reserved[#tiers] = math.min(depth, math.floor(credits[#tiers] + 1e-9))
+  end
+end
+local jobs = {}
+
+local function take(i, limit)
+  local tier = tiers[i]
+  local ring = queue .. ':' .. tier .. ':ring'
+  local deficit = queue .. ':' .. tier .. ':deficit'
+  local taken = 0
+  while taken < limit do
+    local user = redis.call('LINDEX', ring, 0)
+    if not user then break end
+    local pending = queue .. ':' .. tier .. ':user:' .. user
+    local credit = tonumber(redis.call('HGET', deficit, user) or '0')
+    if credit <= 0 then
+      credit = math.max(1, tonumber(redis.call('HGET', queue .. ':weights', user) or '1'))
+    end
+    local want = math.min(credit, limit - taken)
+    local popped = redis.call('RPOP', pending, want) or {}
+    for _, payload in ipairs(popped) do jobs[#jobs + 1] = payload end
+    taken = taken + #popped
+    credit = credit - #popped
+    if redis.call('LLEN', pending) == 0 then
+      redis.call('LPOP', ring)
+      redis.call('HDEL', deficit, user)
+    elseif credit > 0 then
+      -- The batch filled mid-turn: the user keeps the head and the rest of its quantum.
+      redis.call('HSET', deficit, user, credit)
+    else
+      redis.call('HDEL', deficit, user)
+      redis.call('RPUSH', ring, redis.call('LPOP', ring))
+    end
+  end
+  if taken > 0 then redis.call('HINCRBY', queue .. ':depth', tier, -taken) end
+  taken_by_tier[i] = taken_by_tier[i] + taken
+end
+
+for i = 1, #tiers do
+  local later = 0
+  for j = i + 1, #tiers do later = later + reserved[j] end
+  if batch - #jobs - later > 0 then take(i, batch - #jobs - later) end
+end
+for i = 1, #tiers do
+  if batch - #jobs > 0 then take(i, batch - #jobs) end
+end
+for i = 2, #tiers do
+  local credit = credits[i] - taken_by_tier[i]
+  if depths[i] - taken_by_tier[i] > 0 and credit > 0 then
+    redis.call('HSET', queue .. ':credit', tiers[i], credit)
+  else
+    redis.call('HDEL', queue .. ':credit', tiers[i])
+  end
+end
+-- Only this consumer's tiers: a token for a tier it cannot serve stays with the consumers that can.
+for i = 1, #tiers do
+  local wake = queue .. ':' .. tiers[i] .. ':wake'
+  if depths[i] - taken_by_tier[i] > 0 and redis.call('LLEN', wake) == 0 then
+    redis.call('RPUSH', wake, '1')
+  end
+end
+return jobs
+"""
+
+
+@dataclass
+class WeaverFleetStats:
+    """Aggregated reports of one pool of Weavers (`WEAVER_POOL`) as seen by the Arbitrator."""
+
+    replicas: int
+    # Mean of each live worker's smoothed inference latency, keyed by batch size.
+    latency_by_batch_size: dict[int, float] = field(default_factory=dict)
+    # Monotonic count of jobs popped from the queue by all workers, in every pool.
+    popped_total: int = 0
+
 
 class RedisClient:
-    def __init__(self, redis_url: str) -> None:
-        self._redis = redis.Redis.from_url(redis_url, decode_responses=True)
+    def __init__(
+        self,
+        redis_url: str,
+        queue_backend: str = "list",
+        consumer_group: str = "weaver",
+        consumer_name: str | None = None,
+        visibility_timeout_seconds: int = 600,
+        max_deliveries: int = 3,
+        client: redis.Redis | None = None,
+        max_batch_size: int = 0,
+        queue_tiers: tuple[str, ...] = ("interactive", "bulk"),
+        tier_min_share: float = 0.1,
+    ) -> None:
+        # `client` replaces the connection built from `redis_url` (e.g. an in-process fake for benchmarks).
+        self._redis = client if client is not None else redis.Redis.from_url(redis_url, decode_responses=True)
+        self._queue_backend = queue_backend
+        self._consumer_group = consumer_group
+        self._consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self._visibility_timeout_ms = visibility_timeout_seconds * 1000
+        # Deliveries after which a reclaimed stream entry is failed rather than retried; 0 = no limit.
+        self._max_deliveries = max_deliveries
+        self._groups_ready: set[str] = set()
+        self._next_reclaim_at = 0.0
+        # Upper bound on `config:batch_size` for this consumer (`WEAVER_MAX_BATCH_SIZE`); 0 = none.
+        self._max_batch_size = max_batch_size
+        # `fair` backend: tiers in priority order, and the batch share reserved for each lower tier.
+        self._queue_tiers = queue_tiers
+        self._tier_min_share = tier_min_share
+        self._fair_enqueue = self._redis.register_script(FAIR_ENQUEUE_LUA)
+        self._fair_pop = self._redis.register_script(_FAIR_POP_LUA)
+
+    @classmethod
+    def from_settings(cls, settings: Settings, client: redis.Redis | None = None) -> RedisClient:
+        return cls(
+            settings.redis_url,
+            queue_backend=settings.queue_backend,
+            consumer_group=settings.queue_consumer_group,
+            visibility_timeout_seconds=settings.queue_visibility_timeout_seconds,
+            max_deliveries=settings.queue_max_deliveries,
+            client=client,
+            max_batch_size=settings.max_batch_size,
+            queue_tiers=settings.queue_tiers,
+            tier_min_share=settings.queue_tier_min_share,
+        )
 
     def ping(self) -> bool:
         return bool(self._redis.ping())
@@ -37,36 +221,150 @@ class RedisClient:
         Consume one or more weaver jobs.
 
         Behavior:
-        - Block up to `timeout_seconds` waiting for the first job (BRPOP).
-        - Read `config:batch_size` (default 1).
-        - If batch size > 1, opportunistically pull additional jobs via non-blocking RPOP.
+        - Block up to `timeout_seconds` waiting for the first job.
+        - Read `config:batch_size` (default 1) in the same round trip, capped at `max_batch_size`.
+        - If batch size > 1, pull the rest of the batch with a single counted pop.
+
+        With the `stream` backend jobs stay pending in the consumer group until `ack_jobs`,
+        and jobs left pending by a dead consumer are reclaimed after the visibility timeout.
+        The `fair` backend assembles the batch across tiers and users in one script (see
+        `_FAIR_POP_LUA`); like `list`, it has no acknowledgements.
         """
-        first_item = self._redis.brpop(queue_name, timeout=timeout_seconds)
+        if self._queue_backend == "stream":
+            return self._consume_job_weaver_stream(queue_name, timeout_seconds)
+        if self._queue_backend == "fair":
+            return self._consume_job_weaver_fair(queue_name, timeout_seconds)
+
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.get("config:batch_size")
+        pipe.brpop(queue_name, timeout=timeout_seconds)
+        raw_batch_size, first_item = pipe.execute()
         if first_item is None:
             return None
 
         _, first_payload = first_item
-        first_job = self._decode_job_payload(first_payload)
+        payloads = [first_payload]
+        batch_size = self._batch_size(int(raw_batch_size) if raw_batch_size is not None else 1)
+        if batch_size > 1:
+            payloads.extend(self._redis.rpop(queue_name, batch_size - 1) or [])
+
+        return [self._decode_or_malformed(payload) for payload in payloads]
+
+    def _batch_size(self, configured: int) -> int:
+        if self._max_batch_size > 0:
+            configured = min(configured, self._max_batch_size)
+        return max(1, configured)
+
+    def ack_jobs(self, queue_name: str, raw_jobs: list[dict[str, Any]]) -> None:
+        """Acknowledge jobs whose done events have been published. No-op for the `list` backend."""
+        if self._queue_backend != "stream":
+            return
+        entry_ids = [job[STREAM_ID_FIELD] for job in raw_jobs if job.get(STREAM_ID_FIELD)]
+        if not entry_ids:
+            return
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.xack(queue_name, self._consumer_group, *entry_ids)
+        pipe.xdel(queue_name, *entry_ids)
+        pipe.execute()
+
+    def _decode_or_malformed(self, payload: str) -> dict[str, Any]:
+        job = self._decode_job_payload(payload)
+        return job if job is not None else self._malformed_job_payload(payload)
+
+    def _ensure_consumer_group(self, queue_name: str) -> None:
+        if queue_name in self._groups_ready:
+            return
+        try:
+            self._redis.xgroup_create(queue_name, self._consumer_group, id="0", mkstream=True)
+        except redis.ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+        self._groups_ready.add(queue_name)
+
+    def _stream_jobs(self, entries: list[Any]) -> list[dict[str, Any]]:
         jobs: list[dict[str, Any]] = []
-        if first_job is not None:
-            jobs.append(first_job)
-        else:
-            jobs.append(self._malformed_job_payload(first_payload))
+        for entry_id, fields in entries:
+            if not fields:
+                continue
+            job = self._decode_or_malformed(fields.get(_STREAM_PAYLOAD_FIELD, ""))
+            job[STREAM_ID_FIELD] = entry_id
+            jobs.append(job)
+        return jobs
+
+    def _mark_redelivered(self, queue_name: str, jobs: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Flag reclaimed `jobs` that have now been delivered more than `max_deliveries` times, e.g.
+        because they crash or hang every worker that runs them. They are still returned, so the
+        worker publishes their failure and acknowledges them like any other job.
+        """
+        if self._max_deliveries <= 0 or not jobs:
+            return jobs
+        pipe = self._redis.pipeline(transaction=False)
+        for job in jobs:
+            entry_id = job[STREAM_ID_FIELD]
+            pipe.xpending_range(queue_name, self._consumer_group, min=entry_id, max=entry_id, count=1)
+        for job, pending in zip(jobs, pipe.execute()):
+            deliveries = pending[0]["times_delivered"] if pending else 0
+            if deliveries > self._max_deliveries:
+                job[STREAM_DELIVERIES_EXCEEDED_FIELD] = deliveries
+        return jobs
+
+    def _consume_job_weaver_stream(self, queue_name: str, timeout_seconds: int) -> list[dict[str, Any]] | None:
+        self._ensure_consumer_group(queue_name)
+        batch_size = self._batch_size(self.get_config_batch_size())
+
+        jobs: list[dict[str, Any]] = []
+        if time.monotonic() >= self._next_reclaim_at:
+            # Reclaim scans are cheap but not free; a quarter of the timeout keeps worst-case
+            # redelivery delay close to the timeout itself.
+            self._next_reclaim_at = time.monotonic() + self._visibility_timeout_ms / 4000
+            claimed = self._redis.xautoclaim(
+                queue_name,
+                self._consumer_group,
+                self._consumer_name,
+                min_idle_time=self._visibility_timeout_ms,
+                count=batch_size,
+            )
+            jobs.extend(self._mark_redelivered(queue_name, self._stream_jobs(claimed[1])))
 
-        batch_size = max(1, self.get_config_batch_size())
         remaining = batch_size - len(jobs)
-        while remaining > 0:
-            payload = self._redis.rpop(queue_name)
-            if payload is None:
-                break
-            job = self._decode_job_payload(payload)
-            if job is None:
-                jobs.append(self._malformed_job_payload(payload))
-            else:
-                jobs.append(job)
-            remaining -= 1
+        if remaining > 0:
+            response = self._redis.xreadgroup(
+                self._consumer_group,
+                self._consumer_name,
+                {queue_name: ">"},
+                count=remaining,
+                block=None if jobs else timeout_seconds * 1000,
+            )
+            for _, entries in response or []:
+                jobs.extend(self._stream_jobs(entries))
 
         return jobs if jobs else None
+
+    def _consume_job_weaver_fair(self, queue_name: str, timeout_seconds: int) -> list[dict[str, Any]] | None:
+        payloads = self._pop_fair(queue_name)
+        if not payloads:
+            wake_keys = [f"{queue_name}:{tier}:wake" for tier in self._queue_tiers]
+            if self._redis.blpop(wake_keys, timeout=timeout_seconds) is None:
+                return None
+            payloads = self._pop_fair(queue_name)
+        return [self._decode_or_malformed(payload) for payload in payloads] or None
+
+    def _pop_fair(self, queue_name: str) -> list[str]:
+        args = [queue_name, self._max_batch_size, self._tier_min_share, *self._queue_tiers]
+        return list(self._fair_pop(args=args) or [])
+
+    def enqueue_job_weaver(self, queue_name: str, job: dict[str, Any]) -> None:
+        """Enqueue a job the way the gateway does for this queue backend (used by benchmarks)."""
+        payload = json.dumps(job, default=str)
+        if self._queue_backend == "stream":
+            self._redis.xadd(queue_name, {_STREAM_PAYLOAD_FIELD: payload})
+        elif self._queue_backend == "fair":
+            tier = job.get("tier") or self._queue_tiers[0]
+            self._fair_enqueue(args=[queue_name, tier, job["user_id"], payload])
+        else:
+            self._redis.lpush(queue_name, payload)
+
     def consume_job_tailor(self, queue_name: str = "queue:tailor_jobs", timeout_seconds: int = 5) -> dict[str, Any] | None:
         # BRPOP returns tuple: (queue_name, payload)
         item = self._redis.brpop(queue_name, timeout=timeout_seconds)
@@ -79,12 +377,124 @@ class RedisClient:
         return int(self._redis.publish(channel_name, json.dumps(event, default=str)))
 
     def get_config_batch_size(self) -> int:
-        return int(self._redis.get("config:batch_size")) if self._redis.get("config:batch_size") is not None else 1
+        raw = self._redis.get("config:batch_size")
+        return int(raw) if raw is not None else 1
 
     def set_config_batch_size(self, batch_size: int) -> None:
         if batch_size < 1:
             return
         self._redis.set("config:batch_size", str(batch_size))
 
+    def get_dedup_results(self, fingerprints: list[str]) -> list[str | None]:
+        return list(self._redis.mget([f"dedup:weaver:{fp}" for fp in fingerprints]))
+
+    def set_dedup_results(self, items: list[tuple[str, str]], ttl_seconds: int) -> None:
+        pipe = self._redis.pipeline(transaction=False)
+        for fingerprint, result_key in items:
+            pipe.set(f"dedup:weaver:{fingerprint}", result_key, ex=ttl_seconds)
+        pipe.execute()
+
+    def record_weaver_popped(self, worker_id: str, jobs_popped: int, pool: str = DEFAULT_POOL) -> None:
+        pipe = self._redis.pipeline(transaction=False)
+        if jobs_popped:
+            pipe.incrby(_WEAVER_POPPED_KEY, jobs_popped)
+        self._heartbeat(pipe, worker_id, pool)
+        pipe.execute()
+
+    def record_weaver_latency(
+        self, worker_id: str, latency_by_batch_size: dict[int, float], pool: str = DEFAULT_POOL
+    ) -> None:
+        key = f"{_WEAVER_LATENCY_KEY_PREFIX}{worker_id}"
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.hset(key, mapping={str(size): f"{seconds:.6f}" for size, seconds in latency_by_batch_size.items()})
+        pipe.expire(key, 24 * 3600)
+        self._heartbeat(pipe, worker_id, pool)
+        pipe.execute()
+
+    @staticmethod
+    def _heartbeat(pipe: Any, worker_id: str, pool: str) -> None:
+        pipe.zadd(_WEAVER_HEARTBEATS_KEY, {worker_id: time.time()})
+        pipe.set(f"{_WEAVER_POOL_KEY_PREFIX}{worker_id}", pool, ex=24 * 3600)
+
+    def get_weaver_stats(self, max_age_seconds: float, pool: str = DEFAULT_POOL) -> WeaverFleetStats:
+        """Live workers of `pool` and their latencies; `popped_total` counts every pool."""
+        pools = self.get_weaver_pools(max_age_seconds, include=(pool,))
+        return pools[pool]
+
+    def get_weaver_pools(self, max_age_seconds: float, include: tuple[str, ...] = ()) -> dict[str, WeaverFleetStats]:
+        """`get_weaver_stats` for every pool with a live worker, plus the `include`d pools even when empty."""
+        now = time.time()
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zremrangebyscore(_WEAVER_HEARTBEATS_KEY, 0, now - 10 * max_age_seconds)
+        pipe.zrangebyscore(_WEAVER_HEARTBEATS_KEY, now - max_age_seconds, "+inf")
+        pipe.get(_WEAVER_POPPED_KEY)
+        _, workers, popped = pipe.execute()
+
+        pipe = self._redis.pipeline(transaction=False)
+        for worker_id in workers:
+            pipe.get(f"{_WEAVER_POOL_KEY_PREFIX}{worker_id}")
+            pipe.hgetall(f"{_WEAVER_LATENCY_KEY_PREFIX}{worker_id}")
+        replies = pipe.execute() if workers else []
+        replicas: dict[str, int] = {pool: 0 for pool in include}
+        samples: dict[str, dict[int, list[float]]] = {pool: {} for pool in include}
+        for worker_pool, latencies in zip(replies[::2], replies[1::2]):
+            worker_pool = worker_pool or DEFAULT_POOL
+            replicas[worker_pool] = replicas.get(worker_pool, 0) + 1
+            pool_samples = samples.setdefault(worker_pool, {})
+            for size, seconds in latencies.items():
+                pool_samples.setdefault(int(size), []).append(float(seconds))
+        return {
+            pool: WeaverFleetStats(
+                replicas=count,
+                latency_by_batch_size={size: sum(values) / len(values) for size, values in samples[pool].items()},
+                popped_total=int(popped or 0),
+            )
+            for pool, count in replicas.items()
+        }
+
+    def set_arbitrator_stats(self, stats: dict[str, Any]) -> None:
+        self._redis.hset(_ARBITRATOR_STATS_KEY, mapping={k: str(v) for k, v in stats.items()})
+
+    def subscribe_queue_changes(self, queue_name: str) -> Any | None:
+        """
+        Subscribe to keyspace notifications for `queue_name`.
+
+        Enables the needed `notify-keyspace-events` flags on top of the current ones. Returns
+        None when the server refuses CONFIG (common on managed Redis), so callers can poll instead.
+        """
+        event_class = {"stream": "t", "fair": "h"}.get(self._queue_backend, "l")
+        if self._queue_backend == "fair":
+            # Every enqueue and pop updates the per-tier depth counters.
+            queue_name = f"{queue_name}:depth"
+        try:
+            current = set(self._redis.config_get("notify-keyspace-events").get("notify-keyspace-events", ""))
+            if "K" not in current or (event_class not in current and "A" not in current):
+                self._redis.config_set("notify-keyspace-events", "".join(sorted(current | {"K", event_class})))
+        except redis.ResponseError:
+            return None
+        db = self._redis.connection_pool.connection_kwargs.get("db", 0)
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(f"__keyspace@{db}__:{queue_name}")
+        return pubsub
+
     def get_queue_depth(self, queue_name: str) -> int:
-        return int(self._redis.llen(queue_name)) if self._redis.llen(queue_name) is not None else 0
+        """Jobs waiting to be picked up; stream entries already delivered to a consumer are excluded."""
+        if self._queue_backend == "fair":
+            return sum(self.get_tier_queue_depths(queue_name).values())
+        if self._queue_backend != "stream":
+            return int(self._redis.llen(queue_name) or 0)
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.xlen(queue_name)
+        pipe.xpending(queue_name, self._consumer_group)
+        length, pending = pipe.execute(raise_on_error=False)
+        if isinstance(length, Exception):
+            return 0
+        in_flight = 0 if isinstance(pending, Exception) else int(pending.get("pending", 0))
+        return max(0, int(length) - in_flight)
+
+    def get_tier_queue_depths(self, queue_name: str) -> dict[str, int]:
+        """Pending jobs per tier of the `fair` backend, every configured tier included; empty otherwise."""
+        if self._queue_backend != "fair":
+            return {}
+        raw = self._redis.hgetall(f"{queue_name}:depth")
+        return {tier: max(0, int(raw.get(tier, 0))) for tier in self._queue_tiers}
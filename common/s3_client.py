@@ -1,13 +1,57 @@
 from __future__ import annotations
 
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from typing import Any, Callable, TypeVar
 
 import boto3
-from PIL import Image
+from PIL import Image, ImageFile, ImageOps
 from botocore.config import Config
 
 from .config import Settings
 
+T = TypeVar("T")
+R = TypeVar("R")
+
+_STREAM_CHUNK_BYTES = 256 * 1024
+_JPEG_SOI = b"\xff\xd8"
+_EXIF_ORIENTATION = 0x0112
+# EXIF orientations that swap width and height when applied.
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def _draft_size(image: Image.Image, target_size: tuple[int, int]) -> tuple[int, int] | None:
+    """Smallest stored-orientation size that still covers `target_size` after EXIF rotation."""
+    target_w, target_h = target_size
+    if image.getexif().get(_EXIF_ORIENTATION) in _TRANSPOSED_ORIENTATIONS:
+        target_w, target_h = target_h, target_w
+    src_w, src_h = image.size
+    scale = max(target_w / src_w, target_h / src_h)
+    if scale >= 1:
+        return None
+    return math.ceil(src_w * scale), math.ceil(src_h * scale)
+
+
+def open_image(fp: Any, target_size: tuple[int, int] | None = None) -> Image.Image:
+    """
+    Decode an uploaded image as upright RGB.
+
+    With `target_size`, JPEGs are decoded through libjpeg's DCT scaling (`Image.draft`) at the
+    smallest 1/2, 1/4 or 1/8 scale that still covers `target_size`, instead of at full resolution
+    only to be downsampled again. Covering (not fitting) the box keeps enough pixels for both
+    the crop and the pad resize used by the model.
+    """
+    image = Image.open(fp)
+    if target_size is not None and image.format == "JPEG":
+        draft_size = _draft_size(image, target_size)
+        if draft_size is not None:
+            image.draft("RGB", draft_size)
+    image.load()
+    ImageOps.exif_transpose(image, in_place=True)
+    return image if image.mode == "RGB" else image.convert("RGB")
+
 
 def _use_minio(settings: Settings) -> bool:
     """Use MinIO only when ENV is development and we have a non-localhost endpoint or are in dev."""
@@ -39,15 +83,62 @@ class S3ImageStore:
             client_kwargs["aws_access_key_id"] = settings.s3_access_key_id
             client_kwargs["aws_secret_access_key"] = settings.s3_secret_access_key
 
-        s3_config = Config(s3={**config})
+        # One pooled connection per I/O thread so bulk calls never queue on the HTTP pool.
+        s3_config = Config(
+            s3={**config},
+            max_pool_connections=settings.s3_max_concurrency,
+            retries={"max_attempts": settings.s3_max_attempts, "mode": settings.s3_retry_mode},
+            connect_timeout=settings.s3_connect_timeout,
+            read_timeout=settings.s3_read_timeout,
+        )
         self._bucket = settings.s3_bucket
         self._client = session.client("s3", config=s3_config, **client_kwargs)
+        self._stream_threshold_bytes = settings.s3_stream_threshold_bytes
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.s3_max_concurrency,
+            thread_name_prefix="s3-io",
+        )
+
+    def download_image(
+        self,
+        key: str,
+        target_size: tuple[int, int] | None = None,
+        timings: dict[str, float] | None = None,
+    ) -> Image.Image:
+        """
+        Download and decode `key` as upright RGB; see `open_image` for `target_size`.
 
-    def download_image(self, key: str) -> Image.Image:
+        With `timings`, the seconds spent decoding and the rest (request and transfer) are
+        stored under "decode" and "download".
+        """
+        started = time.perf_counter()
         obj = self._client.get_object(Bucket=self._bucket, Key=key)
-        data = obj["Body"].read()
-        image = Image.open(BytesIO(data))
-        return image.convert("RGBA")
+        image, decode_seconds = self._decode_body(obj["Body"], obj.get("ContentLength"), target_size)
+        if timings is not None:
+            timings["decode"] = decode_seconds
+            timings["download"] = time.perf_counter() - started - decode_seconds
+        return image
+
+    def download_images(
+        self,
+        keys: list[str],
+        target_size: tuple[int, int] | list[tuple[int, int]] | None = None,
+        timings: list[dict[str, float]] | None = None,
+    ) -> list[Image.Image | Exception]:
+        """
+        Download and decode `keys` concurrently on the shared I/O pool.
+
+        Results keep the order of `keys`; a failed object yields its exception in place
+        so callers can fail individual jobs instead of the whole batch. A `timings` list is
+        filled with one `download_image` timing dict per key. `target_size` is one size for
+        every key or a list with one per key.
+        """
+        slots: list[dict[str, float] | None] = [None] * len(keys)
+        if timings is not None:
+            timings[:] = [{} for _ in keys]
+            slots = list(timings)
+        sizes = target_size if isinstance(target_size, list) else [target_size] * len(keys)
+        return self._map(lambda item: self.download_image(*item), list(zip(keys, sizes, slots)))
 
     def upload_png(self, key: str, image: Image.Image) -> str:
         buffer = BytesIO()
@@ -57,7 +148,101 @@ class S3ImageStore:
         self._client.put_object(
             Bucket=self._bucket,
             Key=key,
-            Body=buffer.getvalue(),
+            Body=buffer,
             ContentType="image/png",
         )
         return key
+
+    def upload_images(self, items: list[tuple[str, Image.Image]]) -> list[str | Exception]:
+        """PNG-encode and upload `(key, image)` pairs concurrently; same result contract as `download_images`."""
+        return self._map(lambda item: self.upload_png(*item), items)
+
+    def upload_bytes(self, key: str, data: bytes, content_type: str) -> str:
+        self._client.put_object(Bucket=self._bucket, Key=key, Body=data, ContentType=content_type)
+        return key
+
+    def upload_objects(
+        self, items: list[tuple[str, bytes, str]], timings: list[float] | None = None
+    ) -> list[str | Exception]:
+        """
+        Upload already-encoded `(key, data, content_type)` objects concurrently.
+
+        A `timings` list is filled with the seconds each upload took, in the order of `items`.
+        """
+        if timings is not None:
+            timings[:] = [0.0] * len(items)
+
+        def upload(index: int) -> str:
+            started = time.perf_counter()
+            key = self.upload_bytes(*items[index])
+            if timings is not None:
+                timings[index] = time.perf_counter() - started
+            return key
+
+        return self._map(upload, list(range(len(items))))
+
+    def head_etag(self, key: str) -> str:
+        return str(self._client.head_object(Bucket=self._bucket, Key=key)["ETag"]).strip('"')
+
+    def head_etags(self, keys: list[str]) -> list[str | Exception]:
+        return self._map(self.head_etag, keys)
+
+    def copy_object(self, source_key: str, key: str) -> str:
+        self._client.copy_object(
+            Bucket=self._bucket,
+            Key=key,
+            CopySource={"Bucket": self._bucket, "Key": source_key},
+        )
+        return key
+
+    def copy_objects(self, items: list[tuple[str, str]]) -> list[str | Exception]:
+        """Server-side copy `(source_key, key)` pairs concurrently."""
+        return self._map(lambda item: self.copy_object(*item), items)
+
+    def _decode_body(
+        self, body: Any, content_length: int | None, target_size: tuple[int, int] | None
+    ) -> tuple[Image.Image, float]:
+        """Decode a `get_object` body; returns the image and the seconds spent decoding (not reading)."""
+        if content_length is not None and content_length < self._stream_threshold_bytes:
+            data = body.read()
+            started = time.perf_counter()
+            return open_image(BytesIO(data), target_size), time.perf_counter() - started
+
+        try:
+            chunks = body.iter_chunks(chunk_size=_STREAM_CHUNK_BYTES)
+            first = next(chunks, b"")
+            if target_size is not None and first.startswith(_JPEG_SOI):
+                # A reduced-size JPEG decode has to be set up before any data is decoded,
+                # so buffer the object; the cheaper decode more than pays for the wait.
+                data = bytearray(first)
+                for chunk in chunks:
+                    data.extend(chunk)
+                started = time.perf_counter()
+                return open_image(BytesIO(data), target_size), time.perf_counter() - started
+
+            # Feed the decoder as chunks arrive instead of buffering the whole object first.
+            parser = ImageFile.Parser()
+            started = time.perf_counter()
+            parser.feed(first)
+            decode_seconds = time.perf_counter() - started
+            for chunk in chunks:
+                started = time.perf_counter()
+                parser.feed(chunk)
+                decode_seconds += time.perf_counter() - started
+        finally:
+            body.close()
+        started = time.perf_counter()
+        image = parser.close()
+        ImageOps.exif_transpose(image, in_place=True)
+        image = image if image.mode == "RGB" else image.convert("RGB")
+        return image, decode_seconds + time.perf_counter() - started
+
+    def _map(self, fn: Callable[[T], R], items: list[T]) -> list[R | Exception]:
+        futures = [self._executor.submit(fn, item) for item in items]
+        results: list[R | Exception] = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as exc:  # noqa: BLE001
+                results.append(exc)
+        return results
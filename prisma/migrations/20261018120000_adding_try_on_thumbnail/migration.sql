@@ -0,0 +1,2 @@
+-- AlterTable
+ALTER TABLE "VTON" ADD COLUMN     "outfit_try_on_thumb" TEXT;
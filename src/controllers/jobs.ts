@@ -1,11 +1,16 @@
 import jobService from "../services/jobs";
 import { Request, Response } from "express";
 
-const createWeaverJob = async (req: Request & {userId: string}, res: Response) => {
+// `tier` comes from the route, never from the request body, so callers cannot jump the queue.
+const createWeaverJob = async (req: Request & {userId: string}, res: Response, tier: string) => {
     try {
-        const { vton_id, user_snap_s3, uncleaned_outfit_s3 } = req.body;
+        const { vton_id, user_snap_s3, uncleaned_outfit_s3, profile } = req.body;
+        if (profile !== undefined && !jobService.isWeaverProfile(profile)) {
+            res.status(400).json({ error: "Invalid inference profile" });
+            return;
+        }
         const userId = req.userId;
-        const jobId = await jobService.queueWeaverJobs({ userId, vton_id, user_snap_s3, uncleaned_outfit_s3 });
+        const jobId = await jobService.queueWeaverJobs({ userId, vton_id, user_snap_s3, uncleaned_outfit_s3, tier, profile });
         res.status(200).json({ jobId });
 
     } catch (error) {
@@ -2,11 +2,17 @@ import jobController from "../controllers/jobs";
 import authenticationMiddleware from "../middleware/auth";
 import { Router } from "express";
 import { Request, Response } from "express";
+import { WEAVER_QUEUE_TIERS } from "../utils/env";
 
 const router = Router();
 
+// Interactive try-ons go to the highest-priority tier, batch submissions to the lowest.
 router.post("/weaver", authenticationMiddleware, async (req, res) => {
-    await jobController.createWeaverJob(req as Request & { userId: string }, res);
+    await jobController.createWeaverJob(req as Request & { userId: string }, res, WEAVER_QUEUE_TIERS[0]);
+});
+router.post("/weaver/bulk", authenticationMiddleware, async (req, res) => {
+    const tier = WEAVER_QUEUE_TIERS[WEAVER_QUEUE_TIERS.length - 1];
+    await jobController.createWeaverJob(req as Request & { userId: string }, res, tier);
 });
 router.post("/tailor", authenticationMiddleware, async (req, res) => {
     await jobController.createTailorJob(req as Request & { userId: string }, res);
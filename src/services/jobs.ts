@@ -1,6 +1,44 @@
 import { redis } from "../config/redis";
+import { REDIS_WEAVER_QUEUE, WEAVER_QUEUE_BACKEND } from "../utils/env";
 import { v4 as uuidv4 } from "uuid";
 
+// Same script as FAIR_ENQUEUE_LUA in common/redis_client.py; keep the two in sync.
+// ARGV: queue, tier, user_id, payload.
+const FAIR_ENQUEUE_LUA = `
+local queue, tier, user = ARGV[1], ARGV[2], ARGV[3]
+if redis.call('LPUSH', queue .. ':' .. tier .. ':user:' .. user, ARGV[4]) == 1 then
+  redis.call('RPUSH', queue .. ':' .. tier .. ':ring', user)
+end
+redis.call('HINCRBY', queue .. ':depth', tier, 1)
+if redis.call('LLEN', queue .. ':' .. tier .. ':wake') == 0 then
+  redis.call('RPUSH', queue .. ':' .. tier .. ':wake', '1')
+end
+`;
+
+// Per-job overrides of the Weaver's inference settings (WeaverJob.profile); every field is optional.
+// Sizes and step limits are the Weaver's to enforce (PROFILE_SIZES, PROFILE_MAX_STEPS).
+type WeaverProfile = {
+    width?: number;
+    height?: number;
+    steps?: number;
+    guidance_scale?: number;
+    seed?: number;
+};
+
+const PROFILE_FIELDS = ["width", "height", "steps", "guidance_scale", "seed"];
+// Seeds must fit torch's signed 64-bit generator seed (WeaverJob.profile.seed); JSON numbers above
+// 2^53 are not exact, so the gateway only accepts safe integers.
+const isProfileValue = (field: string, value: unknown) =>
+    typeof value === "number" &&
+    Number.isFinite(value) &&
+    (field !== "seed" || (Number.isSafeInteger(value) && value >= 0));
+
+const isWeaverProfile = (profile: unknown): profile is WeaverProfile =>
+    typeof profile === "object" &&
+    profile !== null &&
+    !Array.isArray(profile) &&
+    Object.entries(profile).every(([field, value]) => PROFILE_FIELDS.includes(field) && isProfileValue(field, value));
+
 const queueTailorJobs = async (job: {
     userId: string;
     vton_id: string;
@@ -28,6 +66,8 @@ const queueWeaverJobs = async (job: {
     vton_id: string;
     user_snap_s3: string;
     uncleaned_outfit_s3: string;
+    tier: string;
+    profile?: WeaverProfile;
 }) => {
     try {
         const jobId = uuidv4();
@@ -38,8 +78,16 @@ const queueWeaverJobs = async (job: {
             user_snap_s3: job.user_snap_s3,
             uncleaned_outfit_s3: job.uncleaned_outfit_s3,
             created_at: new Date().toISOString(),
+            tier: job.tier,
+            ...(job.profile !== undefined && { profile: job.profile }),
         };
-        await redis.lpush("queue:weaver_jobs", JSON.stringify(jobData));
+        if (WEAVER_QUEUE_BACKEND === "stream") {
+            await redis.xadd(REDIS_WEAVER_QUEUE, "*", "payload", JSON.stringify(jobData));
+        } else if (WEAVER_QUEUE_BACKEND === "fair") {
+            await redis.eval(FAIR_ENQUEUE_LUA, 0, REDIS_WEAVER_QUEUE, job.tier, job.userId, JSON.stringify(jobData));
+        } else {
+            await redis.lpush(REDIS_WEAVER_QUEUE, JSON.stringify(jobData));
+        }
         return jobId;
     } catch (error) {
         console.error(error);
@@ -50,6 +98,7 @@ const queueWeaverJobs = async (job: {
 const jobService = {
     queueTailorJobs,
     queueWeaverJobs,
+    isWeaverProfile,
 }
 
 export default jobService;
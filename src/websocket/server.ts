@@ -14,8 +14,28 @@ interface JobDoneEvent {
   user_id: string;
   vton_id: string;
   result_s3_key: string | null;
+  // Try-on only: every stored rendition of the result ("full", and "thumbnail" when enabled).
+  renditions?: Record<string, string>;
   error: string | null;
   finished_at: string;
+  // Try-on only, with EVENT_TIMINGS on the Weaver: seconds per hot-path stage.
+  timings?: Record<string, number> | null;
+}
+
+// Published by the Weaver every PREVIEW_INTERVAL_STEPS denoising steps while a try-on runs.
+interface JobProgressEvent {
+  job_id: string;
+  job_type: "try_on";
+  user_id: string;
+  vton_id: string;
+  step: number;
+  total_steps: number;
+  percent: number;
+  // Base64 JPEG at latent resolution (1/8 of the output size).
+  preview_jpeg: string;
+  width: number;
+  height: number;
+  created_at: string;
 }
 
 function getTokenFromRequest(req: { url?: string; headers: Record<string, string | string[] | undefined> }): string | null {
@@ -42,15 +62,28 @@ export async function initWebSocket(server: HttpServer): Promise<void> {
   // Storing user id's and their corresponding websockets for communication
   const usersToSockets = new Map<string, WebSocket>();
 
-  // Listening on the events:job_done channel
+  // Listening on the events:job_done channel, and events:job_progress for Weaver previews
   try {
-    await subscriber.subscribe("events:job_done");
+    await subscriber.subscribe("events:job_done", "events:job_progress");
   } catch (error) {
-    console.error("Failed to subscribe to events:job_done channel:", error);
+    console.error("Failed to subscribe to job event channels:", error);
     process.exit(1);
   }
 
   subscriber.on("message", async (channel, message) => {
+    if (channel === "events:job_progress") {
+      let progress: JobProgressEvent;
+      try {
+        progress = JSON.parse(message) as JobProgressEvent;
+      } catch (error) {
+        console.error("Failed to parse events:job_progress payload:", error);
+        return;
+      }
+      const progressSocket = usersToSockets.get(progress.user_id);
+      if (!progressSocket || progressSocket.readyState !== WebSocket.OPEN) return;
+      progressSocket.send(JSON.stringify({ type: "progress", ...progress }));
+      return;
+    }
     if (channel !== "events:job_done") return;
 
     let payload: JobDoneEvent;
@@ -61,12 +94,15 @@ export async function initWebSocket(server: HttpServer): Promise<void> {
       return;
     }
 
-    const { user_id, vton_id, job_type, status, result_s3_key } = payload;
+    const { user_id, vton_id, job_type, status, result_s3_key, renditions } = payload;
 
     if (status === "done" && result_s3_key) {
       try {
         if (job_type === "try_on") {
-          await vtonService.updateVTON(user_id, vton_id, { outfit_try_on: result_s3_key });
+          await vtonService.updateVTON(user_id, vton_id, {
+            outfit_try_on: result_s3_key,
+            outfit_try_on_thumb: renditions?.thumbnail ?? null,
+          });
         }
         if (job_type === "tailor") {
           await vtonService.updateVTON(user_id, vton_id, { cleaned_outfit: result_s3_key });
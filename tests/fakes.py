@@ -0,0 +1,85 @@
+"""Stand-ins shared by the worker tests: an in-memory S3 store and a fakeredis-backed queue."""
+
+from __future__ import annotations
+
+import dataclasses
+import threading
+import time
+from typing import Any, Callable
+
+import fakeredis
+from PIL import Image
+
+from common.config import Settings, load_settings
+from common.redis_client import RedisClient
+
+
+class FakeStore:
+    """S3 stand-in whose downloads or uploads raise instead of returning per-object errors."""
+
+    def __init__(self, fail_downloads: bool = False, fail_uploads: bool = False) -> None:
+        self._fail_downloads = fail_downloads
+        self._fail_uploads = fail_uploads
+        self.uploaded: list[str] = []
+        self.copied: list[tuple[str, str]] = []
+
+    def download_images(
+        self, keys: list[str], target_size: Any = None, timings: list[dict[str, float]] | None = None
+    ) -> list[Image.Image]:
+        if self._fail_downloads:
+            raise ConnectionError("s3 unreachable")
+        if timings is not None:
+            timings.extend({} for _ in keys)
+        return [Image.new("RGB", (64, 80)) for _ in keys]
+
+    def upload_objects(self, items: list[tuple[str, bytes, str]], timings: list[float] | None = None) -> list[str]:
+        if self._fail_uploads:
+            raise ConnectionError("s3 unreachable")
+        self.uploaded.extend(key for key, _, _ in items)
+        if timings is not None:
+            timings.extend(0.0 for _ in items)
+        return [key for key, _, _ in items]
+
+    def head_etags(self, keys: list[str]) -> list[str]:
+        return [f"etag-{key}" for key in keys]
+
+    def copy_objects(self, items: list[tuple[str, str]]) -> list[str]:
+        self.copied.extend(items)
+        return [key for _, key in items]
+
+
+def stub_settings(**overrides: Any) -> Settings:
+    defaults: dict[str, Any] = {"inference_backend": "stub", "dedup_enabled": False, "result_encode_workers": 0}
+    return dataclasses.replace(load_settings(), **{**defaults, **overrides})
+
+
+def queue_client(
+    settings: Settings, server: fakeredis.FakeRedis | None = None
+) -> tuple[RedisClient, list[dict[str, Any]]]:
+    """A RedisClient on `server` (default: a fresh fakeredis), and the list its published done events land in."""
+    server = server if server is not None else fakeredis.FakeRedis(decode_responses=True)
+    client = RedisClient.from_settings(settings, client=server)
+    events: list[dict[str, Any]] = []
+    client.publish_event = lambda channel, event: events.append(event) or 1  # type: ignore[method-assign]
+    return client, events
+
+
+def enqueue_jobs(client: RedisClient, settings: Settings, count: int, user_id: str = "u") -> list[str]:
+    ids = [f"job-{i}" for i in range(count)]
+    for job_id in ids:
+        client.enqueue_job_weaver(
+            settings.redis_queue,
+            {"id": job_id, "user_id": user_id, "vton_id": "v", "user_snap_s3": "p", "uncleaned_outfit_s3": "o"},
+        )
+    return ids
+
+
+def run_until(worker: Any, done: Callable[[], bool], timeout: float = 10.0) -> None:
+    """Run `worker` on a thread until `done()` holds (or `timeout`), then stop it."""
+    thread = threading.Thread(target=worker.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + timeout
+    while not done() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    worker.stop()
+    thread.join(timeout=10)
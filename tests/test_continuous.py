@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import threading
+from typing import Any
+
+import numpy as np
+import pytest
+
+pytest.importorskip("fakeredis")
+
+from fakes import FakeStore, enqueue_jobs, queue_client, run_until, stub_settings  # noqa: E402
+from tiny_pipeline import random_images, tiny_catvton_model  # noqa: E402
+
+from common.log_utils import get_logger  # noqa: E402
+from weaver_service.catvton import CatVTONModel  # noqa: E402
+from weaver_service.continuous import ContinuousWorker  # noqa: E402
+from weaver_service.profiles import InferenceParams  # noqa: E402
+
+
+def test_failed_submit_fails_only_that_job() -> None:
+    settings = stub_settings(continuous_max_slots=1)
+    client, events = queue_client(settings)
+    client.set_config_batch_size(3)
+    enqueue_jobs(client, settings, 3)
+    model = CatVTONModel(settings)
+    submit = model.submit
+    calls = 0
+
+    def flaky_submit(*args: Any, **kwargs: Any) -> Any:
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise ValueError("bad size")
+        return submit(*args, **kwargs)
+
+    model.submit = flaky_submit  # type: ignore[method-assign]
+    worker = ContinuousWorker(
+        settings=settings,
+        redis_client=client,
+        store=FakeStore(),  # type: ignore[arg-type]
+        model=model,
+        logger=get_logger("weaver.test"),
+    )
+    run_until(worker, lambda: len(events) >= 3)
+
+    statuses = {event["job_id"]: (event["status"], event.get("error") or "") for event in events}
+    assert len(statuses) == 3
+    failed = [status for status in statuses.values() if status[0] == "failed"]
+    assert len(failed) == 1 and failed[0][1].startswith("batch_inference_failed: bad size")
+    # The failed submit gave its in-flight slot back (2 x 1 slots, 3 jobs).
+    assert worker._in_flight.acquire(blocking=False)
+
+
+def _engine_model(max_slots: int) -> CatVTONModel:
+    pytest.importorskip("diffusers")
+    model = tiny_catvton_model(continuous_max_slots=max_slots)
+    model.start_engine()
+    return model
+
+
+def _params(steps: int, seed: int) -> InferenceParams:
+    return InferenceParams(width=12, height=16, steps=steps, guidance_scale=2.0, seed=seed)
+
+
+def test_engine_admits_mid_run_and_retires_each_job_on_its_own_schedule() -> None:
+    model = _engine_model(max_slots=2)
+    engine = model._engine
+    images = random_images(6)
+    step = engine._step
+    in_flight: list[int] = []
+    long_job_running = threading.Event()
+    release_long_job = threading.Event()
+
+    def counting_step() -> None:
+        in_flight.append(len(engine._slots))
+        long_job_running.set()
+        release_long_job.wait(timeout=10)
+        step()
+
+    engine._step = counting_step  # type: ignore[method-assign]
+    finished: list[str] = []
+    try:
+        long_job = model.submit(images[0], images[1], params=_params(steps=20, seed=1))
+        long_job.add_done_callback(lambda _: finished.append("long"))
+        assert long_job_running.wait(timeout=10)
+        # Arrive while the long job is mid-schedule.
+        for seed in (2, 3):
+            short_job = model.submit(images[2], images[3], params=_params(steps=2, seed=seed))
+            short_job.add_done_callback(lambda _: finished.append("short"))
+        release_long_job.set()
+        long_job.result(timeout=30)
+    finally:
+        engine.stop()
+
+    assert finished == ["short", "short", "long"]
+
+    # Never more jobs in flight than slots, and the short jobs shared the long job's steps.
+    assert max(in_flight) == 2
+    assert in_flight.count(2) >= 2
+
+
+def test_engine_result_does_not_depend_on_the_jobs_sharing_its_steps() -> None:
+    images = random_images(6)
+    results = []
+    for companions in (0, 2):
+        model = _engine_model(max_slots=3)
+        try:
+            future = model.submit(images[0], images[1], params=_params(steps=4, seed=7))
+            others = [
+                model.submit(images[2 + i], images[3 + i], params=_params(steps=3, seed=i)) for i in range(companions)
+            ]
+            results.append(np.asarray(future.result(timeout=30)))
+            for other in others:
+                other.result(timeout=30)
+        finally:
+            model._engine.stop()
+    assert np.array_equal(results[0], results[1])
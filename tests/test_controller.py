@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import math
+
+import pytest
+
+from arbitrator.controller import BatchSizeController, fit_service_time
+from common.redis_client import WeaverFleetStats
+
+# Batches of two take 1.5x as long as one: worth it only with a backlog.
+FLEET = WeaverFleetStats(replicas=1, latency_by_batch_size={1: 1.0, 2: 1.5})
+
+
+def _decide(controller: BatchSizeController, now: float, queue_depth: int) -> tuple[int, str]:
+    decision = controller.decide(now, queue_depth, FLEET)
+    return decision.batch_size, decision.reason
+
+
+def test_fit_service_time_recovers_a_linear_latency() -> None:
+    assert fit_service_time({4: 3.0}) is None
+    fixed, per_job = fit_service_time({1: 1.5, 2: 2.0, 8: 5.0})
+    assert fixed == pytest.approx(1.0) and per_job == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize(("queue_depth", "batch_size"), [(0, 1), (11, 4), (60, 8), (500, 16)])
+def test_depth_thresholds_until_two_sizes_are_measured(queue_depth: int, batch_size: int) -> None:
+    controller = BatchSizeController(ladder=(1, 2, 4, 8, 16))
+    fleet = WeaverFleetStats(replicas=2, latency_by_batch_size={4: 2.0})
+    decision = controller.decide(0.0, queue_depth, fleet)
+    assert (decision.batch_size, decision.reason) == (batch_size, "fallback_thresholds")
+
+
+def test_switches_only_after_the_dwell_and_by_more_than_the_hysteresis() -> None:
+    controller = BatchSizeController(ladder=(1, 2), hysteresis=0.15, min_dwell_seconds=5.0)
+    assert _decide(controller, 0.0, 0) == (1, "initial")
+    # Batches of two would be 21% cheaper, but 1 was only just chosen.
+    assert _decide(controller, 1.0, 20) == (1, "hold_dwell")
+    # 10% cheaper is within the hysteresis band.
+    assert _decide(controller, 10.0, 4) == (1, "hold_hysteresis")
+    assert _decide(controller, 11.0, 20) == (2, "cheaper")
+    assert _decide(controller, 12.0, 0) == (2, "hold_dwell")
+    assert _decide(controller, 20.0, 0) == (1, "cheaper")
+
+
+def test_leaves_a_size_that_cannot_keep_up_at_once() -> None:
+    controller = BatchSizeController(ladder=(1, 2), min_dwell_seconds=60.0, rate_smoothing=1.0)
+    assert _decide(controller, 0.0, 0) == (1, "initial")
+    # 1.2 jobs/s: batches of one serve 1/s, batches of two 1.33/s.
+    controller.observe(0.0, 0, 0)
+    controller.observe(10.0, 0, 12)
+    assert controller.arrival_rate == pytest.approx(1.2)
+    decision = controller.decide(1.0, 0, FLEET)
+    assert (decision.batch_size, decision.reason) == (2, "current_unstable")
+    assert math.isinf(decision.expected_cost[1])
+
+    controller.observe(20.0, 30, 32)
+    assert _decide(controller, 2.0, 30) == (2, "overloaded_max_throughput")
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from fakes import FakeStore, queue_client, stub_settings  # noqa: E402
+
+from common.config import Settings  # noqa: E402
+from common.job_schema import WeaverJob, WeaverJobDoneEvent  # noqa: E402
+from common.log_utils import get_logger  # noqa: E402
+from weaver_service.catvton import CatVTONModel  # noqa: E402
+from weaver_service.dedup import ResultDeduplicator  # noqa: E402
+from weaver_service.pipeline import run_jobs  # noqa: E402
+from weaver_service.profiles import resolve_params  # noqa: E402
+
+
+def _job(job_id: str, user_id: str = "u", person: str = "p", **profile: Any) -> dict[str, Any]:
+    job = {"id": job_id, "user_id": user_id, "vton_id": "v", "user_snap_s3": person, "uncleaned_outfit_s3": "o"}
+    if profile:
+        job["profile"] = profile
+    return job
+
+
+def _dedup(settings: Settings, store: FakeStore | None = None) -> ResultDeduplicator:
+    client, _ = queue_client(settings)
+    return ResultDeduplicator(settings, client, store or FakeStore())  # type: ignore[arg-type]
+
+
+def _fingerprints(settings: Settings, raw_jobs: list[dict[str, Any]]) -> list[str | None]:
+    jobs = [WeaverJob.model_validate(raw_job) for raw_job in raw_jobs]
+    return _dedup(settings).fingerprint(jobs, [resolve_params(settings, job) for job in jobs])
+
+
+def test_fingerprint_covers_inputs_and_parameters() -> None:
+    settings = stub_settings(dedup_enabled=True, seed=7, profile_sizes=((768, 1024), (384, 512)))
+    same, again, other_person, other_size, other_seed = _fingerprints(
+        settings,
+        [_job("a"), _job("b"), _job("c", person="p2"), _job("d", width=384, height=512), _job("e", seed=8)],
+    )
+    assert same is not None and same == again
+    assert len({same, other_person, other_size, other_seed}) == 4
+
+
+def test_reuse_mode_scopes_fingerprints_per_user() -> None:
+    for mode, shared in (("copy", True), ("reuse", False)):
+        settings = stub_settings(dedup_enabled=True, seed=7, dedup_mode=mode)
+        first, second = _fingerprints(settings, [_job("a", user_id="u1"), _job("b", user_id="u2")])
+        assert (first == second) is shared
+
+
+@pytest.mark.parametrize("opt_in", [False, True])
+def test_random_seed_is_decided_per_job(opt_in: bool) -> None:
+    settings = stub_settings(dedup_enabled=True, seed=-1, dedup_random_seed=opt_in)
+    unseeded, seeded = _fingerprints(settings, [_job("a"), _job("b", seed=3)])
+    assert (unseeded is not None) is opt_in
+    assert seeded is not None
+
+
+def _run(
+    settings: Settings, store: FakeStore, dedup: ResultDeduplicator, raw_jobs: list[dict[str, Any]]
+) -> list[WeaverJobDoneEvent]:
+    model = CatVTONModel(settings)
+    model.load()
+    return run_jobs(
+        settings=settings,
+        store=store,  # type: ignore[arg-type]
+        model=model,
+        raw_jobs=raw_jobs,
+        logger=get_logger("weaver.test"),
+        dedup=dedup,
+    )
+
+
+@pytest.mark.parametrize("mode", ["copy", "reuse"])
+def test_repeat_job_is_served_from_the_earlier_result(mode: str) -> None:
+    settings = stub_settings(dedup_enabled=True, seed=7, dedup_mode=mode)
+    store = FakeStore()
+    dedup = _dedup(settings, store)
+    (first,) = _run(settings, store, dedup, [_job("a")])
+    uploads = len(store.uploaded)
+
+    (repeat,) = _run(settings, store, dedup, [_job("b")])
+
+    assert first.status == repeat.status == "done"
+    assert len(store.uploaded) == uploads
+    if mode == "copy":
+        assert repeat.result_s3_key != first.result_s3_key
+        assert (first.result_s3_key, repeat.result_s3_key) in store.copied
+    else:
+        assert repeat.result_s3_key == first.result_s3_key
+        assert not store.copied
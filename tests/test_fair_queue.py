@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # fakeredis needs it to run the queue's Lua scripts
+
+from common.redis_client import RedisClient  # noqa: E402
+
+QUEUE = "queue:weaver_jobs"
+
+
+def _client() -> RedisClient:
+    return RedisClient("redis://unused", queue_backend="fair", client=fakeredis.FakeRedis(decode_responses=True))
+
+
+def _drain(client: RedisClient) -> list[list[str]]:
+    pops = []
+    while jobs := client.consume_job_weaver(QUEUE, timeout_seconds=1):
+        pops.append([job["id"] for job in jobs])
+    return pops
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 4])
+def test_interactive_jobs_go_first_under_bulk_backlog(batch_size: int) -> None:
+    client = _client()
+    for i in range(50):
+        client.enqueue_job_weaver(QUEUE, {"id": f"bulk-{i}", "user_id": "bulk", "tier": "bulk"})
+    for i in range(3):
+        client.enqueue_job_weaver(QUEUE, {"id": f"interactive-{i}", "user_id": f"user-{i}", "tier": "interactive"})
+    client.set_config_batch_size(batch_size)
+
+    pops = _drain(client)
+    order = [job_id for pop in pops for job_id in pop]
+
+    assert len(order) == 53
+    last_interactive = max(i for i, job_id in enumerate(order) if job_id.startswith("interactive"))
+    assert last_interactive == 2
+
+
+def test_bulk_keeps_its_share_under_sustained_interactive_load() -> None:
+    client = _client()
+    for i in range(10):
+        client.enqueue_job_weaver(QUEUE, {"id": f"bulk-{i}", "user_id": "bulk", "tier": "bulk"})
+    client.set_config_batch_size(1)
+
+    popped = []
+    for i in range(40):
+        client.enqueue_job_weaver(QUEUE, {"id": f"interactive-{i}", "user_id": "user", "tier": "interactive"})
+        popped.extend(job["id"] for job in client.consume_job_weaver(QUEUE, timeout_seconds=1))
+
+    # WEAVER_QUEUE_TIER_MIN_SHARE=0.1: one bulk job every tenth pop.
+    assert sum(job_id.startswith("bulk") for job_id in popped) == 4
+
+
+def test_bulk_only_worker_leaves_interactive_jobs_to_the_others() -> None:
+    redis_server = fakeredis.FakeRedis(decode_responses=True)
+    gpu = RedisClient("redis://unused", queue_backend="fair", client=redis_server)
+    cpu = RedisClient("redis://unused", queue_backend="fair", queue_tiers=("bulk",), client=redis_server)
+    gpu.set_config_batch_size(4)
+    for i in range(2):
+        gpu.enqueue_job_weaver(QUEUE, {"id": f"interactive-{i}", "user_id": "user", "tier": "interactive"})
+
+    assert cpu.consume_job_weaver(QUEUE, timeout_seconds=1) is None
+    # The interactive wake-up is still there for a worker that serves the tier.
+    assert redis_server.llen(f"{QUEUE}:interactive:wake") == 1
+    assert [job["id"] for job in gpu.consume_job_weaver(QUEUE, timeout_seconds=1)] == ["interactive-0", "interactive-1"]
+
+    gpu.enqueue_job_weaver(QUEUE, {"id": "bulk-0", "user_id": "bulk", "tier": "bulk"})
+    assert [job["id"] for job in cpu.consume_job_weaver(QUEUE, timeout_seconds=1)] == ["bulk-0"]
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("safetensors")
+
+from prometheus_client import REGISTRY  # noqa: E402
+
+from weaver_service.latent_cache import LatentCache  # noqa: E402
+from weaver_service.metrics import observe_latent_cache  # noqa: E402
+
+ENTRY_BYTES = 1024
+
+
+def _entry() -> object:
+    return torch.zeros(ENTRY_BYTES // 4)
+
+
+def _sample(name: str, tier: str | None = None) -> float:
+    return REGISTRY.get_sample_value(name, {"tier": tier} if tier else {}) or 0.0
+
+
+def test_memory_tier_evicts_least_recently_used() -> None:
+    cache = LatentCache(max_bytes=2 * ENTRY_BYTES)
+    evictions = _sample("weaver_latent_cache_evictions_total", "memory")
+    cache.put("a", _entry())
+    cache.put("b", _entry())
+    assert cache.get("a") is not None
+    cache.put("c", _entry())
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["memory_evictions"] == 1
+    assert _sample("weaver_latent_cache_evictions_total", "memory") == evictions + 1
+    assert _sample("weaver_latent_cache_bytes", "memory") == 2 * ENTRY_BYTES
+
+
+def test_disk_tier_serves_memory_misses_and_trims_oldest(tmp_path: Path) -> None:
+    cache = LatentCache(max_bytes=0, disk_dir=str(tmp_path), disk_max_bytes=3 * 2 * ENTRY_BYTES)
+    hits = _sample("weaver_latent_cache_hits_total", "disk")
+    for key in "abcdef":
+        cache.put(key, _entry())
+        # Eviction goes by mtime, which some filesystems keep at a few milliseconds' resolution.
+        time.sleep(0.02)
+
+    stats = cache.stats()
+    assert stats["disk_evictions"] > 0
+    assert stats["disk_bytes"] <= 3 * 2 * ENTRY_BYTES
+    assert _sample("weaver_latent_cache_bytes", "disk") == stats["disk_bytes"]
+    assert cache.get("f") is not None
+    assert cache.get("a") is None
+    assert _sample("weaver_latent_cache_hits_total", "disk") == hits + 1
+
+
+def test_device_process_stats_are_exported_as_deltas() -> None:
+    misses = _sample("weaver_latent_cache_misses_total")
+    memory_bytes = _sample("weaver_latent_cache_bytes", "memory")
+    observe_latent_cache({"misses": 2, "memory_bytes": 100}, {})
+    observe_latent_cache({"misses": 5, "memory_bytes": 300}, {"misses": 2, "memory_bytes": 100})
+    assert _sample("weaver_latent_cache_misses_total") == misses + 5
+    assert _sample("weaver_latent_cache_bytes", "memory") == memory_bytes + 300
+
+    # A device process that exits takes its memory tier with it.
+    observe_latent_cache({}, {"misses": 5, "memory_bytes": 300})
+    assert _sample("weaver_latent_cache_misses_total") == misses + 5
+    assert _sample("weaver_latent_cache_bytes", "memory") == memory_bytes
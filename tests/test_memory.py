@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import dataclasses
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from tiny_pipeline import random_images, tiny_catvton_model  # noqa: E402
+
+from common.config import load_settings  # noqa: E402
+from weaver_service import memory  # noqa: E402
+from weaver_service.memory import MemoryBudget  # noqa: E402
+
+
+def test_out_of_memory_cap_halves_and_relaxes_after_clean_calls() -> None:
+    budget = MemoryBudget(dataclasses.replace(load_settings(), device="cpu"))
+    assert budget.max_jobs() is None
+
+    budget.record_oom(8)
+    budget.record_oom(6)
+    assert budget.max_jobs() == 3
+
+    for _ in range(memory._OOM_RELAX_CALLS - 1):
+        budget.record_success(3)
+    # A failure above the cap leaves it alone but restarts the count.
+    budget.record_oom(8)
+    budget.record_success(3)
+    assert budget.max_jobs() == 3
+    for _ in range(memory._OOM_RELAX_CALLS - 1):
+        budget.record_success(3)
+    assert budget.max_jobs() == 4
+
+def test_out_of_memory_batch_is_split_and_retried() -> None:
+    pytest.importorskip("diffusers")
+    model = tiny_catvton_model()
+    images = random_images(10)
+    expected = [np.asarray(image) for image in model.infer_batch(images[:5], images[5:])]
+
+    unet = model._pipeline.unet
+    forward = unet.forward
+    rows: list[int] = []
+
+    def forward_with_small_memory(sample: object, *args: object, **kwargs: object) -> object:
+        # Conditional and unconditional halves: more than one job at a time does not fit.
+        rows.append(sample.shape[0])
+        if sample.shape[0] > 2:
+            raise torch.cuda.OutOfMemoryError("CUDA out of memory.")
+        return forward(sample, *args, **kwargs)
+
+    unet.forward = forward_with_small_memory
+    outputs = [np.asarray(image) for image in model.infer_batch(images[:5], images[5:])]
+
+    assert len(outputs) == 5
+    assert all(np.array_equal(output, reference) for output, reference in zip(outputs, expected))
+    assert model._memory.max_jobs() == 1
+
+    # Later batches start at the cap instead of failing again.
+    rows.clear()
+    model.infer_batch(images[:5], images[5:])
+    assert set(rows) == {2}
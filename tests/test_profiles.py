@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import dataclasses
+
+import pytest
+from pydantic import ValidationError
+
+from common.config import load_settings
+from common.job_schema import WeaverJob
+from common.log_utils import get_logger
+from weaver_service.profiles import InferenceParams, batch_seeds, group_compatible, resolve_params
+
+SETTINGS = dataclasses.replace(
+    load_settings(),
+    width=768,
+    height=1024,
+    num_inference_steps=50,
+    guidance_scale=2.5,
+    seed=-1,
+    profile_sizes=((768, 1024), (384, 512)),
+    profile_max_steps=50,
+)
+
+
+def _raw_job(job_id: str = "j", **profile: object) -> dict:
+    job = {"id": job_id, "user_id": "u", "vton_id": "v", "user_snap_s3": "p", "uncleaned_outfit_s3": "o"}
+    return {**job, "profile": profile}
+
+
+def _job(**profile: object) -> WeaverJob:
+    return WeaverJob.model_validate(_raw_job(**profile))
+
+
+def test_profile_fills_in_from_settings() -> None:
+    assert resolve_params(SETTINGS, _job()) == InferenceParams(768, 1024, 50, 2.5, None)
+    assert resolve_params(SETTINGS, _job(width=384, height=512, steps=20, seed=9)) == InferenceParams(
+        384, 512, 20, 2.5, 9
+    )
+
+
+@pytest.mark.parametrize(
+    ("profile", "error"),
+    [({"width": 512, "height": 512}, "not allowed"), ({"steps": 51}, "PROFILE_MAX_STEPS")],
+)
+def test_profile_outside_the_limits_is_rejected(profile: dict, error: str) -> None:
+    with pytest.raises(ValueError, match=error):
+        resolve_params(SETTINGS, _job(**profile))
+
+
+@pytest.mark.parametrize("profile", [{"width": 384}, {"width": 380, "height": 512}, {"seed": -1}, {"steps": 0}])
+def test_malformed_profile_fails_validation(profile: dict) -> None:
+    with pytest.raises(ValidationError):
+        _job(**profile)
+
+
+def test_group_compatible_splits_on_shape_and_schedule_but_not_seed() -> None:
+    full = InferenceParams(768, 1024, 50, 2.5, None)
+    params = [
+        full,
+        InferenceParams(384, 512, 50, 2.5, None),
+        dataclasses.replace(full, seed=1),
+        dataclasses.replace(full, steps=20),
+        InferenceParams(384, 512, 50, 2.5, 4),
+        dataclasses.replace(full, guidance_scale=1.0),
+    ]
+    assert group_compatible(params) == [[0, 2], [1, 4], [3], [5]]
+
+
+def test_batch_seeds_fill_unseeded_rows_only_when_one_is_seeded() -> None:
+    full = InferenceParams(768, 1024, 50, 2.5, None)
+    assert batch_seeds([full, full]) == [None, None]
+    seeds = batch_seeds([full, dataclasses.replace(full, seed=5)])
+    assert seeds[1] == 5 and isinstance(seeds[0], int)
+
+
+
+def _run_mixed_batch(fail_size: tuple[int, int] | None = None) -> tuple[dict, list[list[tuple[int, int]]]]:
+    """Run a batch of two sizes plus one invalid profile; returns each job's outcome and each model call's sizes."""
+    pytest.importorskip("fakeredis")
+    from fakes import FakeStore, stub_settings
+
+    from weaver_service.catvton import CatVTONModel
+    from weaver_service.pipeline import run_jobs
+
+    settings = stub_settings(profile_sizes=SETTINGS.profile_sizes, profile_max_steps=50)
+    model = CatVTONModel(settings)
+    model.load()
+    infer_batch = model.infer_batch
+    calls: list[list[tuple[int, int]]] = []
+
+    def recording_infer_batch(
+        person_imgs: list, outfit_imgs: list, timings: dict, preview: object, params: list[InferenceParams]
+    ) -> list:
+        sizes = [(job_params.width, job_params.height) for job_params in params]
+        calls.append(sizes)
+        if sizes[0] == fail_size:
+            raise RuntimeError("group broke")
+        return infer_batch(person_imgs, outfit_imgs, timings, preview, params)
+
+    model.infer_batch = recording_infer_batch  # type: ignore[method-assign]
+    raw_jobs = [
+        _raw_job("full-0"),
+        _raw_job("small-0", width=384, height=512),
+        _raw_job("too-many-steps", steps=80),
+        _raw_job("full-1", seed=3),
+        _raw_job("small-1", width=384, height=512),
+    ]
+    events = run_jobs(
+        settings=settings,
+        store=FakeStore(),  # type: ignore[arg-type]
+        model=model,
+        raw_jobs=raw_jobs,
+        logger=get_logger("weaver.test"),
+    )
+    return {event.job_id: (event.status, (event.error or "").split(":")[0]) for event in events}, calls
+
+
+def test_mixed_batch_runs_one_model_call_per_group() -> None:
+    outcomes, calls = _run_mixed_batch()
+    assert outcomes == {
+        "full-0": ("done", ""),
+        "full-1": ("done", ""),
+        "small-0": ("done", ""),
+        "small-1": ("done", ""),
+        "too-many-steps": ("failed", "invalid_profile"),
+    }
+    assert calls == [[(768, 1024), (768, 1024)], [(384, 512), (384, 512)]]
+
+
+def test_failed_group_fails_only_its_own_jobs() -> None:
+    outcomes, _ = _run_mixed_batch(fail_size=(384, 512))
+    assert outcomes["small-0"] == outcomes["small-1"] == ("failed", "batch_inference_failed")
+    assert outcomes["full-0"] == outcomes["full-1"] == ("done", "")
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from fakes import FakeStore, enqueue_jobs, queue_client, run_until, stub_settings  # noqa: E402
+
+from common.log_utils import get_logger  # noqa: E402
+from common.redis_client import STREAM_DELIVERIES_EXCEEDED_FIELD, STREAM_ID_FIELD, RedisClient  # noqa: E402
+from weaver_service.catvton import CatVTONModel  # noqa: E402
+from weaver_service.sequential import SequentialWorker  # noqa: E402
+
+QUEUE = "queue:weaver_jobs"
+
+
+def _stream_client(server: fakeredis.FakeRedis, name: str, **kwargs: int) -> RedisClient:
+    return RedisClient("redis://unused", queue_backend="stream", consumer_name=name, client=server, **kwargs)
+
+
+def _ids(jobs: list[dict] | None) -> list[str]:
+    return [job["id"] for job in jobs or []]
+
+
+def test_list_pops_up_to_the_configured_batch_in_order() -> None:
+    client = RedisClient("redis://unused", client=fakeredis.FakeRedis(decode_responses=True), max_batch_size=3)
+    for i in range(5):
+        client.enqueue_job_weaver(QUEUE, {"id": f"job-{i}", "user_id": "u"})
+    client._redis.lpush(QUEUE, "not json")
+    client.set_config_batch_size(4)
+
+    assert _ids(client.consume_job_weaver(QUEUE, timeout_seconds=1)) == ["job-0", "job-1", "job-2"]
+    assert _ids(client.consume_job_weaver(QUEUE, timeout_seconds=1)) == ["job-3", "job-4", "unknown"]
+    assert client.consume_job_weaver(QUEUE, timeout_seconds=1) is None
+
+
+def test_stream_jobs_stay_pending_until_acked() -> None:
+    server = fakeredis.FakeRedis(decode_responses=True)
+    client = _stream_client(server, "a")
+    for i in range(3):
+        client.enqueue_job_weaver(QUEUE, {"id": f"job-{i}", "user_id": "u"})
+    client.set_config_batch_size(2)
+
+    jobs = client.consume_job_weaver(QUEUE, timeout_seconds=1)
+    assert _ids(jobs) == ["job-0", "job-1"]
+    assert all(job[STREAM_ID_FIELD] for job in jobs)
+    assert server.xpending(QUEUE, "weaver")["pending"] == 2
+
+    client.ack_jobs(QUEUE, jobs)
+    assert server.xpending(QUEUE, "weaver")["pending"] == 0
+    assert server.xlen(QUEUE) == 1
+
+
+def test_stream_reclaims_jobs_of_a_dead_consumer() -> None:
+    server = fakeredis.FakeRedis(decode_responses=True)
+    dead = _stream_client(server, "dead")
+    dead.enqueue_job_weaver(QUEUE, {"id": "job-0", "user_id": "u"})
+    assert _ids(dead.consume_job_weaver(QUEUE, timeout_seconds=1)) == ["job-0"]
+
+    patient = _stream_client(server, "patient", visibility_timeout_seconds=600)
+    assert patient.consume_job_weaver(QUEUE, timeout_seconds=1) is None
+
+    rescuer = _stream_client(server, "rescuer", visibility_timeout_seconds=0)
+    jobs = rescuer.consume_job_weaver(QUEUE, timeout_seconds=1)
+    assert _ids(jobs) == ["job-0"]
+    assert STREAM_DELIVERIES_EXCEEDED_FIELD not in jobs[0]
+
+
+def test_stream_fails_jobs_past_max_deliveries_instead_of_retrying() -> None:
+    server = fakeredis.FakeRedis(decode_responses=True)
+    settings = stub_settings(queue_backend="stream", queue_visibility_timeout_seconds=0, queue_max_deliveries=2)
+    client, events = queue_client(settings, server)
+    enqueue_jobs(client, settings, 1)
+    # Two workers took the job and died without acknowledging it.
+    for name in ("dead-0", "dead-1"):
+        assert _ids(_stream_client(server, name, visibility_timeout_seconds=0).consume_job_weaver(QUEUE, 1))
+
+    worker = SequentialWorker(
+        settings=settings,
+        redis_client=client,
+        store=FakeStore(),  # type: ignore[arg-type]
+        model=CatVTONModel(settings),
+        logger=get_logger("weaver.test"),
+    )
+    run_until(worker, lambda: len(events) >= 1)
+
+    assert [(event["job_id"], event["status"]) for event in events] == [("job-0", "failed")]
+    assert events[0]["error"].startswith("max_deliveries_exceeded")
+    assert server.xlen(QUEUE) == 0
+    assert server.xpending(QUEUE, "weaver")["pending"] == 0
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import time
+from typing import Any
+
+import pytest
+
+pytest.importorskip("fakeredis")
+
+from fakes import FakeStore, enqueue_jobs, queue_client, run_until, stub_settings  # noqa: E402
+
+from common.log_utils import get_logger  # noqa: E402
+from weaver_service.catvton import CatVTONModel  # noqa: E402
+from weaver_service.staged import StagedWorker  # noqa: E402
+
+
+def _worker(store: FakeStore) -> tuple[StagedWorker, list[dict[str, Any]]]:
+    settings = stub_settings()
+    client, events = queue_client(settings)
+    enqueue_jobs(client, settings, 2)
+    worker = StagedWorker(
+        settings=settings,
+        redis_client=client,
+        store=store,  # type: ignore[arg-type]
+        model=CatVTONModel(settings),
+        logger=get_logger("weaver.test"),
+    )
+    return worker, events
+
+
+@pytest.mark.parametrize(
+    ("store", "error"),
+    [(FakeStore(fail_downloads=True), "batch_intake_failed"), (FakeStore(fail_uploads=True), "batch_publish_failed")],
+)
+def test_stage_failure_fails_the_popped_jobs(store: FakeStore, error: str) -> None:
+    worker, events = _worker(store)
+    run_until(worker, lambda: len(events) >= 2)
+    assert sorted(event["job_id"] for event in events) == ["job-0", "job-1"]
+    assert all(event["status"] == "failed" and event["error"].startswith(error) for event in events)
+
+
+def test_dead_stage_thread_stops_the_worker() -> None:
+    worker, _ = _worker(FakeStore())
+
+    def broken_put(*args: Any) -> None:
+        raise RuntimeError("queue broke")
+
+    worker._put = broken_put  # type: ignore[method-assign]
+    with pytest.raises(RuntimeError, match="stage failure"):
+        worker.run()
+
+
+def test_stop_drains_popped_batches() -> None:
+    settings = stub_settings(publish_queue_depth=2, prefetch_queue_depth=1)
+    client, events = queue_client(settings)
+    ids = enqueue_jobs(client, settings, 8)
+    model = CatVTONModel(settings)
+    infer_batch = model.infer_batch
+
+    def slow_infer_batch(*args: Any, **kwargs: Any) -> Any:
+        time.sleep(0.3)
+        return infer_batch(*args, **kwargs)
+
+    model.infer_batch = slow_infer_batch  # type: ignore[method-assign]
+    worker = StagedWorker(
+        settings=settings,
+        redis_client=client,
+        store=FakeStore(),  # type: ignore[arg-type]
+        model=model,
+        logger=get_logger("weaver.test"),
+    )
+    run_until(worker, lambda: len(events) >= 1)
+
+    left = client._redis.llen(settings.redis_queue)
+    # Everything popped before the stop was inferred and published, not dropped.
+    assert len(events) + left == len(ids)
+    assert len(events) > 1
+    assert all(event["status"] == "done" for event in events)
+
+
+def test_inference_error_fails_the_batch_and_keeps_going() -> None:
+    worker, events = _worker(FakeStore())
+
+    class BrokenPreviews:
+        def for_jobs(self, jobs: list[Any]) -> Any:
+            raise RuntimeError("preview sink broke")
+
+    worker._previews = BrokenPreviews()  # type: ignore[assignment]
+    run_until(worker, lambda: len(events) >= 2)
+    assert sorted(event["job_id"] for event in events) == ["job-0", "job-1"]
+    assert all(event["error"].startswith("batch_inference_failed") for event in events)
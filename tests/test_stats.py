@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import dataclasses
+import threading
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from common.config import load_settings  # noqa: E402
+from common.log_utils import get_logger  # noqa: E402
+from common.redis_client import RedisClient  # noqa: E402
+from weaver_service.stats import WorkerStatsReporter  # noqa: E402
+
+TTL_SECONDS = 3
+
+
+def _replicas(client: RedisClient) -> int:
+    return client.get_weaver_stats(TTL_SECONDS, pool=load_settings().worker_pool).replicas
+
+
+def _reporter() -> tuple[WorkerStatsReporter, RedisClient]:
+    settings = dataclasses.replace(load_settings(), weaver_heartbeat_ttl_seconds=TTL_SECONDS)
+    client = RedisClient("redis://unused", client=fakeredis.FakeRedis(decode_responses=True))
+    return WorkerStatsReporter(settings, client, get_logger("weaver.test"), worker_id="w1"), client
+
+
+def test_worker_stays_live_through_a_batch_longer_than_the_ttl() -> None:
+    reporter, client = _reporter()
+    stop = threading.Event()
+    reporter.record_popped(1)
+    reporter.start_heartbeats(stop)
+    try:
+        # The worker is busy in one batch and reports nothing itself.
+        time.sleep(TTL_SECONDS + 1)
+        assert _replicas(client) == 1
+    finally:
+        stop.set()
+
+
+def test_no_heartbeats_while_not_alive() -> None:
+    reporter, client = _reporter()
+    stop = threading.Event()
+    reporter.start_heartbeats(stop, alive=lambda: False)
+    try:
+        time.sleep(1.5)
+        assert _replicas(client) == 0
+    finally:
+        stop.set()
@@ -0,0 +1,70 @@
+"""A real CatVTON pipeline around a few-channel UNet and VAE, built without weights, for CPU tests."""
+
+from __future__ import annotations
+
+import dataclasses
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+from common.config import load_settings
+from weaver_service.catvton import CatVTONModel
+
+WIDTH, HEIGHT = 12, 16
+
+
+def tiny_catvton_model(**overrides: Any) -> CatVTONModel:
+    """A loaded `CatVTONModel` on CPU; `overrides` replace settings (default: 3 DDIM steps, seed 3)."""
+    import diffusers  # type: ignore
+    import torch  # type: ignore
+
+    from weaver_service.memory import MemoryBudget
+    from weaver_service.preprocess import BatchPreprocessor
+    from weaver_service.vendor.catvton.model.pipeline import CatVTONPix2PixPipeline
+    from weaver_service.vendor.catvton.utils import resize_and_crop, resize_and_padding
+
+    torch.manual_seed(0)
+    pipeline = object.__new__(CatVTONPix2PixPipeline)
+    pipeline.device = torch.device("cpu")
+    pipeline.weight_dtype = torch.float32
+    pipeline.latent_cache = None
+    pipeline.skip_safety_check = True
+    pipeline.vae = diffusers.AutoencoderKL(block_out_channels=(8,), norm_num_groups=4, latent_channels=4).eval()
+    pipeline.unet = diffusers.UNet2DConditionModel(
+        sample_size=8,
+        in_channels=8,
+        out_channels=4,
+        block_out_channels=(8, 16),
+        norm_num_groups=4,
+        down_block_types=("DownBlock2D", "DownBlock2D"),
+        up_block_types=("UpBlock2D", "UpBlock2D"),
+        mid_block_type=None,
+        layers_per_block=1,
+    ).eval()
+    pipeline.scheduler_config = diffusers.DDIMScheduler().config
+    pipeline.set_scheduler("ddim")
+
+    defaults: dict[str, Any] = {
+        "inference_backend": "catvton",
+        "device": "cpu",
+        "guidance_scale": 2.0,
+        "num_inference_steps": 3,
+        "seed": 3,
+        "width": WIDTH,
+        "height": HEIGHT,
+        "compile_mode": "off",
+    }
+    settings = dataclasses.replace(load_settings(), **{**defaults, **overrides})
+    model = CatVTONModel(settings)
+    model._pipeline = pipeline
+    model._torch = torch
+    model._weight_dtype = torch.float32
+    model._preprocessor = BatchPreprocessor((WIDTH, HEIGHT), "cpu", torch.float32, resize_and_crop, resize_and_padding)
+    model._memory = MemoryBudget(settings)
+    return model
+
+
+def random_images(count: int, seed: int = 0) -> list[Image.Image]:
+    rng = np.random.default_rng(seed)
+    return [Image.fromarray(rng.integers(0, 255, (HEIGHT, WIDTH, 3), dtype=np.uint8)) for _ in range(count)]
@@ -0,0 +1,45 @@
+"""
+Bake the Weaver's model into one pre-cast safetensors bundle.
+
+    python -m weaver_service.bake_model --output weaver_service/models/catvton-bundle.safetensors
+
+Builds the pipeline the slow way (base UNet and VAE from the hub, CatVTON attention weights
+from `CATVTON_MODEL_DIR`, cast to `MIXED_PRECISION`) and writes the merged UNet, the VAE and
+the scheduler config to a single file. Point `CATVTON_BUNDLE_PATH` at it and the Weaver maps
+it at startup instead of downloading, loading and casting the checkpoints. Re-bake whenever
+the model variant, base model or precision changes; the Weaver refuses a mismatched bundle.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+from common.config import load_settings
+from .catvton import CatVTONModel
+
+DEFAULT_BUNDLE_PATH = "weaver_service/models/catvton-bundle.safetensors"
+
+
+def main() -> None:
+    settings = load_settings()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", default=settings.catvton_bundle_path or DEFAULT_BUNDLE_PATH)
+    parser.add_argument("--device", default="cpu", help="Device used while building; the bundle is device-independent.")
+    args = parser.parse_args()
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    metadata = CatVTONModel(settings).bake(args.output, device=args.device)
+    size_mb = os.path.getsize(args.output) / (1024 * 1024)
+    print(
+        f"Baked {metadata['model_variant']} ({metadata['dtype']}) to {args.output}: "
+        f"{size_mb:.0f} MB in {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark: full-resolution input decode against the size-aware JPEG decode.
+
+    python -m weaver_service.bench_decode --runs 5
+
+Writes synthetic phone-sized JPEGs (8, 12 and 24 MP, EXIF-rotated like portrait phone shots),
+then decodes each one and resizes it to the model size in a fresh subprocess per run, so peak
+RSS is per job rather than cumulative:
+
+- legacy: full decode, RGBA conversion, RGB conversion, LANCZOS resize (the old path)
+- draft:  `open_image` with the target size (DCT-scaled decode, EXIF transpose, RGB), then resize
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+
+def _write_phone_jpeg(path: Path, size: tuple[int, int], seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    w, h = size
+    # Low-frequency structure plus sensor-like noise, so the JPEG has realistic entropy.
+    coarse = rng.integers(0, 256, (h // 64 + 1, w // 64 + 1, 3), dtype=np.uint8)
+    pixels = np.asarray(Image.fromarray(coarse).resize((w, h), Image.BICUBIC), dtype=np.int16)
+    pixels = np.clip(pixels + rng.normal(0, 6, (h, w, 3)), 0, 255).astype(np.uint8)
+    exif = Image.Exif()
+    exif[0x0112] = 6  # stored landscape, displayed portrait
+    Image.fromarray(pixels).save(path, format="JPEG", quality=92, exif=exif)
+
+
+def _resize_and_crop(image: Image.Image, size: tuple[int, int]) -> Image.Image:
+    # Same as vendor/catvton/utils.resize_and_crop, without importing torch into the child.
+    target_w, target_h = size
+    scale = max(target_w / image.width, target_h / image.height)
+    resized = image.resize((int(image.width * scale), int(image.height * scale)), Image.LANCZOS)
+    left, top = (resized.width - target_w) // 2, (resized.height - target_h) // 2
+    return resized.crop((left, top, left + target_w, top + target_h))
+
+
+def _peak_rss_mb() -> float:
+    # VmHWM belongs to this process image; ru_maxrss also counts the forking parent's peak.
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _child(mode: str, path: str, width: int, height: int) -> None:
+    from common.s3_client import open_image
+
+    started = time.perf_counter()
+    if mode == "legacy":
+        image = Image.open(path)
+        image.load()
+        image = image.convert("RGBA").convert("RGB")
+    else:
+        image = open_image(path, (width, height))
+    decoded = time.perf_counter()
+    resized = _resize_and_crop(image, (width, height))
+    finished = time.perf_counter()
+    print(
+        json.dumps(
+            {
+                "decode_ms": (decoded - started) * 1000,
+                "total_ms": (finished - started) * 1000,
+                "decoded_size": list(image.size),
+                "output_size": list(resized.size),
+                "peak_rss_mb": _peak_rss_mb(),
+            }
+        )
+    )
+
+
+def _measure(mode: str, path: Path, width: int, height: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "weaver_service.bench_decode", "--child", mode, str(path), str(width), str(height)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--width", type=int, default=768)
+    parser.add_argument("--height", type=int, default=1024)
+    parser.add_argument("--child", nargs=4, metavar=("MODE", "PATH", "WIDTH", "HEIGHT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, path, width, height = args.child
+        _child(mode, path, int(width), int(height))
+        return
+
+    # A bare interpreter with the imports used by the child, so RSS deltas are attributable.
+    baseline = _measure_baseline()
+    print(f"interpreter + imports baseline: {baseline:.1f} MB RSS")
+    print(f"{'input':<18} {'mode':<7} {'decode ms':>10} {'total ms':>9} {'peak RSS MB':>12} {'decoded':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, size in (
+            ("8MP 3264x2448", (3264, 2448)),
+            ("12MP 4032x3024", (4032, 3024)),
+            ("24MP 5712x4284", (5712, 4284)),
+        ):
+            path = Path(tmp) / f"{size[0]}x{size[1]}.jpg"
+            _write_phone_jpeg(path, size, seed=size[0])
+            for mode in ("legacy", "draft"):
+                runs = [_measure(mode, path, args.width, args.height) for _ in range(args.runs)]
+                decoded = "x".join(str(v) for v in runs[0]["decoded_size"])
+                print(
+                    f"{label:<18} {mode:<7} {statistics.median(r['decode_ms'] for r in runs):>10.1f} "
+                    f"{statistics.median(r['total_ms'] for r in runs):>9.1f} "
+                    f"{statistics.median(r['peak_rss_mb'] for r in runs):>12.1f} {decoded:>11}"
+                )
+
+
+def _measure_baseline() -> float:
+    code = "import common.s3_client, weaver_service.bench_decode as b; print(b._peak_rss_mb())"
+    return float(subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout)
+
+
+if __name__ == "__main__":
+    main()
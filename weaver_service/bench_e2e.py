@@ -0,0 +1,585 @@
+"""
+End-to-end Weaver benchmark: replay jobs through the real worker loop against local stand-ins.
+
+    python -m weaver_service.bench_e2e --rate 2 --jobs 200 --stub-service-time 0.4,0.15 \
+        --policies fixed:1,fixed:4,fixed:8,arbitrator --json e2e.json
+
+    python -m weaver_service.bench_e2e --trace trace.jsonl --backend catvton --policies arbitrator \
+        --baseline e2e.json
+
+    WEAVER_MAX_BATCH_SIZE=0 python -m weaver_service.bench_e2e --backend cpu --rate 0.05 --jobs 20 \
+        --policies fixed:1,fixed:2 --json e2e-cpu.json
+
+    WEAVER_QUEUE_BACKEND=fair python -m weaver_service.bench_e2e --rate 2 --jobs 100 --bulk-burst 200 \
+        --stub-service-time 0.4,0.15 --policies fixed:4,fixed:8
+
+Jobs are enqueued the way the gateway does it (LPUSH, XADD or the fair-queue script, per
+`WEAVER_QUEUE_BACKEND`) at
+their arrival times. They come from a JSONL trace, one job per line, where `at` is the arrival
+offset in seconds, any `WeaverJob` field may be set and missing ones are filled in. Without a
+trace, a Poisson process (`--rate`, `--jobs`) generates them; `--bulk-burst N` adds N jobs from
+one user in the lowest `WEAVER_QUEUE_TIERS` tier, all arriving at the start. The worker for
+`WEAVER_WORKER_MODE` pops them with `consume_job_weaver`, runs them and publishes done events
+exactly as in production.
+
+Redis is an in-process fakeredis server unless `--redis-url` points at a scratch redis-server,
+which is flushed before every run. S3 is moto's in-process mock unless `--s3 settings` uses the
+configured store (e.g. a local MinIO with the bucket already created). Inputs are synthetic
+JPEGs uploaded once. With the `stub` backend, `--stub-service-time FIXED,PER_JOB` adds a
+simulated model time per batch so batch-size policies can be compared without a GPU.
+
+For each policy (`fixed:<n>` pins `config:batch_size`; `arbitrator` runs the Arbitrator's
+controller against the live queue), it reports:
+
+- throughput;
+- end-to-end latency percentiles, from enqueue to the done event;
+- queue wait, overall and per tier when jobs carry one;
+- seconds per job in each stage;
+- the batch sizes popped.
+
+In continuous mode, `inference` is each job's own submit-to-result time. `--json` writes the
+results. With `--baseline`, the run exits non-zero when a policy's throughput or p95 latency is
+worse than the baseline's by more than `--tolerance`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import dataclasses
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Iterator
+
+import numpy as np
+from PIL import Image
+
+from arbitrator.controller import BatchSizeController
+from common.config import Settings, load_settings
+from common.log_utils import get_logger, setup_logging
+from common.redis_client import RedisClient
+from common.s3_client import S3ImageStore
+from .catvton import CatVTONModel
+from .encoding import ResultEncoder
+from .main import WORKER_CLASSES, worker_class
+from .stats import WorkerStatsReporter
+
+_STAGES = ("download", "inference", "encode", "upload", "publish")
+
+
+@dataclass(frozen=True)
+class TraceJob:
+    at: float
+    payload: dict[str, Any]
+
+
+def _fill_payload(payload: dict[str, Any], index: int, distinct_inputs: int) -> dict[str, Any]:
+    slot = index % max(1, distinct_inputs)
+    return {
+        "id": f"bench-{index}",
+        "user_id": f"bench-user-{index % 50}",
+        "vton_id": f"bench-vton-{index}",
+        "user_snap_s3": f"bench/inputs/person-{slot}.jpg",
+        "uncleaned_outfit_s3": f"bench/inputs/outfit-{slot}.jpg",
+        **payload,
+    }
+
+
+def load_trace(path: Path, distinct_inputs: int) -> list[TraceJob]:
+    jobs: list[TraceJob] = []
+    for index, line in enumerate(line for line in path.read_text().splitlines() if line.strip()):
+        record = json.loads(line)
+        at = float(record.pop("at", 0.0))
+        jobs.append(TraceJob(at=at, payload=_fill_payload(record, index, distinct_inputs)))
+    return sorted(jobs, key=lambda job: job.at)
+
+
+def poisson_trace(rate: float, count: int, distinct_inputs: int, seed: int) -> list[TraceJob]:
+    rng = np.random.default_rng(seed)
+    arrivals = np.cumsum(rng.exponential(1.0 / rate, count))
+    return [TraceJob(at=float(at), payload=_fill_payload({}, i, distinct_inputs)) for i, at in enumerate(arrivals)]
+
+
+def bulk_burst(count: int, tier: str, distinct_inputs: int, first_index: int) -> list[TraceJob]:
+    """`count` jobs from one user in `tier`, all arriving at the start of the run."""
+    return [
+        TraceJob(at=0.0, payload=_fill_payload({"user_id": "bench-bulk", "tier": tier}, first_index + i, distinct_inputs))
+        for i in range(count)
+    ]
+
+
+def _percentiles(values: list[float]) -> dict[str, float | None]:
+    if not values:
+        return {"mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    array = np.asarray(values)
+    p50, p95, p99 = np.percentile(array, [50, 95, 99])
+    return {"mean": float(array.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(array.max())}
+
+
+class StageTimer:
+    """Thread-safe accumulator of seconds spent per stage."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.seconds: dict[str, float] = defaultdict(float)
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[stage] += seconds
+
+    @contextlib.contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+
+class _RunTracker:
+    def __init__(self, expected: int) -> None:
+        self._lock = threading.Lock()
+        self.expected = expected
+        self.enqueued: dict[str, float] = {}
+        self.popped: dict[str, float] = {}
+        self.finished: dict[str, tuple[float, str]] = {}
+        self.batch_sizes: Counter[int] = Counter()
+        self.all_done = threading.Event()
+
+    def record_enqueued(self, job_id: str) -> None:
+        with self._lock:
+            self.enqueued[job_id] = time.perf_counter()
+
+    def record_popped(self, raw_jobs: list[dict[str, Any]]) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            self.batch_sizes[len(raw_jobs)] += 1
+            for raw_job in raw_jobs:
+                self.popped.setdefault(str(raw_job.get("id")), now)
+
+    def record_finished(self, job_id: str, status: str) -> None:
+        with self._lock:
+            self.finished.setdefault(job_id, (time.perf_counter(), status))
+            if len(self.finished) >= self.expected:
+                self.all_done.set()
+
+
+class _TimedRedis:
+    """`RedisClient` seen by the worker: records pops and times event publishing."""
+
+    def __init__(self, client: RedisClient, timer: StageTimer, tracker: _RunTracker) -> None:
+        self._client = client
+        self._timer = timer
+        self._tracker = tracker
+
+    def consume_job_weaver(self, queue_name: str, timeout_seconds: int = 5) -> list[dict[str, Any]] | None:
+        raw_jobs = self._client.consume_job_weaver(queue_name, timeout_seconds=timeout_seconds)
+        if raw_jobs:
+            self._tracker.record_popped(raw_jobs)
+        return raw_jobs
+
+    def publish_event(self, channel_name: str, event: dict[str, Any]) -> int:
+        with self._timer.measure("publish"):
+            return self._client.publish_event(channel_name, event)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+class _TimedStore:
+    def __init__(self, store: S3ImageStore, timer: StageTimer) -> None:
+        self._store = store
+        self._timer = timer
+
+    def download_images(
+        self,
+        keys: list[str],
+        target_size: tuple[int, int] | list[tuple[int, int]] | None = None,
+        timings: list[dict[str, float]] | None = None,
+    ) -> list[Any]:
+        with self._timer.measure("download"):
+            return self._store.download_images(keys, target_size, timings=timings)
+
+    def upload_objects(self, items: list[tuple[str, bytes, str]], timings: list[float] | None = None) -> list[Any]:
+        with self._timer.measure("upload"):
+            return self._store.upload_objects(items, timings=timings)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._store, name)
+
+
+class _TimedEncoder:
+    def __init__(self, encoder: ResultEncoder, timer: StageTimer) -> None:
+        self._encoder = encoder
+        self._timer = timer
+
+    def encode_batch(self, images: list[Image.Image]) -> list[Any]:
+        with self._timer.measure("encode"):
+            return self._encoder.encode_batch(images)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._encoder, name)
+
+
+class _TimedModel:
+    """Times inference; with the stub backend, also sleeps `fixed + per_job * batch` per batch."""
+
+    def __init__(self, model: CatVTONModel, timer: StageTimer, service_time: tuple[float, float]) -> None:
+        self._model = model
+        self._timer = timer
+        self._service_time = service_time
+
+    def _simulate(self, jobs: int) -> None:
+        fixed, per_job = self._service_time
+        if fixed or per_job:
+            time.sleep(fixed + per_job * jobs)
+
+    def infer_batch(
+        self,
+        person_imgs: list[Image.Image],
+        outfit_imgs: list[Image.Image],
+        timings: dict[str, float] | None = None,
+        preview: Any = None,
+        params: Any = None,
+    ) -> list[Image.Image]:
+        with self._timer.measure("inference"):
+            self._simulate(len(person_imgs))
+            return self._model.infer_batch(person_imgs, outfit_imgs, timings, preview, params)
+
+    def submit(
+        self,
+        person_img: Image.Image,
+        outfit_img: Image.Image,
+        timings: dict[str, float] | None = None,
+        preview: Any = None,
+        params: Any = None,
+    ) -> Any:
+        started = time.perf_counter()
+        self._simulate(1)
+        future = self._model.submit(person_img, outfit_img, timings, preview, params)
+        future.add_done_callback(lambda _: self._timer.add("inference", time.perf_counter() - started))
+        return future
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._model, name)
+
+
+def _synthetic_jpeg(size: tuple[int, int], seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    w, h = size
+    coarse = rng.integers(0, 256, (h // 64 + 1, w // 64 + 1, 3), dtype=np.uint8)
+    pixels = np.asarray(Image.fromarray(coarse).resize((w, h), Image.BICUBIC), dtype=np.int16)
+    pixels = np.clip(pixels + rng.normal(0, 6, (h, w, 3)), 0, 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def _upload_inputs(store: S3ImageStore, trace: list[TraceJob], size: tuple[int, int]) -> None:
+    keys = sorted({job.payload[field] for job in trace for field in ("user_snap_s3", "uncleaned_outfit_s3")})
+    results = store.upload_objects([(key, _synthetic_jpeg(size, seed), "image/jpeg") for seed, key in enumerate(keys)])
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        raise SystemExit(f"Failed to upload {len(errors)} benchmark inputs: {errors[0]}")
+
+
+class _RedisFactory:
+    """Fresh Redis state per run: a new fakeredis server, or a flushed scratch database."""
+
+    def __init__(self, redis_url: str | None) -> None:
+        self._redis_url = redis_url
+        if redis_url is None:
+            try:
+                import fakeredis  # type: ignore
+            except ImportError as exc:
+                raise SystemExit("The in-process Redis needs `fakeredis`; pip install -r weaver_service/requirements-bench.txt") from exc
+            self._fakeredis = fakeredis
+
+    def new(self) -> Any:
+        if self._redis_url is None:
+            server = self._fakeredis.FakeServer()
+            return lambda: self._fakeredis.FakeRedis(server=server, decode_responses=True)
+        import redis
+
+        connection = redis.Redis.from_url(self._redis_url, decode_responses=True)
+        connection.flushdb()
+        return lambda: redis.Redis.from_url(self._redis_url, decode_responses=True)
+
+
+def _parse_policy(policy: str) -> int | None:
+    if policy == "arbitrator":
+        return None
+    kind, _, size = policy.partition(":")
+    if kind != "fixed" or not size.isdigit() or int(size) < 1:
+        raise SystemExit(f"Unknown policy {policy!r}; expected fixed:<n> or arbitrator")
+    return int(size)
+
+
+def _run_arbitrator(settings: Settings, redis_client: RedisClient, stop: threading.Event) -> None:
+    """The Arbitrator's evaluation loop (polling), against the benchmark's Redis."""
+    controller = BatchSizeController(
+        settings.batch_size_ladder,
+        hysteresis=settings.arbitrator_hysteresis,
+        min_dwell_seconds=settings.arbitrator_min_dwell_seconds,
+    )
+    while not stop.wait(settings.arbitrator_eval_interval_seconds):
+        now = time.monotonic()
+        queue_depth = redis_client.get_queue_depth(settings.redis_queue)
+        fleet = redis_client.get_weaver_stats(settings.weaver_heartbeat_ttl_seconds, pool=settings.worker_pool)
+        controller.observe(now, queue_depth, fleet.popped_total)
+        redis_client.set_config_batch_size(controller.decide(now, queue_depth, fleet).batch_size)
+
+
+def run_policy(
+    *,
+    settings: Settings,
+    policy: str,
+    trace: list[TraceJob],
+    connect: Any,
+    store: S3ImageStore,
+    model: CatVTONModel,
+    encoder: ResultEncoder,
+    service_time: tuple[float, float],
+    timeout: float,
+) -> dict[str, Any]:
+    logger = get_logger("weaver.bench")
+    timer = StageTimer()
+    tracker = _RunTracker(len(trace))
+    raw = connect()
+    redis_client = RedisClient.from_settings(settings, client=connect())
+    fixed_size = _parse_policy(policy)
+    redis_client.set_config_batch_size(fixed_size or 1)
+
+    pubsub = raw.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(settings.redis_events_channel)
+    stop = threading.Event()
+
+    def listen() -> None:
+        while not stop.is_set():
+            message = pubsub.get_message(timeout=0.2)
+            if message is not None and message.get("type") == "message":
+                event = json.loads(message["data"])
+                tracker.record_finished(str(event.get("job_id")), event.get("status", "unknown"))
+
+    def produce() -> None:
+        started = time.perf_counter()
+        for job in trace:
+            delay = started + job.at - time.perf_counter()
+            if delay > 0 and stop.wait(delay):
+                return
+            tracker.record_enqueued(str(job.payload["id"]))
+            redis_client.enqueue_job_weaver(settings.redis_queue, job.payload)
+
+    worker = worker_class(settings.worker_mode)(
+        settings=settings,
+        redis_client=_TimedRedis(redis_client, timer, tracker),
+        store=_TimedStore(store, timer),
+        model=_TimedModel(model, timer, service_time),
+        logger=logger,
+        dedup=None,
+        stats=WorkerStatsReporter(settings, RedisClient.from_settings(settings, client=connect()), logger),
+        encoder=_TimedEncoder(encoder, timer),
+    )
+    threads = [
+        threading.Thread(target=listen, name="bench-events", daemon=True),
+        threading.Thread(target=worker.run, name="bench-worker", daemon=True),
+        threading.Thread(target=produce, name="bench-producer", daemon=True),
+    ]
+    if fixed_size is None:
+        arbitrator_client = RedisClient.from_settings(settings, client=connect())
+        threads.append(
+            threading.Thread(target=_run_arbitrator, args=(settings, arbitrator_client, stop), name="bench-arbitrator", daemon=True)
+        )
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    completed_in_time = tracker.all_done.wait(timeout)
+    stop.set()
+    worker.stop()
+    # The worker notices the stop after its current blocking pop; don't share the model with the next run.
+    threads[1].join(timeout=15)
+
+    finished = dict(tracker.finished)
+    ended = max((finished_at for finished_at, _ in finished.values()), default=time.perf_counter())
+    duration = ended - started
+    latencies = [finished[job_id][0] - enqueued for job_id, enqueued in tracker.enqueued.items() if job_id in finished]
+    queue_waits = [tracker.popped[job_id] - enqueued for job_id, enqueued in tracker.enqueued.items() if job_id in tracker.popped]
+    default_tier = settings.queue_tiers[0] if settings.queue_backend == "fair" else None
+    tiers = {str(job.payload["id"]): job.payload.get("tier") or default_tier for job in trace}
+    waits_by_tier: dict[str, list[float]] = defaultdict(list)
+    for job_id, enqueued in tracker.enqueued.items():
+        if job_id in tracker.popped and tiers.get(job_id) is not None:
+            waits_by_tier[tiers[job_id]].append(tracker.popped[job_id] - enqueued)
+    done = sum(1 for _, status in finished.values() if status == "done")
+    jobs_run = max(1, len(finished))
+    return {
+        "policy": policy,
+        "worker_mode": settings.worker_mode,
+        "backend": settings.inference_backend,
+        "pool": settings.worker_pool,
+        "jobs": len(trace),
+        "completed": done,
+        "failed": len(finished) - done,
+        "timed_out": not completed_in_time,
+        "duration_seconds": duration,
+        "throughput_jobs_per_second": done / duration if duration > 0 else 0.0,
+        "latency_seconds": _percentiles(latencies),
+        "queue_wait_seconds": _percentiles(queue_waits),
+        "queue_wait_seconds_by_tier": {tier: _percentiles(waits) for tier, waits in sorted(waits_by_tier.items())},
+        "stage_seconds_per_job": {stage: timer.seconds.get(stage, 0.0) / jobs_run for stage in _STAGES},
+        "batch_sizes": {str(size): count for size, count in sorted(tracker.batch_sizes.items())},
+    }
+
+
+def _regressions(results: list[dict[str, Any]], baseline_path: Path, tolerance: float) -> list[str]:
+    baseline = {row["policy"]: row for row in json.loads(baseline_path.read_text())["results"]}
+    problems: list[str] = []
+    for row in results:
+        base = baseline.get(row["policy"])
+        if base is None:
+            continue
+        if row["throughput_jobs_per_second"] < base["throughput_jobs_per_second"] * (1 - tolerance):
+            problems.append(
+                f"{row['policy']}: throughput {row['throughput_jobs_per_second']:.3f}/s "
+                f"< baseline {base['throughput_jobs_per_second']:.3f}/s"
+            )
+        p95, base_p95 = row["latency_seconds"]["p95"], base["latency_seconds"]["p95"]
+        if p95 is not None and base_p95 is not None and p95 > base_p95 * (1 + tolerance):
+            problems.append(f"{row['policy']}: p95 latency {p95:.3f}s > baseline {base_p95:.3f}s")
+    return problems
+
+
+def _parse_size(value: str) -> tuple[int, int]:
+    width, _, height = value.partition("x")
+    return int(width), int(height)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--trace", type=Path, default=None, help="JSONL job trace; default is a Poisson process.")
+    parser.add_argument("--rate", type=float, default=2.0, help="Poisson arrivals per second.")
+    parser.add_argument("--jobs", type=int, default=100, help="Poisson job count.")
+    parser.add_argument("--bulk-burst", type=int, default=0, help="Extra jobs from one bulk-tier user at t=0.")
+    parser.add_argument("--distinct-inputs", type=int, default=20, help="Input pairs cycled through by jobs.")
+    parser.add_argument("--input-size", type=_parse_size, default=(1080, 1440), help="Synthetic input WIDTHxHEIGHT.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--policies", default="fixed:1,fixed:4,fixed:8,arbitrator")
+    parser.add_argument("--backend", default="stub", choices=["stub", "catvton", "cpu"])
+    # `multi` runs the model in device processes, out of reach of the simulated service time.
+    worker_modes = sorted(mode for mode in WORKER_CLASSES if mode != "multi")
+    parser.add_argument("--worker-mode", default=None, choices=worker_modes, help="Default: WEAVER_WORKER_MODE.")
+    parser.add_argument("--stub-service-time", default="0,0", help="FIXED,PER_JOB seconds per batch (stub only).")
+    parser.add_argument("--redis-url", default=None, help="Scratch redis-server (flushed per run); default fakeredis.")
+    parser.add_argument("--s3", default="moto", choices=["moto", "settings"])
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds to wait for each run to drain.")
+    parser.add_argument("--json", type=Path, default=None, help="Write the results here.")
+    parser.add_argument("--baseline", type=Path, default=None, help="Earlier --json output to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative regression.")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    setup_logging(args.log_level)
+    fixed, per_job = (float(part) for part in args.stub_service_time.split(","))
+    service_time = (fixed, per_job) if args.backend == "stub" else (0.0, 0.0)
+    trace = load_trace(args.trace, args.distinct_inputs) if args.trace else poisson_trace(
+        args.rate, args.jobs, args.distinct_inputs, args.seed
+    )
+    # Backend-dependent defaults (device, pool, CPU preset) follow the benchmarked backend.
+    os.environ["INFERENCE_BACKEND"] = args.backend
+    base_settings = load_settings()
+    if args.bulk_burst > 0:
+        burst = bulk_burst(args.bulk_burst, base_settings.queue_tiers[-1], args.distinct_inputs, len(trace))
+        trace = sorted(trace + burst, key=lambda job: job.at)
+    settings = dataclasses.replace(
+        base_settings,
+        inference_backend=args.backend,
+        worker_mode=args.worker_mode or base_settings.worker_mode,
+        dedup_enabled=False,
+        ready_file=None,
+    )
+    connect_factory = _RedisFactory(args.redis_url)
+
+    with contextlib.ExitStack() as stack:
+        if args.s3 == "moto":
+            try:
+                import boto3
+                from moto import mock_aws  # type: ignore
+            except ImportError as exc:
+                raise SystemExit("The in-process S3 needs `moto`; pip install -r weaver_service/requirements-bench.txt") from exc
+            stack.enter_context(mock_aws())
+            # Outside `development` the store talks to "AWS", which moto intercepts.
+            settings = dataclasses.replace(settings, ENV="production", s3_access_key_id="bench", s3_secret_access_key="bench")
+            boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=settings.s3_bucket)
+
+        store = S3ImageStore(settings)
+        _upload_inputs(store, trace, args.input_size)
+        model = CatVTONModel(settings)
+        model.load()
+        if settings.worker_mode != "continuous":
+            model.warmup()
+        encoder = ResultEncoder(settings)
+
+        results = []
+        for index, policy in enumerate(args.policies.split(",")):
+            run_settings = dataclasses.replace(
+                settings,
+                redis_queue=f"bench:{index}:weaver_jobs",
+                redis_events_channel=f"bench:{index}:job_done",
+            )
+            row = run_policy(
+                settings=run_settings,
+                policy=policy.strip(),
+                trace=trace,
+                connect=connect_factory.new(),
+                store=store,
+                model=model,
+                encoder=encoder,
+                service_time=service_time,
+                timeout=args.timeout,
+            )
+            results.append(row)
+            latency = row["latency_seconds"]
+            print(
+                f"{row['policy']:<12} {row['completed']:>4}/{row['jobs']:<4} "
+                f"{row['throughput_jobs_per_second']:>7.2f} jobs/s  "
+                f"p50 {latency['p50'] or 0:.2f}s  p95 {latency['p95'] or 0:.2f}s  p99 {latency['p99'] or 0:.2f}s  "
+                f"batches {row['batch_sizes']}" + ("  TIMED OUT" if row["timed_out"] else "")
+            )
+            stages = "  ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in row["stage_seconds_per_job"].items())
+            print(f"{'':<12} per job: {stages}")
+            for tier, waits in row["queue_wait_seconds_by_tier"].items():
+                print(f"{'':<12} {tier} queue wait: p50 {waits['p50'] or 0:.2f}s  p95 {waits['p95'] or 0:.2f}s")
+        encoder.close()
+
+    output = {
+        "config": {
+            "trace": str(args.trace) if args.trace else None,
+            "rate": None if args.trace else args.rate,
+            "jobs": len(trace),
+            "backend": settings.inference_backend,
+            "worker_mode": settings.worker_mode,
+            "queue_backend": settings.queue_backend,
+            "stub_service_time": list(service_time),
+            "batch_size_ladder": list(settings.batch_size_ladder),
+        },
+        "results": results,
+    }
+    if args.json is not None:
+        args.json.write_text(json.dumps(output, indent=2))
+    if args.baseline is not None:
+        problems = _regressions(results, args.baseline, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
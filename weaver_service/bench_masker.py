@@ -0,0 +1,141 @@
+"""
+Micro-benchmark: the vendored `AutoMasker` one image at a time against `AutoMasker.batch`.
+
+    python -m weaver_service.bench_masker --densepose-ckpt Models/DensePose --schp-ckpt Models/SCHP \
+        --images 'samples/*.jpg' --batch-sizes 1,4,8 --device cuda
+
+Needs the masker's own dependencies (detectron2 + DensePose, torchvision) and its checkpoints.
+Without `--images`, inputs are synthetic, which times the code paths but produces meaningless
+masks. For every batch size it reports milliseconds per image for:
+
+- the SCHP parsers alone (one call per image and head, against `SCHP.parse_batch`);
+- mask assembly alone (`cloth_agnostic_mask` against `cloth_agnostic_mask_array`);
+- the whole masker (calling it per image, against `AutoMasker.batch`).
+
+It also reports the fraction of pixels where the label maps and masks of the two paths disagree.
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+
+# The vendored masker imports its siblings as `model.*`.
+_VENDOR_ROOT = Path(__file__).resolve().parent / "vendor" / "catvton"
+
+
+def _synthetic(size: tuple[int, int], seed: int) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    w, h = size
+    base = np.linspace(0, 255, w, dtype=np.float32)[None, :, None] + np.linspace(0, 64, h, dtype=np.float32)[:, None, None]
+    pixels = np.clip(base + rng.normal(0, 24, (h, w, 3)), 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels)
+
+
+def _sync(device: str) -> None:
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+def _time(fn, device: str, repeats: int, per: int) -> float:
+    fn()
+    _sync(device)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    _sync(device)
+    return (time.perf_counter() - started) / repeats / per * 1000
+
+
+def _mismatch(reference: list[np.ndarray], batched: list[np.ndarray]) -> float:
+    return max(float((np.asarray(r) != np.asarray(b)).mean()) for r, b in zip(reference, batched))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--densepose-ckpt", default="Models/DensePose")
+    parser.add_argument("--schp-ckpt", default="Models/SCHP")
+    parser.add_argument("--images", default=None, help="glob of person photos; synthetic when omitted")
+    parser.add_argument("--mask-type", default="upper", choices=["upper", "lower", "overall", "inner", "outer"])
+    parser.add_argument("--batch-sizes", default="1,4,8")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--width", type=int, default=768)
+    parser.add_argument("--height", type=int, default=1024)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(_VENDOR_ROOT))
+    from model.cloth_masker import AutoMasker, cloth_agnostic_mask_array  # type: ignore
+
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    if args.images:
+        paths = sorted(glob.glob(args.images))
+        if not paths:
+            parser.error(f"no images match {args.images}")
+        images = [Image.open(paths[i % len(paths)]).convert("RGB") for i in range(max(batch_sizes))]
+    else:
+        images = [_synthetic((args.width, args.height), i) for i in range(max(batch_sizes))]
+
+    masker = AutoMasker(densepose_ckpt=args.densepose_ckpt, schp_ckpt=args.schp_ckpt, device=args.device)
+    schp = (masker.schp_processor_atr, masker.schp_processor_lip)
+
+    def legacy_parse(batch):
+        with torch.no_grad():
+            return [[np.array(head(image)) for image in batch] for head in schp]
+
+    def legacy_masks(parsed):
+        return [
+            np.array(AutoMasker.cloth_agnostic_mask(
+                Image.fromarray(densepose), Image.fromarray(lip), Image.fromarray(atr), part=args.mask_type))
+            for densepose, lip, atr in zip(parsed["densepose"], parsed["schp_lip"], parsed["schp_atr"])
+        ]
+
+    def batched_masks(parsed):
+        return [
+            cloth_agnostic_mask_array(densepose, lip, atr, part=args.mask_type)
+            for densepose, lip, atr in zip(parsed["densepose"], parsed["schp_lip"], parsed["schp_atr"])
+        ]
+
+    def legacy_masker(batch):
+        with torch.no_grad():
+            return [np.array(masker(image, mask_type=args.mask_type)["mask"]) for image in batch]
+
+    print(f"device={args.device} mask={args.mask_type} images={'synthetic' if not args.images else args.images}")
+    print(
+        f"{'batch':>5} {'schp ms':>8} {'batched':>8} {'mask ms':>8} {'tables':>8} "
+        f"{'total ms':>9} {'batched':>8} {'speedup':>8} {'label diff':>11} {'mask diff':>10}"
+    )
+    for b in batch_sizes:
+        batch = images[:b]
+        parsed = masker.preprocess_batch(batch)
+        schp_ms = _time(lambda: legacy_parse(batch), args.device, args.repeats, b)
+        schp_batched_ms = _time(
+            lambda: [head.parse_batch(batch) for head in schp], args.device, args.repeats, b
+        )
+        mask_ms = _time(lambda: legacy_masks(parsed), args.device, args.repeats, b)
+        tables_ms = _time(lambda: batched_masks(parsed), args.device, args.repeats, b)
+        total_ms = _time(lambda: legacy_masker(batch), args.device, args.repeats, b)
+        total_batched_ms = _time(lambda: masker.batch(batch, args.mask_type), args.device, args.repeats, b)
+
+        reference_labels = legacy_parse(batch)
+        label_diff = max(
+            _mismatch(reference_labels[0], parsed["schp_atr"]),
+            _mismatch(reference_labels[1], parsed["schp_lip"]),
+        )
+        mask_diff = _mismatch(legacy_masker(batch), [np.array(m) for m in masker.batch(batch, args.mask_type)])
+        print(
+            f"{b:>5} {schp_ms:>8.1f} {schp_batched_ms:>8.1f} {mask_ms:>8.1f} {tables_ms:>8.1f} "
+            f"{total_ms:>9.1f} {total_batched_ms:>8.1f} {total_ms / total_batched_ms:>7.2f}x "
+            f"{label_diff:>11.2e} {mask_diff:>10.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Micro-benchmark: per-image preprocessing (resize, `prepare_image`, `torch.cat`, `.to(device)`)
+against `BatchPreprocessor` at several batch sizes.
+
+    python -m weaver_service.bench_preprocess --batch-sizes 1,4,8,16 --device cuda
+
+Inputs are synthetic phone-sized photos, so no model weights are needed. Reports the mean
+milliseconds per batch (device work is synchronised before the clock stops) and checks that
+both paths produce the same tensor.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from weaver_service.preprocess import BatchPreprocessor
+from weaver_service.vendor.catvton.utils import init_weight_dtype, prepare_image, resize_and_crop, resize_and_padding
+
+
+def _synthetic(size: tuple[int, int], seed: int) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    # Smooth gradients plus noise resample more like photos than pure noise does.
+    w, h = size
+    base = np.linspace(0, 255, w, dtype=np.float32)[None, :, None] + np.linspace(0, 64, h, dtype=np.float32)[:, None, None]
+    pixels = np.clip(base + rng.normal(0, 24, (h, w, 3)), 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels)
+
+
+def _legacy(person_imgs, outfit_imgs, size, device, dtype):
+    person_inputs = [resize_and_crop(img.convert("RGB"), size) for img in person_imgs]
+    cloth_inputs = [resize_and_padding(img.convert("RGB"), size) for img in outfit_imgs]
+    person = torch.cat([prepare_image(img) for img in person_inputs], dim=0).to(device, dtype=dtype)
+    cloth = torch.cat([prepare_image(img) for img in cloth_inputs], dim=0).to(device, dtype=dtype)
+    return person, cloth
+
+
+def _sync(device: str) -> None:
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+def _time(fn, device: str, repeats: int) -> float:
+    fn()
+    _sync(device)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    _sync(device)
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--batch-sizes", default="1,4,8,16")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--precision", default="bf16", choices=["no", "fp16", "bf16"])
+    parser.add_argument("--width", type=int, default=768)
+    parser.add_argument("--height", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    size = (args.width, args.height)
+    dtype = init_weight_dtype(args.precision)
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    persons = [_synthetic((3024, 4032), i) for i in range(max(batch_sizes))]
+    outfits = [_synthetic((1500, 1500), 1000 + i) for i in range(max(batch_sizes))]
+    serial = BatchPreprocessor(size, args.device, dtype, resize_and_crop, resize_and_padding, workers=0)
+    pooled = BatchPreprocessor(size, args.device, dtype, resize_and_crop, resize_and_padding, workers=args.workers)
+
+    print(f"device={args.device} dtype={args.precision} size={args.width}x{args.height} workers={args.workers}")
+    print(f"{'batch':>5} {'legacy ms':>10} {'batched ms':>11} {'pooled ms':>10} {'speedup':>8} {'max |diff|':>11}")
+    for b in batch_sizes:
+        p, o = persons[:b], outfits[:b]
+        legacy_ms = _time(lambda: _legacy(p, o, size, args.device, dtype), args.device, args.repeats)
+        serial_ms = _time(lambda: serial(p, o), args.device, args.repeats)
+        pooled_ms = _time(lambda: pooled(p, o), args.device, args.repeats)
+        reference = _legacy(p, o, size, args.device, dtype)
+        batch = pooled(p, o)
+        diff = max(
+            (batch.person.float() - reference[0].float()).abs().max().item(),
+            (batch.cloth.float() - reference[1].float()).abs().max().item(),
+        )
+        print(f"{b:>5} {legacy_ms:>10.1f} {serial_ms:>11.1f} {pooled_ms:>10.1f} {legacy_ms / pooled_ms:>7.2f}x {diff:>11.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Offline speed/quality sweep for the Weaver's denoising settings.
+
+Runs every combination of the swept settings over a fixed set of person/garment pairs and
+compares each output against a reference run (DDIM, 50 steps by default):
+
+    python -m weaver_service.bench_quality --person-dir bench/person --cloth-dir bench/cloth \
+        --schedulers ddim,dpmpp_2m,unipc,euler_a --steps 10,15,20,25,30 \
+        --cfg-cutoffs 1.0,0.6,0.4 --uncond-reuse 1,2 --json sweep.json
+
+    python -m weaver_service.bench_quality --person-dir bench/person --cloth-dir bench/cloth \
+        --schedulers ddim --steps 50 \
+        --attention default,fused,efficient,merge2,channels_last,fused+efficient+merge2+channels_last
+
+Pairs are matched by sorted file name. Model, precision and size come from the usual
+environment (`.env`); the latent cache is disabled so every run pays the same VAE encode.
+Reported per configuration: mean seconds per image, mean PSNR (dB) and mean SSIM against the
+reference. Pick the cheapest row whose PSNR/SSIM you accept, then set it in the environment.
+
+`--attention` variants join options with `+`: `fused` (ATTENTION_FUSED_QKV), a kernel name
+(ATTENTION_KERNEL), `merge<N>` (ATTENTION_GARMENT_MERGE) and `channels_last`
+(UNET_CHANNELS_LAST); `default` is none of them. The reference and every variant set these
+explicitly, so the environment's ATTENTION_* settings do not apply here.
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import itertools
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from common.config import Settings, load_settings
+from .catvton import CatVTONModel
+
+# Mirrors `SDPA_KERNELS` in the vendored attn_processor, which needs torch to import.
+_SDPA_KERNELS = ("auto", "flash", "efficient", "cudnn", "math")
+
+_IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+@dataclass(frozen=True)
+class BenchConfig:
+    scheduler: str
+    steps: int
+    cfg_cutoff: float = 1.0
+    uncond_reuse: int = 1
+    attention: str = "default"
+
+    def label(self) -> str:
+        label = f"{self.scheduler}/{self.steps}"
+        if self.cfg_cutoff < 1.0:
+            label += f"/cfg{self.cfg_cutoff:g}"
+        if self.uncond_reuse > 1:
+            label += f"/reuse{self.uncond_reuse}"
+        if self.attention != "default":
+            label += f"/{self.attention}"
+        return label
+
+    def apply(self, settings: Settings) -> Settings:
+        return dataclasses.replace(
+            settings,
+            scheduler=self.scheduler,
+            num_inference_steps=self.steps,
+            cfg_cutoff_fraction=self.cfg_cutoff,
+            cfg_uncond_reuse_interval=self.uncond_reuse,
+            **attention_overrides(self.attention),
+        )
+
+
+def attention_overrides(variant: str) -> dict[str, object]:
+    """Settings for an `--attention` variant such as `fused+efficient+merge2`."""
+    overrides: dict[str, object] = {
+        "attention_fused_qkv": False,
+        "attention_kernel": "auto",
+        "attention_garment_merge": 0,
+        "unet_channels_last": False,
+    }
+    for option in variant.split("+"):
+        if option == "default":
+            continue
+        if option == "fused":
+            overrides["attention_fused_qkv"] = True
+        elif option in _SDPA_KERNELS:
+            overrides["attention_kernel"] = option
+        elif option.startswith("merge") and option[len("merge") :].isdigit():
+            overrides["attention_garment_merge"] = int(option[len("merge") :])
+        elif option == "channels_last":
+            overrides["unet_channels_last"] = True
+        else:
+            raise ValueError(f"Unknown attention option {option!r} in {variant!r}")
+    return overrides
+
+
+def psnr(a: np.ndarray, b: np.ndarray) -> float:
+    mse = float(np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2))
+    return float("inf") if mse == 0 else 10 * np.log10(255.0**2 / mse)
+
+
+def _box_mean(x: np.ndarray, k: int) -> np.ndarray:
+    c = np.pad(x, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    return (c[k:, k:] - c[:-k, k:] - c[k:, :-k] + c[:-k, :-k]) / (k * k)
+
+
+def ssim(a: np.ndarray, b: np.ndarray, window: int = 7) -> float:
+    """Mean SSIM of the luminance channel over a `window` x `window` box filter."""
+    weights = np.array([0.299, 0.587, 0.114])
+    x = a.astype(np.float64) @ weights
+    y = b.astype(np.float64) @ weights
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mu_x, mu_y = _box_mean(x, window), _box_mean(y, window)
+    var_x = _box_mean(x * x, window) - mu_x**2
+    var_y = _box_mean(y * y, window) - mu_y**2
+    cov = _box_mean(x * y, window) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * cov + c2)) / ((mu_x**2 + mu_y**2 + c1) * (var_x + var_y + c2))
+    return float(ssim_map.mean())
+
+
+def _load_pairs(person_dir: Path, cloth_dir: Path, limit: int | None) -> list[tuple[str, Image.Image, Image.Image]]:
+    persons = sorted(p for p in person_dir.iterdir() if p.suffix.lower() in _IMAGE_SUFFIXES)
+    cloths = sorted(p for p in cloth_dir.iterdir() if p.suffix.lower() in _IMAGE_SUFFIXES)
+    if not persons or len(persons) != len(cloths):
+        raise SystemExit(f"Need the same non-zero number of images in {person_dir} and {cloth_dir}")
+    pairs = [(p.stem, Image.open(p).convert("RGB"), Image.open(c).convert("RGB")) for p, c in zip(persons, cloths)]
+    return pairs[:limit] if limit else pairs
+
+
+def _reseed(seed: int) -> None:
+    # VAE posterior sampling draws from the global RNG; pin it so runs differ only by config.
+    try:
+        import torch  # type: ignore
+    except ImportError:
+        return
+    torch.manual_seed(seed)
+
+
+def _run(
+    model: CatVTONModel,
+    settings: Settings,
+    config: BenchConfig,
+    pairs: list[tuple[str, Image.Image, Image.Image]],
+    seed: int,
+) -> tuple[list[np.ndarray], float]:
+    model.settings = config.apply(settings)
+    model.set_scheduler(config.scheduler)
+    model.configure_attention()
+    outputs: list[np.ndarray] = []
+    elapsed = 0.0
+    for _, person, cloth in pairs:
+        _reseed(seed)
+        started = time.perf_counter()
+        result = model.infer(person, cloth)
+        elapsed += time.perf_counter() - started
+        outputs.append(np.asarray(result.convert("RGB")))
+    return outputs, elapsed / len(pairs)
+
+
+def _parse_list(value: str, cast=str) -> list:
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def build_configs(args: argparse.Namespace) -> list[BenchConfig]:
+    return [
+        BenchConfig(
+            scheduler=scheduler, steps=steps, cfg_cutoff=cfg_cutoff, uncond_reuse=uncond_reuse, attention=attention
+        )
+        for scheduler, steps, cfg_cutoff, uncond_reuse, attention in itertools.product(
+            _parse_list(args.schedulers),
+            _parse_list(args.steps, int),
+            _parse_list(args.cfg_cutoffs, float),
+            _parse_list(args.uncond_reuse, int),
+            _parse_list(args.attention),
+        )
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--person-dir", type=Path, required=True)
+    parser.add_argument("--cloth-dir", type=Path, required=True)
+    parser.add_argument("--schedulers", default="ddim,dpmpp_2m,unipc,euler_a")
+    parser.add_argument("--steps", default="10,15,20,25,30")
+    parser.add_argument("--cfg-cutoffs", default="1.0", help="Fractions of steps that apply CFG.")
+    parser.add_argument("--uncond-reuse", default="1", help="Unconditional-branch reuse intervals.")
+    parser.add_argument("--attention", default="default", help="UNet attention variants, e.g. fused+efficient.")
+    parser.add_argument("--reference-scheduler", default="ddim")
+    parser.add_argument("--reference-steps", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--limit", type=int, default=None, help="Use only the first N pairs.")
+    parser.add_argument("--json", type=Path, default=None, help="Also write the results here.")
+    parser.add_argument("--save-dir", type=Path, default=None, help="Save every output image here.")
+    args = parser.parse_args()
+    configs = build_configs(args)
+    for config in configs:
+        try:
+            attention_overrides(config.attention)
+        except ValueError as exc:
+            parser.error(str(exc))
+
+    settings = dataclasses.replace(load_settings(), seed=args.seed, latent_cache_max_bytes=0, latent_cache_dir=None)
+    pairs = _load_pairs(args.person_dir, args.cloth_dir, args.limit)
+    model = CatVTONModel(settings)
+    model.load()
+
+    reference_config = BenchConfig(scheduler=args.reference_scheduler, steps=args.reference_steps)
+    # Warm-up (kernel selection, allocator growth) so the first timed config is not penalised.
+    _run(model, settings, reference_config, pairs[:1], args.seed)
+    reference, reference_seconds = _run(model, settings, reference_config, pairs, args.seed)
+
+    rows = [
+        {
+            "config": reference_config.label(),
+            **dataclasses.asdict(reference_config),
+            "seconds_per_image": reference_seconds,
+            "psnr": float("inf"),
+            "ssim": 1.0,
+        }
+    ]
+    for config in configs:
+        outputs, seconds = _run(model, settings, config, pairs, args.seed)
+        if args.save_dir is not None:
+            target = args.save_dir / config.label().replace("/", "_")
+            target.mkdir(parents=True, exist_ok=True)
+            for (name, _, _), output in zip(pairs, outputs):
+                Image.fromarray(output).save(target / f"{name}.png")
+        rows.append(
+            {
+                "config": config.label(),
+                **dataclasses.asdict(config),
+                "seconds_per_image": seconds,
+                "psnr": float(np.mean([psnr(ref, out) for ref, out in zip(reference, outputs)])),
+                "ssim": float(np.mean([ssim(ref, out) for ref, out in zip(reference, outputs)])),
+            }
+        )
+
+    print(f"{'config':<48} {'s/img':>8} {'speedup':>8} {'PSNR':>8} {'SSIM':>7}")
+    for row in rows:
+        speedup = reference_seconds / row["seconds_per_image"] if row["seconds_per_image"] else float("inf")
+        print(f"{row['config']:<48} {row['seconds_per_image']:>8.3f} {speedup:>7.2f}x {row['psnr']:>8.2f} {row['ssim']:>7.4f}")
+    if args.json is not None:
+        args.json.write_text(json.dumps({"pairs": len(pairs), "results": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from common.config import Settings
+from common.log_utils import get_logger
+
+# COMPILE_MODE values other than "off"; all but "default" are torch.compile modes.
+# "reduce-overhead" additionally captures each bucket as a CUDA graph.
+COMPILE_MODES = ("default", "reduce-overhead", "max-autotune")
+# Calls needed before a bucket runs at steady state: compile, CUDA-graph warmup, capture.
+_WARMUP_CALLS = 3
+
+
+def unet_row_buckets(settings: Settings) -> tuple[int, ...]:
+    """
+    UNet batch sizes to compile: every `BATCH_SIZE_LADDER` entry times the row multiplicity
+    of each denoising step (two rows per job on steps that run the unconditional branch).
+    """
+    from weaver_service.vendor.catvton.model.pipeline import guidance_schedule  # type: ignore
+
+    schedule = guidance_schedule(
+        settings.num_inference_steps,
+        settings.guidance_scale,
+        settings.cfg_cutoff_fraction,
+        settings.cfg_uncond_reuse_interval,
+    )
+    multiplicities = {2 if run_uncond else 1 for _, run_uncond in schedule} or {1}
+    return tuple(sorted({size * rows for size in settings.batch_size_ladder for rows in multiplicities}))
+
+
+class BucketedUNet:
+    """
+    A `torch.compile`d UNet that only ever runs at a fixed set of batch sizes.
+
+    Each call pads the batch (repeating its last row) up to the smallest bucket that fits and
+    slices the padding off the output; batches above the largest bucket run in bucket-sized
+    chunks. Timesteps are always passed per row, so the batched pipeline (one scalar timestep)
+    and the continuous engine (one per row) hit the same graphs. With static shapes per bucket
+    nothing recompiles after `warmup`, however the arbitrator moves the batch size. `shapes`
+    is how many row shapes (image sizes, see `PROFILE_SIZES`) each bucket is compiled for.
+
+    Drop-in for the pipeline's `unet` attribute: other attributes (`config`, `dtype`, ...) are
+    read from the wrapped module, and calls must use `return_dict=False`.
+    """
+
+    def __init__(self, unet: Any, buckets: tuple[int, ...], mode: str, shapes: int = 1) -> None:
+        import torch  # type: ignore
+
+        if mode not in COMPILE_MODES:
+            raise ValueError(f"Unknown COMPILE_MODE {mode!r}; expected off or one of {COMPILE_MODES}")
+        if not buckets:
+            raise ValueError("BucketedUNet needs at least one bucket")
+        self._torch = torch
+        self.eager = unet
+        self.buckets = tuple(sorted(set(buckets)))
+        self._mode = mode
+        self._compiled = torch.compile(unet, mode=None if mode == "default" else mode, dynamic=False)
+        # One specialised graph per bucket and shape; keep dynamo from giving up and falling back to eager.
+        dynamo_config = torch._dynamo.config
+        limit_name = "recompile_limit" if hasattr(dynamo_config, "recompile_limit") else "cache_size_limit"
+        setattr(dynamo_config, limit_name, max(getattr(dynamo_config, limit_name), 2 * len(self.buckets) * shapes))
+        self._logger = get_logger("weaver.buckets")
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "eager":
+            raise AttributeError(name)
+        return getattr(self.eager, name)
+
+    def bucket_for(self, rows: int) -> int:
+        return next((bucket for bucket in self.buckets if bucket >= rows), self.buckets[-1])
+
+    def __call__(
+        self,
+        sample: Any,
+        timestep: Any,
+        encoder_hidden_states: Any = None,
+        return_dict: bool = False,
+        **kwargs: Any,
+    ) -> tuple[Any]:
+        torch = self._torch
+        rows = sample.shape[0]
+        timestep = torch.as_tensor(timestep, device=sample.device).reshape(-1)
+        if timestep.numel() == 1:
+            timestep = timestep.expand(rows)
+
+        largest = self.buckets[-1]
+        if rows > largest:
+            chunks = [
+                self(sample[start : start + largest], timestep[start : start + largest], encoder_hidden_states, **kwargs)[0]
+                for start in range(0, rows, largest)
+            ]
+            return (torch.cat(chunks),)
+
+        padding = self.bucket_for(rows) - rows
+        if padding:
+            sample = torch.cat([sample, sample[-1:].expand(padding, *sample.shape[1:])])
+            timestep = torch.cat([timestep, timestep[-1:].expand(padding)])
+        if self._mode == "reduce-overhead":
+            torch.compiler.cudagraph_mark_step_begin()
+        # Guards include strides: an expanded (stride-0) timestep would compile a second graph.
+        noise_pred = self._compiled(
+            sample.contiguous(),
+            timestep.contiguous(),
+            encoder_hidden_states=encoder_hidden_states,
+            return_dict=False,
+            **kwargs,
+        )[0]
+        # CUDA-graph outputs are overwritten by the next replay, and the pipeline keeps the
+        # unconditional prediction across steps.
+        return (noise_pred[:rows].clone(),)
+
+    def warmup(
+        self,
+        sample_shape: tuple[int, ...],
+        dtype: Any,
+        device: str,
+        timestep: Any,
+        repeats: int = 3,
+    ) -> list[dict[str, float]]:
+        """
+        Compile (and capture) every bucket, then time it against the eager UNet.
+
+        `sample_shape` is one row of UNet input without the batch dimension. Logs and returns
+        the warmup seconds and the steady-state milliseconds per call of both paths per bucket.
+        """
+        torch = self._torch
+        results: list[dict[str, float]] = []
+        with torch.no_grad():
+            for bucket in self.buckets:
+                sample = torch.randn((bucket, *sample_shape), dtype=dtype, device=device)
+                timesteps = torch.as_tensor(timestep, device=device).reshape(-1)[:1].expand(bucket)
+
+                def compiled() -> Any:
+                    return self(sample, timesteps)
+
+                def eager() -> Any:
+                    return self.eager(sample, timesteps, encoder_hidden_states=None, return_dict=False)
+
+                warmup_seconds = self._time(compiled, device, _WARMUP_CALLS) * _WARMUP_CALLS
+                compiled_ms = self._time(compiled, device, repeats) * 1000
+                self._time(eager, device, 1)
+                eager_ms = self._time(eager, device, repeats) * 1000
+                results.append(
+                    {
+                        "rows": bucket,
+                        "warmup_seconds": warmup_seconds,
+                        "eager_ms": eager_ms,
+                        "compiled_ms": compiled_ms,
+                        "speedup": eager_ms / compiled_ms if compiled_ms else float("inf"),
+                    }
+                )
+                self._logger.info(
+                    "UNet bucket %s rows (%s): warmup %.1fs, eager %.1f ms, compiled %.1f ms per step (%.2fx)",
+                    bucket,
+                    self._mode,
+                    warmup_seconds,
+                    eager_ms,
+                    compiled_ms,
+                    results[-1]["speedup"],
+                )
+        return results
+
+    def _time(self, fn: Any, device: str, calls: int) -> float:
+        """Mean seconds per call of `fn`, with device work synchronised before the clock stops."""
+        synchronize = self._torch.cuda.synchronize if str(device).startswith("cuda") else (lambda: None)
+        synchronize()
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        synchronize()
+        return (time.perf_counter() - started) / calls
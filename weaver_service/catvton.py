@@ -1,6 +1,10 @@
 from __future__ import annotations
 
+import copy
+import functools
 import os
+import time
+from concurrent.futures import Future
 from dataclasses import dataclass
 from typing import Any
 
@@ -8,6 +12,18 @@ from PIL import Image
 from huggingface_hub import snapshot_download
 
 from common.config import Settings
+from .cpu import configure_threads, optimize_pipeline
+from .latent_cache import LatentCache, latent_cache_key
+from .memory import MemoryBudget, is_out_of_memory
+from .metrics import StageClock, observe
+from .preprocess import BatchPreprocessor
+from .preview import PreviewSink
+from .profiles import InferenceParams, batch_seeds, default_params
+
+
+def _offset_preview(preview: PreviewSink, offset: int, step: int, total_steps: int, pixels: Any) -> None:
+    """Pipeline preview callback for a sub-batch starting at row `offset` of the whole batch."""
+    preview(step, total_steps, pixels, offset)
 
 
 @dataclass
@@ -16,51 +32,199 @@ class CatVTONModel:
 
     def __post_init__(self) -> None:
         self._pipeline: Any | None = None
-        self._prepare_image = None
-        self._resize_and_crop = None
-        self._resize_and_padding = None
+        self._preprocessor: BatchPreprocessor | None = None
         self._torch: Any | None = None
         self._weight_dtype: Any | None = None
         self._is_stub = self.settings.inference_backend == "stub"
+        self._latent_cache: LatentCache | None = None
+        self._engine: Any | None = None
+        self._memory: MemoryBudget | None = None
+        # Seconds spent in each phase of the last `load()`, in order.
+        self.load_timings: dict[str, float] = {}
 
     def load(self) -> None:
         if self._is_stub:
             return
 
+        timings: dict[str, float] = {}
+        started = time.perf_counter()
         try:
             import torch  # type: ignore
             from weaver_service.vendor.catvton.model.pipeline import CatVTONPix2PixPipeline  # type: ignore
-            from weaver_service.vendor.catvton.utils import init_weight_dtype, prepare_image, resize_and_crop, resize_and_padding  # type: ignore
+            from weaver_service.vendor.catvton.utils import init_weight_dtype, resize_and_crop, resize_and_padding  # type: ignore
         except ImportError as exc:
             raise RuntimeError(
-                "INFERENCE_BACKEND=catvton requires torch + CatVTON source code vendored under "
+                f"INFERENCE_BACKEND={self.settings.inference_backend} requires torch + CatVTON source code vendored under "
                 "`weaver_service/vendor/catvton` (model/pipeline.py and utils.py)."
             ) from exc
 
+        timings["imports"] = time.perf_counter() - started
+
         if self.settings.allow_tf32 and torch.cuda.is_available():
             torch.backends.cuda.matmul.allow_tf32 = True
             torch.backends.cudnn.allow_tf32 = True
 
-        model_path = self._resolve_model_path()
+        cpu_backend = self.settings.inference_backend == "cpu"
+        if cpu_backend:
+            if torch.device(self.settings.device).type != "cpu":
+                raise RuntimeError(f"INFERENCE_BACKEND=cpu runs on DEVICE=cpu, not {self.settings.device!r}")
+            configure_threads(self.settings)
+
         self._torch = torch
         self._weight_dtype = init_weight_dtype(self.settings.mixed_precision)
-        self._prepare_image = prepare_image
-        self._resize_and_crop = resize_and_crop
-        self._resize_and_padding = resize_and_padding
-        self._pipeline = CatVTONPix2PixPipeline(
-            base_ckpt=self.settings.catvton_base_model_path,
-            attn_ckpt=model_path,
-            attn_ckpt_version=self.settings.catvton_model_variant,
-            weight_dtype=self._weight_dtype,
-            use_tf32=self.settings.allow_tf32,
-            device=self.settings.device,
-            skip_safety_check=True,
+        bundle_path = self.settings.catvton_bundle_path
+        if bundle_path and os.path.isfile(bundle_path):
+            phase = time.perf_counter()
+            self._check_bundle(bundle_path, CatVTONPix2PixPipeline.read_bundle_metadata(bundle_path))
+            self._pipeline = CatVTONPix2PixPipeline.from_bundle(
+                bundle_path,
+                device=self.settings.device,
+                use_tf32=self.settings.allow_tf32,
+                scheduler=self.settings.scheduler,
+            )
+            timings["bundle"] = time.perf_counter() - phase
+        else:
+            phase = time.perf_counter()
+            model_path = self._resolve_model_path()
+            timings["resolve"] = time.perf_counter() - phase
+            phase = time.perf_counter()
+            self._pipeline = self._build_pipeline(CatVTONPix2PixPipeline, model_path, self.settings.device)
+            timings["pipeline"] = time.perf_counter() - phase
+
+        phase = time.perf_counter()
+        self.configure_attention()
+        if cpu_backend:
+            optimize_pipeline(self._pipeline, self.settings)
+        self._preprocessor = BatchPreprocessor(
+            (self.settings.width, self.settings.height),
+            self.settings.device,
+            self._weight_dtype,
+            resize_and_crop,
+            resize_and_padding,
+            workers=self.settings.preprocess_workers,
+        )
+        self._latent_cache = LatentCache.from_settings(self.settings)
+        self._pipeline.latent_cache = self._latent_cache
+        if self.settings.vae_slicing:
+            self._pipeline.enable_vae_slicing()
+        if self.settings.vae_tiling:
+            self._pipeline.enable_vae_tiling()
+        self._memory = MemoryBudget(self.settings)
+        if self.settings.compile_mode != "off":
+            from .buckets import BucketedUNet, unet_row_buckets
+
+            self._pipeline.unet = BucketedUNet(
+                self._pipeline.unet,
+                unet_row_buckets(self.settings),
+                self.settings.compile_mode,
+                shapes=len(self.settings.profile_sizes),
+            )
+        timings["runtime"] = time.perf_counter() - phase
+        self.load_timings = timings
+
+    def warmup(self) -> None:
+        """
+        Compile every UNet shape bucket before the first job (`COMPILE_MODE`), then calibrate
+        the batch memory budget with the runtime that will serve jobs.
+
+        Call from the thread that will run inference: CUDA graphs are captured per thread.
+        The continuous engine warms up on its own thread in `start_engine` instead.
+        """
+        if self._pipeline is None:
+            return
+        self._compile_buckets()
+        self._memory.calibrate(self._calibration_run)
+
+    def configure_attention(self) -> None:
+        """
+        Apply the UNet attention and layout settings (`ATTENTION_*`, `UNET_CHANNELS_LAST`) to the
+        loaded pipeline. `load()` calls it; call it again after swapping `settings` to switch.
+        """
+        if self._pipeline is None:
+            return
+        torch = self._torch
+        self._pipeline.configure_attention(
+            fused_qkv=self.settings.attention_fused_qkv,
+            kernel=self.settings.attention_kernel,
+            garment_merge=self.settings.attention_garment_merge,
+            latent_size=self._latent_size(),
+        )
+        channels_last = self.settings.unet_channels_last or (
+            self.settings.inference_backend == "cpu" and self.settings.cpu_channels_last
+        )
+        self._pipeline.unet.to(memory_format=torch.channels_last if channels_last else torch.contiguous_format)
+
+    def _latent_size(self, size: tuple[int, int] | None = None) -> tuple[int, int]:
+        """(height, width) of one image's latents (default WIDTH x HEIGHT); the UNet sees two side by side."""
+        width, height = size or (self.settings.width, self.settings.height)
+        scale = 2 ** (len(self._pipeline.vae.config.block_out_channels) - 1)
+        return height // scale, width // scale
+
+    def _compile_buckets(self) -> None:
+        if not hasattr(self._pipeline.unet, "warmup"):
+            return
+        pipeline = self._pipeline
+        unet = pipeline.unet
+        scheduler = copy.deepcopy(pipeline.noise_scheduler)
+        scheduler.set_timesteps(self.settings.num_inference_steps, device=self.settings.device)
+        # One row of UNet input: noisy latents + condition latents, person and garment side by side.
+        for size in self.settings.profile_sizes:
+            height, width = self._latent_size(size)
+            sample_shape = (unet.config.in_channels, height, width * 2)
+            unet.warmup(sample_shape, self._weight_dtype, self.settings.device, scheduler.timesteps[0])
+
+    def _calibration_run(self, jobs: int) -> None:
+        """One denoising step for `jobs` blank jobs: the encode, widest UNet step and decode of a real batch."""
+        torch = self._torch
+        shape = (jobs, 3, self.settings.height, self.settings.width)
+        images = torch.zeros(shape, dtype=self._weight_dtype, device=self.settings.device)
+        self._pipeline(
+            image=images,
+            condition_image=images,
+            num_inference_steps=1,
+            guidance_scale=self.settings.guidance_scale,
+            cfg_cutoff=self.settings.cfg_cutoff_fraction,
         )
 
+    def bake(self, path: str, device: str = "cpu") -> dict[str, str]:
+        """
+        Build the pipeline from the checkpoints (ignoring any existing bundle) and write it to
+        `path` as one pre-cast bundle that `load()` can map directly. Returns the bundle metadata.
+        """
+        try:
+            from weaver_service.vendor.catvton.model.pipeline import CatVTONPix2PixPipeline  # type: ignore
+            from weaver_service.vendor.catvton.utils import init_weight_dtype  # type: ignore
+        except ImportError as exc:
+            raise RuntimeError("Baking requires torch + the vendored CatVTON source code.") from exc
+
+        self._weight_dtype = init_weight_dtype(self.settings.mixed_precision)
+        pipeline = self._build_pipeline(CatVTONPix2PixPipeline, self._resolve_model_path(), device)
+        pipeline.save_bundle(path, self._bundle_identity())
+        return CatVTONPix2PixPipeline.read_bundle_metadata(path)
+
     def infer(self, person_img: Image.Image, outfit_img: Image.Image) -> Image.Image:
         return self.infer_batch([person_img], [outfit_img])[0]
 
-    def infer_batch(self, person_imgs: list[Image.Image], outfit_imgs: list[Image.Image]) -> list[Image.Image]:
+    def infer_batch(
+        self,
+        person_imgs: list[Image.Image],
+        outfit_imgs: list[Image.Image],
+        timings: dict[str, float] | None = None,
+        preview: PreviewSink | None = None,
+        params: list[InferenceParams] | None = None,
+    ) -> list[Image.Image]:
+        """
+        Run one batch through the pipeline. With `preview`, it receives a low-resolution RGB
+        preview of every row every `PREVIEW_INTERVAL_STEPS` steps. Stage times (preprocess, VAE encode, each denoising
+        step, VAE decode) go to the stage metrics and, summed, into `timings` if given.
+
+        `params` gives each row's inference parameters (default: the settings); rows must share
+        a `batch_key`, and each seeded row draws its noise from its own generator, so its result
+        does not depend on its position in the batch or on the other rows.
+
+        Jobs run in sub-batches no larger than the memory budget allows; a sub-batch that still
+        runs out of device memory is split in half and retried, down to single jobs.
+        """
         if self._is_stub:
             return [self._stub_infer(person_img, outfit_img) for person_img, outfit_img in zip(person_imgs, outfit_imgs)]
 
@@ -70,38 +234,195 @@ class CatVTONModel:
             raise ValueError("person_imgs and outfit_imgs must have the same length")
         if not person_imgs:
             return []
+        params = params or [default_params(self.settings)] * len(person_imgs)
+        if len(params) != len(person_imgs):
+            raise ValueError("params must have one entry per row")
+        if len({row.batch_key for row in params}) > 1:
+            raise ValueError("all rows of a batch must share size, steps and guidance scale")
+        batch_params = params[0]
+        seeds = batch_seeds(params)
+
+        clock = StageClock(self.settings.device, timings)
+        size = (batch_params.width, batch_params.height)
+        person_batch, cloth_batch, person_keys, cloth_keys = self._prepare_inputs(person_imgs, outfit_imgs, size)
+        clock.mark("preprocess")
+
+        inputs = (person_batch, cloth_batch, person_keys, cloth_keys)
+        rows = len(person_imgs)
+        # The memory budget is fitted at WIDTH x HEIGHT; other sizes scale with their pixel count.
+        scale = batch_params.width * batch_params.height / (self.settings.width * self.settings.height)
+        max_jobs = self._memory.max_jobs()
+        limit = min(rows, max(1, int(max_jobs / scale)) if max_jobs else rows)
+        results: list[Image.Image] = []
+        for start in range(0, rows, limit):
+            results.extend(
+                self._infer_split(inputs, start, min(start + limit, rows), batch_params, seeds, scale, clock, preview)
+            )
+        clock.flush()
+        return results
 
-        person_batch = self._torch.cat(
-            [
-                self._prepare_image(
-                    self._resize_and_crop(person_img.convert("RGB"), (self.settings.width, self.settings.height))
+    def _infer_split(
+        self,
+        inputs: tuple[Any, Any, list[str] | None, list[str] | None],
+        start: int,
+        stop: int,
+        params: InferenceParams,
+        seeds: list[int | None],
+        scale: float,
+        clock: StageClock,
+        preview: PreviewSink | None = None,
+    ) -> list[Image.Image]:
+        """
+        Run jobs [start, stop) of the prepared `inputs`, halving the range on out-of-memory errors.
+        `scale` is the memory of one of these jobs relative to one at WIDTH x HEIGHT.
+        """
+        person_batch, cloth_batch, person_keys, cloth_keys = inputs
+        # Fresh per attempt, so a retried half draws the same noise as the failed whole would have.
+        generator = None
+        if seeds[start] is not None:
+            generator = [
+                self._torch.Generator(device=self.settings.device).manual_seed(seed) for seed in seeds[start:stop]
+            ]
+        preview_callback = None
+        if preview is not None:
+            preview_callback = functools.partial(_offset_preview, preview, start)
+        try:
+            with self._memory.track((stop - start) * scale):
+                outputs = self._pipeline(
+                    image=person_batch[start:stop],
+                    condition_image=cloth_batch[start:stop],
+                    num_inference_steps=params.steps,
+                    guidance_scale=params.guidance_scale,
+                    generator=generator,
+                    image_cache_keys=person_keys[start:stop] if person_keys is not None else None,
+                    condition_cache_keys=cloth_keys[start:stop] if cloth_keys is not None else None,
+                    cfg_cutoff=self.settings.cfg_cutoff_fraction,
+                    uncond_reuse_interval=self.settings.cfg_uncond_reuse_interval,
+                    stage_timer=clock,
+                    preview_callback=preview_callback,
+                    preview_interval=self.settings.preview_interval_steps,
                 )
-                for person_img in person_imgs
-            ],
-            dim=0,
+            self._memory.record_success((stop - start) * scale)
+            return outputs
+        except Exception as exc:  # noqa: BLE001
+            if stop - start == 1 or not is_out_of_memory(exc):
+                raise
+        # Outside the handler, so the failed attempt's tensors (held by its traceback) are freed first.
+        self._memory.record_oom(max(1, round((stop - start) * scale)))
+        self._memory.release()
+        middle = (start + stop) // 2
+        return self._infer_split(inputs, start, middle, params, seeds, scale, clock, preview) + self._infer_split(
+            inputs, middle, stop, params, seeds, scale, clock, preview
         )
-        cloth_batch = self._torch.cat(
-            [
-                self._prepare_image(
-                    self._resize_and_padding(outfit_img.convert("RGB"), (self.settings.width, self.settings.height))
-                )
-                for outfit_img in outfit_imgs
-            ],
-            dim=0,
+
+    def set_scheduler(self, name: str) -> None:
+        """Switch the denoising scheduler in place (see `SCHEDULERS` in the vendored pipeline)."""
+        if self._pipeline is not None:
+            self._pipeline.set_scheduler(name)
+
+    def start_engine(self) -> None:
+        """
+        Start the continuous-batching engine used by `submit`; a no-op for the stub backend.
+
+        Returns once the engine thread has finished `warmup`.
+        """
+        if self._is_stub or self._engine is not None:
+            return
+        if self._pipeline is None:
+            raise RuntimeError("Model not loaded. Call load() first.")
+        from .continuous import ContinuousBatchEngine
+
+        self._engine = ContinuousBatchEngine(self._pipeline, self.settings, warmup=self.warmup, memory=self._memory)
+        self._engine.start()
+
+    def submit(
+        self,
+        person_img: Image.Image,
+        outfit_img: Image.Image,
+        timings: dict[str, float] | None = None,
+        preview: PreviewSink | None = None,
+        params: InferenceParams | None = None,
+    ) -> Future[Image.Image]:
+        """
+        Queue one job on the continuous-batching engine; the future resolves to the RGB result.
+        `params` defaults to the settings.
+
+        Only preprocessing is timed into `timings`: the engine's VAE and UNet passes are shared
+        between jobs and only go to the stage metrics.
+        """
+        if self._is_stub:
+            future: Future[Image.Image] = Future()
+            future.set_result(self._stub_infer(person_img, outfit_img))
+            return future
+        if self._engine is None:
+            raise RuntimeError("Continuous engine not started. Call start_engine() first.")
+        started = time.perf_counter()
+        size = (params.width, params.height) if params is not None else None
+        person_batch, cloth_batch, person_keys, cloth_keys = self._prepare_inputs([person_img], [outfit_img], size)
+        observe("preprocess", time.perf_counter() - started, timings)
+        return self._engine.submit(
+            person_batch,
+            cloth_batch,
+            person_keys[0] if person_keys is not None else None,
+            cloth_keys[0] if cloth_keys is not None else None,
+            preview,
+            params,
         )
 
-        generator = None
-        if self.settings.seed >= 0:
-            generator = self._torch.Generator(device=self.settings.device).manual_seed(self.settings.seed)
+    def cache_stats(self) -> dict[str, int] | None:
+        return self._latent_cache.stats() if self._latent_cache is not None else None
 
-        results = self._pipeline(
-            image=person_batch,
-            condition_image=cloth_batch,
-            num_inference_steps=self.settings.num_inference_steps,
-            guidance_scale=self.settings.guidance_scale,
-            generator=generator,
+    def _prepare_inputs(
+        self,
+        person_imgs: list[Image.Image],
+        outfit_imgs: list[Image.Image],
+        size: tuple[int, int] | None = None,
+    ) -> tuple[Any, Any, list[str] | None, list[str] | None]:
+        batch = self._preprocessor(person_imgs, outfit_imgs, with_digests=self._latent_cache is not None, size=size)
+        person_keys = cloth_keys = None
+        if self._latent_cache is not None:
+            person_keys = [latent_cache_key(self.settings, "person", digest) for digest in batch.person_digests]
+            cloth_keys = [latent_cache_key(self.settings, "cloth", digest) for digest in batch.cloth_digests]
+        return batch.person, batch.cloth, person_keys, cloth_keys
+
+    def _build_pipeline(self, pipeline_cls: Any, model_path: str, device: str) -> Any:
+        return pipeline_cls(
+            base_ckpt=self.settings.catvton_base_model_path,
+            attn_ckpt=model_path,
+            attn_ckpt_version=self.settings.catvton_model_variant,
+            weight_dtype=self._weight_dtype,
+            use_tf32=self.settings.allow_tf32,
+            device=device,
+            skip_safety_check=True,
+            scheduler=self.settings.scheduler,
         )
-        return [result.convert("RGBA") for result in results]
+
+    def _bundle_identity(self) -> dict[str, str]:
+        """
+        Settings a bundle is baked from. The attention checkpoint is recorded as configured
+        (`CATVTON_MODEL_DIR`, falling back to `CATVTON_MODEL_ID`), since the checkpoint itself
+        is usually not present next to a bundle.
+        """
+        return {
+            "model_id": self.settings.catvton_model_id,
+            "model_dir": self.settings.catvton_model_dir,
+            "model_variant": self.settings.catvton_model_variant,
+            "base_model": self.settings.catvton_base_model_path,
+            "mixed_precision": self.settings.mixed_precision,
+        }
+
+    def _check_bundle(self, path: str, metadata: dict[str, str]) -> None:
+        expected = self._bundle_identity()
+        mismatched = [
+            f"{key}: baked {metadata.get(key)!r}, configured {value!r}"
+            for key, value in expected.items()
+            if metadata.get(key) != value
+        ]
+        if mismatched:
+            raise RuntimeError(
+                f"Model bundle {path} does not match the current settings ({'; '.join(mismatched)}); "
+                "re-run `python -m weaver_service.bake_model`."
+            )
 
     def _resolve_model_path(self) -> str:
         if os.path.isdir(self.settings.catvton_model_dir):
@@ -127,4 +448,4 @@ class CatVTONModel:
 
         canvas = base.copy()
         canvas.alpha_composite(overlay, dest=(x, y))
-        return canvas
+        return canvas.convert("RGB")
@@ -0,0 +1,586 @@
+from __future__ import annotations
+
+import copy
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from PIL import Image
+
+from .catvton import CatVTONModel
+from .dedup import ResultDeduplicator
+from .encoding import ResultEncoder
+from .memory import MemoryBudget, is_out_of_memory
+from .metrics import StageClock, observe
+from .preview import PreviewPublisher, PreviewSink
+from .profiles import InferenceParams, batch_seeds, default_params
+from .pipeline import PreparedBatch, _fail_batch, fail_popped_jobs, finalize_jobs, prepare_jobs, publish_events
+from .stats import WorkerStatsReporter
+from common.config import Settings
+from common.job_schema import WeaverJob
+from common.log_utils import JobContextAdapter, bind_job, get_logger
+from common.redis_client import RedisClient
+from common.s3_client import S3ImageStore
+
+
+@dataclass
+class _Request:
+    image: Any
+    condition_image: Any
+    image_cache_key: str | None
+    condition_cache_key: str | None
+    future: Future
+    preview: PreviewSink | None = None
+    params: InferenceParams | None = None
+
+
+@dataclass
+class _Slot:
+    """One in-flight job: its own noise latents, scheduler state and position in the schedule."""
+
+    future: Future
+    latents: Any
+    # [uncond; cond] rows when classifier-free guidance is on, otherwise just the cond row.
+    condition: Any
+    scheduler: Any
+    timesteps: Any
+    # Per-step (apply_cfg, run_uncond) flags from `guidance_schedule`.
+    guidance: list[tuple[bool, bool]]
+    guidance_scale: float
+    extra_step_kwargs: dict[str, Any] = field(default_factory=dict)
+    step_index: int = 0
+    uncond_pred: Any = None
+    preview: PreviewSink | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.step_index >= len(self.timesteps)
+
+
+class ContinuousBatchEngine:
+    """
+    Iteration-level batching for the CatVTON Pix2Pix denoising loop.
+
+    Instead of running a fixed batch through every timestep, the engine keeps up to
+    `continuous_max_slots` jobs in flight, each at its own timestep. Every iteration:
+
+    - admits queued jobs into free slots (one batched VAE encode for all newcomers),
+    - runs a single UNet forward over every slot's rows with per-row timesteps (two rows for
+      slots evaluating the unconditional branch this step, one otherwise),
+    - steps each slot's scheduler copy, and
+    - retires slots that reached the end of their schedule (one batched VAE decode).
+
+    A job arriving mid-run therefore waits at most one UNet step, not a whole batch.
+    Stage metrics count one VAE encode per admission, one denoise per iteration and one
+    VAE decode per retirement.
+
+    With a `memory` budget, admission stops at the number of jobs it allows, and a UNet
+    forward that runs out of device memory is retried over halves of its rows.
+    Each slot draws noise from its own generator, so a seeded job gives the same result
+    regardless of which other jobs shared its steps. Slots also keep their own step count
+    and guidance scale; slots of different image sizes share an iteration but not a UNet
+    forward (one per size).
+    """
+
+    def __init__(
+        self,
+        pipeline: Any,
+        settings: Settings,
+        eta: float = 1.0,
+        warmup: Callable[[], None] | None = None,
+        memory: MemoryBudget | None = None,
+    ) -> None:
+        import torch  # type: ignore
+        from diffusers.utils.torch_utils import randn_tensor  # type: ignore
+        from weaver_service.vendor.catvton.model.pipeline import guidance_schedule  # type: ignore
+
+        self._torch = torch
+        self._randn_tensor = randn_tensor
+        self._guidance_schedule = guidance_schedule
+        self._pipeline = pipeline
+        self._settings = settings
+        self._eta = eta
+        self._max_slots = settings.continuous_max_slots
+        self._defaults = default_params(settings)
+        self._pending: queue.Queue[_Request] = queue.Queue()
+        self._slots: list[_Slot] = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        # Runs on the engine thread before the first job, so CUDA graphs are captured there.
+        self._warmup = warmup
+        self._warmed_up = threading.Event()
+        self._warmup_error: BaseException | None = None
+        self._memory = memory
+        self._clock: StageClock | None = None
+        self._logger = get_logger("weaver.continuous")
+
+    def start(self) -> None:
+        """Start the engine thread and wait for its warmup; re-raises a failed warmup."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="weaver-continuous", daemon=True)
+        self._thread.start()
+        self._warmed_up.wait()
+        if self._warmup_error is not None:
+            raise RuntimeError("Continuous engine warmup failed") from self._warmup_error
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def submit(
+        self,
+        image: Any,
+        condition_image: Any,
+        image_cache_key: str | None = None,
+        condition_cache_key: str | None = None,
+        preview: PreviewSink | None = None,
+        params: InferenceParams | None = None,
+    ) -> Future[Image.Image]:
+        future: Future[Image.Image] = Future()
+        self._pending.put(
+            _Request(image, condition_image, image_cache_key, condition_cache_key, future, preview, params)
+        )
+        return future
+
+    def _run(self) -> None:
+        try:
+            if self._warmup is not None:
+                self._warmup()
+        except Exception as exc:  # noqa: BLE001
+            self._warmup_error = exc
+            return
+        finally:
+            self._warmed_up.set()
+        self._clock = StageClock(self._settings.device)
+        with self._torch.no_grad():
+            while not self._stop.is_set():
+                try:
+                    self._admit(block=not self._slots)
+                    if not self._slots:
+                        continue
+                    self._step()
+                    self._retire()
+                    self._clock.flush(wait=False)
+                except Exception as exc:  # noqa: BLE001
+                    self._logger.exception("Continuous batch step failed; failing %s in-flight jobs", len(self._slots))
+                    for slot in self._slots:
+                        if not slot.future.done():
+                            slot.future.set_exception(exc)
+                    self._slots = []
+
+    def _admit(self, block: bool) -> None:
+        requests: list[_Request] = []
+        if block:
+            try:
+                requests.append(self._pending.get(timeout=0.5))
+            except queue.Empty:
+                return
+        capacity = self._max_slots
+        if self._memory is not None:
+            capacity = min(capacity, self._memory.max_jobs() or capacity)
+        while len(self._slots) + len(requests) < capacity:
+            try:
+                requests.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        requests = [request for request in requests if request.future.set_running_or_notify_cancel()]
+        if not requests:
+            return
+
+        try:
+            self._slots.extend(self._make_slots(requests))
+        except Exception as exc:  # noqa: BLE001
+            self._logger.exception("Failed to admit %s jobs", len(requests))
+            if self._memory is not None and is_out_of_memory(exc):
+                self._memory.record_oom(len(self._slots) + len(requests))
+            for request in requests:
+                request.future.set_exception(exc)
+
+    def _make_slots(self, requests: list[_Request]) -> list[_Slot]:
+        # Time since the last iteration was spent idle or admitting, not on the device.
+        self._clock.mark(None)
+        by_shape: dict[tuple[int, ...], list[_Request]] = {}
+        for request in requests:
+            by_shape.setdefault(tuple(request.image.shape), []).append(request)
+        return [slot for same_shape in by_shape.values() for slot in self._make_slots_of_shape(same_shape)]
+
+    def _make_slots_of_shape(self, requests: list[_Request]) -> list[_Slot]:
+        torch = self._torch
+        pipeline = self._pipeline
+        device, dtype = pipeline.device, pipeline.weight_dtype
+        images = torch.cat([request.image for request in requests]).to(device, dtype=dtype)
+        condition_images = torch.cat([request.condition_image for request in requests]).to(device, dtype=dtype)
+        image_keys = condition_keys = None
+        if all(request.image_cache_key is not None for request in requests):
+            image_keys = [request.image_cache_key for request in requests]
+        if all(request.condition_cache_key is not None for request in requests):
+            condition_keys = [request.condition_cache_key for request in requests]
+        request_params = [request.params or self._defaults for request in requests]
+        generators = [
+            torch.Generator(device=self._settings.device).manual_seed(seed) if seed is not None else None
+            for seed in batch_seeds(request_params)
+        ]
+        encode_generators = generators if generators[0] is not None else None
+        image_latents = pipeline.encode_with_cache(images, image_keys, encode_generators)
+        condition_latents = pipeline.encode_with_cache(condition_images, condition_keys, encode_generators)
+        self._clock.mark("vae_encode")
+
+        slots: list[_Slot] = []
+        for i, (request, params, generator) in enumerate(zip(requests, request_params, generators)):
+            image_latent = image_latents[i : i + 1]
+            condition_latent = condition_latents[i : i + 1]
+            condition = torch.cat([image_latent, condition_latent], dim=-1)
+            if params.guidance_scale > 1.0:
+                uncond = torch.cat([image_latent, torch.zeros_like(condition_latent)], dim=-1)
+                condition = torch.cat([uncond, condition])
+
+            scheduler = copy.deepcopy(pipeline.noise_scheduler)
+            scheduler.set_timesteps(params.steps, device=device)
+            latents = self._randn_tensor(condition[-1:].shape, generator=generator, device=device, dtype=dtype)
+            slots.append(
+                _Slot(
+                    future=request.future,
+                    latents=latents * scheduler.init_noise_sigma,
+                    condition=condition,
+                    scheduler=scheduler,
+                    timesteps=scheduler.timesteps,
+                    guidance=self._guidance_schedule(
+                        len(scheduler.timesteps),
+                        params.guidance_scale,
+                        self._settings.cfg_cutoff_fraction,
+                        self._settings.cfg_uncond_reuse_interval,
+                    ),
+                    guidance_scale=params.guidance_scale,
+                    extra_step_kwargs=pipeline.prepare_extra_step_kwargs(generator, self._eta),
+                    preview=request.preview,
+                )
+            )
+        return slots
+
+    def _step(self) -> None:
+        previews: list[list[tuple[_Slot, Any]]] = []
+        for slots in _by_shape(self._slots).values():
+            previews.append(self._step_slots(slots))
+        self._clock.mark("denoise")
+        if self._memory is not None:
+            self._memory.record_success(len(self._slots))
+        for due in previews:
+            if not due:
+                continue
+            pixels = self._pipeline.latents_to_preview(self._torch.cat([latents for _, latents in due]))
+            for row, (slot, _) in enumerate(due):
+                slot.preview(slot.step_index, len(slot.timesteps), pixels[row : row + 1], 0)
+            self._clock.mark("preview")
+
+    def _step_slots(self, slots: list[_Slot]) -> list[tuple[_Slot, Any]]:
+        """One UNet forward and scheduler step for `slots` (all of one latent shape); returns due previews."""
+        torch = self._torch
+        model_inputs, timesteps, rows = [], [], []
+        for slot in slots:
+            t = slot.timesteps[slot.step_index]
+            run_uncond = slot.guidance[slot.step_index][1]
+            slot_rows = 2 if run_uncond else 1
+            latent_input = torch.cat([slot.latents] * slot_rows)
+            latent_input = slot.scheduler.scale_model_input(latent_input, t)
+            condition = slot.condition if run_uncond else slot.condition[-1:]
+            model_inputs.append(torch.cat([latent_input, condition], dim=1))
+            timesteps.append(t.reshape(1).expand(slot_rows))
+            rows.append(slot_rows)
+
+        # Latents hold person and garment side by side; the garment merge needs the grid of one half.
+        self._pipeline.set_latent_size(slots[0].latents.shape[-2], slots[0].latents.shape[-1] // 2)
+        noise_pred = self._unet(torch.cat(model_inputs), torch.cat(timesteps).to(self._pipeline.device))
+
+        interval = self._settings.preview_interval_steps
+        previews: list[tuple[_Slot, Any]] = []
+        for slot, slot_pred in zip(slots, noise_pred.split(rows)):
+            apply_cfg, run_uncond = slot.guidance[slot.step_index]
+            if run_uncond:
+                slot.uncond_pred, slot_pred = slot_pred.chunk(2)
+            if apply_cfg:
+                slot_pred = slot.uncond_pred + slot.guidance_scale * (slot_pred - slot.uncond_pred)
+            t = slot.timesteps[slot.step_index]
+            output = slot.scheduler.step(slot_pred, t, slot.latents, **slot.extra_step_kwargs)
+            slot.latents = output.prev_sample
+            slot.step_index += 1
+            if slot.preview is not None and interval > 0 and slot.step_index % interval == 0 and not slot.done:
+                predicted = getattr(output, "pred_original_sample", None)
+                previews.append((slot, slot.latents if predicted is None else predicted))
+        return previews
+
+    def _unet(self, sample: Any, timesteps: Any) -> Any:
+        try:
+            return self._pipeline.unet(sample, timesteps, encoder_hidden_states=None, return_dict=False)[0]
+        except Exception as exc:  # noqa: BLE001
+            if self._memory is None or sample.shape[0] == 1 or not is_out_of_memory(exc):
+                raise
+        self._memory.record_oom(len(self._slots))
+        self._memory.release()
+        middle = sample.shape[0] // 2
+        return self._torch.cat(
+            [self._unet(sample[:middle], timesteps[:middle]), self._unet(sample[middle:], timesteps[middle:])]
+        )
+
+    def _retire(self) -> None:
+        finished = [slot for slot in self._slots if slot.done]
+        if not finished:
+            return
+        self._slots = [slot for slot in self._slots if not slot.done]
+        for same_shape in _by_shape(finished).values():
+            try:
+                images = self._pipeline.decode_latents(self._torch.cat([slot.latents for slot in same_shape]))
+                self._clock.mark("vae_decode")
+            except Exception as exc:  # noqa: BLE001
+                self._logger.exception("Failed to decode %s finished jobs", len(same_shape))
+                for slot in same_shape:
+                    slot.future.set_exception(exc)
+                continue
+            for slot, image in zip(same_shape, images):
+                slot.future.set_result(image)
+
+
+def _by_shape(slots: list[_Slot]) -> dict[tuple[int, ...], list[_Slot]]:
+    """`slots` grouped by latent shape (image size), which is what a batched UNet or VAE call needs."""
+    groups: dict[tuple[int, ...], list[_Slot]] = {}
+    for slot in slots:
+        groups.setdefault(tuple(slot.latents.shape), []).append(slot)
+    return groups
+
+
+def split_prepared_batch(batch: PreparedBatch) -> tuple[PreparedBatch, list[PreparedBatch]]:
+    """
+    Split a prepared batch into per-job units for the continuous engine.
+
+    Returns the already-settled remainder (invalid payloads, failed downloads, dedup hits)
+    and one batch per job that still needs inference, carrying that job's in-batch
+    duplicates so they are finalized and acked together with it.
+    """
+    raw_by_id: dict[Any, list[dict]] = {}
+    for raw_job in batch.raw_jobs:
+        raw_by_id.setdefault(raw_job.get("id"), []).append(raw_job)
+
+    def take_raw(job: WeaverJob) -> list[dict]:
+        raws = raw_by_id.get(job.id)
+        return [raws.pop()] if raws else []
+
+    followers_by_fp: dict[str, list[tuple[WeaverJob, str]]] = {}
+    for job, fingerprint in batch.followers:
+        followers_by_fp.setdefault(fingerprint, []).append((job, fingerprint))
+
+    per_job: list[PreparedBatch] = []
+    for job, job_params, fingerprint, person_img, outfit_img in zip(
+        batch.jobs, batch.params, batch.fingerprints, batch.person_imgs, batch.outfit_imgs
+    ):
+        followers = followers_by_fp.pop(fingerprint, []) if fingerprint is not None else []
+        raw_jobs = take_raw(job)
+        for follower, _ in followers:
+            raw_jobs.extend(take_raw(follower))
+        job_ids = [job.id, *(follower.id for follower, _ in followers)]
+        per_job.append(
+            PreparedBatch(
+                raw_jobs=raw_jobs,
+                jobs=[job],
+                params=[job_params],
+                fingerprints=[fingerprint],
+                followers=followers,
+                leader_ids={fingerprint: job.id} if fingerprint is not None else {},
+                person_imgs=[person_img],
+                outfit_imgs=[outfit_img],
+                job_timings={job_id: batch.job_timings.get(job_id, {}) for job_id in job_ids},
+            )
+        )
+
+    remainder = PreparedBatch(
+        raw_jobs=[raw_job for raws in raw_by_id.values() for raw_job in raws],
+        events=batch.events,
+        # Followers whose leader already failed download stay here and fail in finalize.
+        followers=[entry for entries in followers_by_fp.values() for entry in entries],
+        leader_ids=batch.leader_ids,
+        job_timings=batch.job_timings,
+    )
+    return remainder, per_job
+
+
+@dataclass
+class _PoppedBatchClock:
+    """Times a popped batch from its first job entering the engine until its last job retires."""
+
+    size: int
+    started: float = field(default_factory=time.perf_counter)
+    _remaining: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def __post_init__(self) -> None:
+        self._remaining = self.size
+
+    def retire(self) -> float | None:
+        """Count one retired job; returns the batch's elapsed time once its last job retires."""
+        with self._lock:
+            self._remaining -= 1
+            if self._remaining:
+                return None
+        return time.perf_counter() - self.started
+
+
+class ContinuousWorker:
+    """
+    Worker for `WEAVER_WORKER_MODE=continuous`.
+
+    The intake thread pops, validates and downloads jobs as in the other modes, then
+    hands each job to the model's continuous-batching engine. Jobs finish independently,
+    so each one is uploaded, published and acked as soon as its own result is ready
+    rather than when the slowest job of its popped batch completes.
+
+    In-flight jobs are capped at twice the slot count so a worker never hoards more work
+    than it can start within one denoising run. Each popped batch is reported to the
+    Arbitrator as one latency sample, from its first job's submission to its last job's
+    retirement, so its batch-size model reads the same in every worker mode.
+    """
+
+    def __init__(
+        self,
+        *,
+        settings: Settings,
+        redis_client: RedisClient,
+        store: S3ImageStore,
+        model: CatVTONModel,
+        logger: JobContextAdapter,
+        dedup: ResultDeduplicator | None = None,
+        stats: WorkerStatsReporter | None = None,
+        encoder: ResultEncoder | None = None,
+        previews: PreviewPublisher | None = None,
+    ) -> None:
+        self._settings = settings
+        self._redis = redis_client
+        self._store = store
+        self._model = model
+        self._logger = logger
+        self._dedup = dedup
+        self._stats = stats
+        self._encoder = encoder
+        self._previews = previews
+        self._in_flight = threading.BoundedSemaphore(2 * settings.continuous_max_slots)
+        self._publisher = ThreadPoolExecutor(
+            max_workers=settings.publish_queue_depth, thread_name_prefix="weaver-publish"
+        )
+        self._stop = threading.Event()
+
+    def run(self) -> None:
+        self._model.start_engine()
+        if self._stats is not None:
+            self._stats.start_heartbeats(self._stop)
+        while not self._stop.is_set():
+            raw_jobs = None
+            try:
+                raw_jobs = self._redis.consume_job_weaver(self._settings.redis_queue, timeout_seconds=5)
+                if raw_jobs is None:
+                    continue
+                if self._stats is not None:
+                    self._stats.record_popped(len(raw_jobs))
+                batch = prepare_jobs(
+                    settings=self._settings,
+                    store=self._store,
+                    raw_jobs=raw_jobs,
+                    logger=self._logger,
+                    dedup=self._dedup,
+                )
+            except Exception as exc:  # noqa: BLE001
+                self._logger.exception("Intake stage failed")
+                if raw_jobs:
+                    fail_popped_jobs(
+                        settings=self._settings,
+                        redis_client=self._redis,
+                        raw_jobs=raw_jobs,
+                        error=f"batch_intake_failed: {exc}",
+                        logger=self._logger,
+                    )
+                continue
+
+            remainder, per_job = split_prepared_batch(batch)
+            if remainder.raw_jobs or remainder.events:
+                self._publisher.submit(self._finish, remainder)
+            popped_clock = _PoppedBatchClock(len(per_job))
+            for job_batch in per_job:
+                self._in_flight.acquire()
+                try:
+                    preview = self._previews.for_jobs(job_batch.jobs) if self._previews is not None else None
+                    future = self._model.submit(
+                        job_batch.person_imgs[0],
+                        job_batch.outfit_imgs[0],
+                        job_batch.timings,
+                        preview,
+                        job_batch.params[0],
+                    )
+                except Exception as exc:  # noqa: BLE001
+                    job = job_batch.jobs[0]
+                    bind_job(self._logger, job.id, job.user_id, job.vton_id).exception("Failed to submit job")
+                    self._in_flight.release()
+                    self._retire(popped_clock)
+                    _fail_batch(job_batch, f"batch_inference_failed: {exc}")
+                    self._publisher.submit(self._finish, job_batch)
+                    continue
+                submitted = time.perf_counter()
+                job_batch.person_imgs = []
+                job_batch.outfit_imgs = []
+                future.add_done_callback(
+                    lambda done, job_batch=job_batch, submitted=submitted: self._on_done(
+                        job_batch, submitted, popped_clock, done
+                    )
+                )
+
+    def stop(self) -> None:
+        """Stop popping new jobs; jobs already handed to the engine still finish and publish."""
+        self._stop.set()
+
+    def _on_done(
+        self, batch: PreparedBatch, submitted: float, popped_clock: _PoppedBatchClock, future: Future[Image.Image]
+    ) -> None:
+        # Runs on the engine thread as the job retires: time in the engine, queueing included.
+        observe("inference", time.perf_counter() - submitted, batch.timings)
+        self._retire(popped_clock)
+        self._publisher.submit(self._complete, batch, future)
+
+    def _retire(self, popped_clock: _PoppedBatchClock) -> None:
+        elapsed = popped_clock.retire()
+        if elapsed is not None and self._stats is not None:
+            self._stats.record_batch(popped_clock.size, elapsed)
+
+    def _complete(self, batch: PreparedBatch, future: Future[Image.Image]) -> None:
+        try:
+            exc = future.exception()
+            if exc is not None:
+                job = batch.jobs[0]
+                bind_job(self._logger, job.id, job.user_id, job.vton_id).error("Inference failed: %s", exc)
+                _fail_batch(batch, f"batch_inference_failed: {exc}")
+            else:
+                batch.outputs = [future.result()]
+            self._finish(batch)
+        finally:
+            self._in_flight.release()
+
+    def _finish(self, batch: PreparedBatch) -> None:
+        published: set[str] = set()
+        try:
+            events = finalize_jobs(
+                settings=self._settings,
+                store=self._store,
+                batch=batch,
+                logger=self._logger,
+                dedup=self._dedup,
+                encoder=self._encoder,
+            )
+            publish_events(settings=self._settings, redis_client=self._redis, events=events, published=published)
+            self._redis.ack_jobs(self._settings.redis_queue, batch.raw_jobs)
+        except Exception as exc:  # noqa: BLE001
+            self._logger.exception("Publish stage failed")
+            fail_popped_jobs(
+                settings=self._settings,
+                redis_client=self._redis,
+                raw_jobs=batch.raw_jobs,
+                error=f"batch_publish_failed: {exc}",
+                logger=self._logger,
+                published=published,
+            )
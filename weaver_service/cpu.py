@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import os
+from typing import Any
+
+from common.config import Settings
+from common.log_utils import get_logger
+
+_logger = get_logger("weaver.cpu")
+
+
+def available_cores() -> int:
+    """Cores this process may run on: its affinity mask (the pod's cpuset) where supported."""
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+def configure_threads(settings: Settings) -> tuple[int, int]:
+    """
+    Size torch's thread pools for `INFERENCE_BACKEND=cpu`; returns (intra-op, inter-op) threads.
+
+    `CPU_THREADS=0` uses every core the process may run on (its affinity mask, i.e. the pod's
+    cpuset). Pods limited by a CPU quota instead should set it to the quota. `CPU_INTEROP_THREADS=0`
+    uses one: the pipeline runs one model call at a time, so more inter-op threads would only
+    compete with the intra-op ones. Call before torch does any parallel work; the inter-op pool
+    can only be sized once per process.
+    """
+    import torch  # type: ignore
+
+    intra_op = settings.cpu_threads or available_cores()
+    inter_op = settings.cpu_interop_threads or 1
+    torch.set_num_threads(intra_op)
+    try:
+        torch.set_num_interop_threads(inter_op)
+    except RuntimeError:
+        inter_op = torch.get_num_interop_threads()
+        _logger.warning("Inter-op thread pool already started; keeping %s threads", inter_op)
+    return intra_op, inter_op
+
+
+def optimize_pipeline(pipeline: Any, settings: Settings) -> list[str]:
+    """
+    Apply the CPU backend's model optimisations in place; returns what was applied.
+
+    - `CPU_CHANNELS_LAST`: UNet and VAE weights in NHWC, the layout oneDNN convolutions are
+      fastest in.
+    - `CPU_QUANTIZE_INT8`: dynamic int8 quantisation of the UNet's Linear layers (attention
+      projections and feed-forwards). Weights are int8 and activations are quantised per call.
+      Convolutions stay in floating point, since PyTorch has no dynamic quantisation for them.
+      Needs `MIXED_PRECISION=no`, because the quantised layers take fp32 activations.
+
+    Everything else runs in `MIXED_PRECISION`; bf16 only pays off on CPUs with native bf16
+    (AVX512-BF16 or AMX).
+    """
+    import torch  # type: ignore
+
+    applied = [str(pipeline.weight_dtype).replace("torch.", "")]
+    if settings.cpu_quantize_int8:
+        if pipeline.weight_dtype != torch.float32:
+            raise RuntimeError(
+                f"CPU_QUANTIZE_INT8 needs MIXED_PRECISION=no (got {settings.mixed_precision!r}): "
+                "dynamically quantised layers take fp32 activations."
+            )
+        pipeline.unet = torch.ao.quantization.quantize_dynamic(
+            pipeline.unet, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+        applied.append("int8-linear")
+    if settings.cpu_channels_last:
+        pipeline.unet.to(memory_format=torch.channels_last)
+        pipeline.vae.to(memory_format=torch.channels_last)
+        applied.append("channels_last")
+    _logger.info(
+        "CPU backend: %s intra-op / %s inter-op threads; %s",
+        torch.get_num_threads(),
+        torch.get_num_interop_threads(),
+        ", ".join(applied),
+    )
+    return applied
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import hashlib
+import json
+
+from common.config import Settings
+from common.job_schema import WeaverJob
+from common.redis_client import RedisClient
+from common.s3_client import S3ImageStore
+from .encoding import rendition_keys
+from .profiles import InferenceParams, default_params
+
+
+def job_fingerprint(
+    settings: Settings,
+    person_etag: str,
+    outfit_etag: str,
+    params: InferenceParams | None = None,
+    user_id: str | None = None,
+) -> str:
+    """
+    Identity of a try-on result: input content, the job's parameters and every setting that changes
+    the output. With `user_id`, the result is only shared between that user's jobs.
+    """
+    params = params or default_params(settings)
+    payload = {
+        "person": person_etag,
+        "outfit": outfit_etag,
+        "backend": settings.inference_backend,
+        "base_model": settings.catvton_base_model_path,
+        "model_id": settings.catvton_model_id,
+        "variant": settings.catvton_model_variant,
+        "precision": settings.mixed_precision,
+        "scheduler": settings.scheduler,
+        "steps": params.steps,
+        "guidance": params.guidance_scale,
+        "cfg_cutoff": settings.cfg_cutoff_fraction,
+        "uncond_reuse": settings.cfg_uncond_reuse_interval,
+        "draft_decode": settings.input_draft_decode,
+        "width": params.width,
+        "height": params.height,
+        "seed": params.seed if params.seed is not None else -1,
+        "format": settings.result_format,
+        "quality": settings.result_quality,
+        "thumbnail_width": settings.result_thumbnail_width,
+    }
+    if settings.inference_backend == "cpu":
+        payload["int8"] = settings.cpu_quantize_int8
+    if settings.attention_garment_merge > 1:
+        payload["garment_merge"] = settings.attention_garment_merge
+    if user_id is not None:
+        payload["user"] = user_id
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class ResultDeduplicator:
+    """
+    Maps job fingerprints to previously produced result keys.
+
+    Input content is identified by S3 ETags (fetched with HEAD before anything is downloaded),
+    so a repeat request skips download, inference and encode. A hit either reuses the earlier
+    result key or server-side copies it to the new job's own key, depending on `DEDUP_MODE`.
+    A reused key stays under the first job's user, so in `reuse` mode fingerprints are scoped
+    per user and results are only reused within one user's jobs.
+    """
+
+    def __init__(self, settings: Settings, redis_client: RedisClient, store: S3ImageStore) -> None:
+        self._settings = settings
+        self._redis = redis_client
+        self._store = store
+
+    @classmethod
+    def from_settings(
+        cls, settings: Settings, redis_client: RedisClient, store: S3ImageStore
+    ) -> ResultDeduplicator | None:
+        if not settings.dedup_enabled:
+            return None
+        return cls(settings, redis_client, store)
+
+    def fingerprint(self, jobs: list[WeaverJob], params: list[InferenceParams]) -> list[str | None]:
+        """
+        One fingerprint per job; None for a job that must not share results. That is a job with
+        an input that cannot be HEADed, or one with a random seed, unless `DEDUP_RANDOM_SEED` opts in.
+        """
+        # A random seed gives a different image each run; reusing one is only correct on opt-in.
+        random_ok = self._settings.dedup_random_seed
+        eligible = [i for i, job_params in enumerate(params) if job_params.seed is not None or random_ok]
+        keys = [key for i in eligible for key in (jobs[i].user_snap_s3, jobs[i].uncleaned_outfit_s3)]
+        etags = self._store.head_etags(keys) if keys else []
+        fingerprints: list[str | None] = [None] * len(jobs)
+        for n, i in enumerate(eligible):
+            person_etag, outfit_etag = etags[2 * n], etags[2 * n + 1]
+            if isinstance(person_etag, Exception) or isinstance(outfit_etag, Exception):
+                # Leave it to the download step to report the missing input.
+                continue
+            user_id = jobs[i].user_id if self._settings.dedup_mode == "reuse" else None
+            fingerprints[i] = job_fingerprint(self._settings, person_etag, outfit_etag, params[i], user_id)
+        return fingerprints
+
+    def lookup(self, fingerprints: list[str | None]) -> list[str | None]:
+        known = [fp for fp in fingerprints if fp is not None]
+        if not known:
+            return [None] * len(fingerprints)
+        found = dict(zip(known, self._redis.get_dedup_results(known)))
+        return [found.get(fp) if fp is not None else None for fp in fingerprints]
+
+    def resolve(self, items: list[tuple[str, str]]) -> list[str | Exception]:
+        """Turn `(cached_key, new_key)` hits into result keys for the new jobs (copying every rendition)."""
+        if self._settings.dedup_mode == "reuse":
+            return [cached_key for cached_key, _ in items]
+        copies: list[tuple[str, str]] = []
+        owners: list[int] = []
+        for i, (cached_key, new_key) in enumerate(items):
+            cached, new = rendition_keys(self._settings, cached_key), rendition_keys(self._settings, new_key)
+            copies.extend((cached[name], new[name]) for name in cached)
+            owners.extend([i] * len(cached))
+        results: list[str | Exception] = [new_key for _, new_key in items]
+        for owner, copied in zip(owners, self._store.copy_objects(copies)):
+            if isinstance(copied, Exception) and not isinstance(results[owner], Exception):
+                results[owner] = copied
+        return results
+
+    def record(self, items: list[tuple[str, str]]) -> None:
+        """Remember `(fingerprint, result_key)` pairs for later jobs."""
+        if items:
+            self._redis.set_dedup_results(items, self._settings.dedup_ttl_seconds)
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import dataclasses
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from typing import Any
+
+from PIL import Image
+
+from .catvton import CatVTONModel
+from .cpu import available_cores
+from .metrics import DEVICE_BUSY_SECONDS, DEVICE_JOBS, DEVICE_RESTARTS, observe, observe_latent_cache
+from .preview import PreviewPublisher
+from .profiles import InferenceParams
+from common.config import Settings
+from common.job_schema import WeaverJob
+from common.log_utils import get_logger, setup_logging
+from common.redis_client import RedisClient
+
+# Tries per batch; a device process that exits mid-batch is restarted and the batch sent again.
+_MAX_ATTEMPTS = 2
+# Batch-level stages the device processes time; re-observed here since only this process is scraped.
+_BATCH_STAGES = ("preprocess", "vae_encode", "vae_decode")
+
+
+def _serve_device(settings: Settings, conn: Connection) -> None:
+    """Entry point of a device process: load the model on `settings.device`, then run batches from `conn`."""
+    setup_logging(settings.log_level)
+    logger = get_logger("weaver.device")
+    try:
+        if settings.device.startswith("cuda"):
+            import torch  # type: ignore
+
+            # Kernels and synchronisation that use the current device must target ours.
+            torch.cuda.set_device(settings.device)
+        model = CatVTONModel(settings)
+        model.load()
+        model.warmup()
+        previews = None
+        if settings.preview_interval_steps > 0:
+            previews = PreviewPublisher.from_settings(settings, RedisClient.from_settings(settings))
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Device %s failed to start", settings.device)
+        conn.send(("error", f"{type(exc).__name__}: {exc}", {}))
+        return
+    conn.send(("ready", None, model.load_timings))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        person_imgs, outfit_imgs, jobs, params = message
+        timings: dict[str, float] = {}
+        preview = None
+        if previews is not None and jobs:
+            preview = previews.for_jobs([WeaverJob.model_validate(job) for job in jobs])
+        try:
+            outputs = model.infer_batch(person_imgs, outfit_imgs, timings, preview, params)
+        except Exception as exc:  # noqa: BLE001
+            conn.send(("error", f"{type(exc).__name__}: {exc}", timings, model.cache_stats()))
+            continue
+        conn.send(("ok", outputs, timings, model.cache_stats()))
+
+
+class RemotePreviews:
+    """
+    `PreviewPublisher` stand-in for `infer_prepared` in multi-device mode: the device process
+    publishes the previews itself, so the "sink" handed to `DeviceProcess.infer_batch` is just
+    the batch's jobs.
+    """
+
+    def for_jobs(self, jobs: list[WeaverJob]) -> list[dict[str, Any]]:
+        return [job.model_dump(mode="json") for job in jobs]
+
+
+class DeviceProcess:
+    """
+    Parent-side handle of one device's inference process; stands in for `CatVTONModel` in
+    `infer_prepared`.
+
+    Inputs and outputs cross the process boundary pickled over a pipe. A process that exits
+    while a batch is in flight, or does not answer within `WEAVER_DEVICE_BATCH_TIMEOUT_SECONDS`,
+    is restarted (loading and warming up the model again) and the batch is sent to it again, so
+    its jobs are not lost. When the retry fails as well, the batch fails and the process is left
+    stopped for the caller to `start` again.
+    """
+
+    def __init__(self, settings: Settings, name: str) -> None:
+        # `settings.device`, made unique when a device is listed more than once ("cpu#0", "cpu#1").
+        self.name = name
+        self._settings = settings
+        self._context = multiprocessing.get_context("spawn")
+        self._process: Any | None = None
+        self._conn: Connection | None = None
+        # Latest `LatentCache.stats()` of the process, exported from here since only this process is scraped.
+        self._cache_stats: dict[str, int] = {}
+        self._logger = get_logger("weaver.devices")
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None
+
+    def start(self) -> dict[str, float]:
+        """Start the process and wait until its model is loaded and warmed up; returns its load timings."""
+        conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_serve_device, args=(self._settings, child_conn), name=f"weaver-{self.name}", daemon=True
+        )
+        process.start()
+        # Only the child holds its end now, so its exit shows up here as EOF.
+        child_conn.close()
+        self._process, self._conn = process, conn
+        try:
+            status, error, timings = conn.recv()
+        except EOFError:
+            status, error, timings = "error", f"exited with code {process.exitcode}", {}
+        if status != "ready":
+            self._discard()
+            raise RuntimeError(f"Device {self.name} failed to start: {error}")
+        self._logger.info("Device %s ready (pid %s)", self.name, process.pid)
+        return timings
+
+    def stop(self) -> None:
+        if self._process is None:
+            return
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._process.join(timeout=10)
+        self._discard()
+
+    def infer_batch(
+        self,
+        person_imgs: list[Image.Image],
+        outfit_imgs: list[Image.Image],
+        timings: dict[str, float] | None = None,
+        preview: list[dict[str, Any]] | None = None,
+        params: list[InferenceParams] | None = None,
+    ) -> list[Image.Image]:
+        started = time.perf_counter()
+        for attempt in range(1, _MAX_ATTEMPTS + 1):
+            if self._process is None:
+                self.start()
+            timeout = self._settings.device_batch_timeout_seconds
+            try:
+                self._conn.send((person_imgs, outfit_imgs, preview, params))
+                if not self._conn.poll(timeout):
+                    raise TimeoutError(f"no answer in {timeout:.0f}s")
+                status, payload, device_timings, cache_stats = self._conn.recv()
+                break
+            except TimeoutError as exc:
+                self._logger.error(
+                    "Device %s did not answer a batch within %.0fs; killing it (attempt %s/%s)",
+                    self.name,
+                    timeout,
+                    attempt,
+                    _MAX_ATTEMPTS,
+                )
+                error: Exception = exc
+                reason = f"device_batch_timeout: {self.name} ({timeout:.0f}s)"
+            except (EOFError, OSError) as exc:
+                self._process.join(timeout=5)
+                exitcode = self._process.exitcode
+                self._logger.error(
+                    "Device %s process exited (code %s) with a batch in flight (attempt %s/%s)",
+                    self.name,
+                    exitcode,
+                    attempt,
+                    _MAX_ATTEMPTS,
+                )
+                error = exc
+                reason = f"device_process_exited: {self.name} (code {exitcode})"
+            DEVICE_RESTARTS.labels(self.name).inc()
+            self._discard()
+            if attempt == _MAX_ATTEMPTS:
+                raise RuntimeError(reason) from error
+        for stage, seconds in device_timings.items():
+            if stage in _BATCH_STAGES:
+                observe(stage, seconds)
+            if timings is not None:
+                timings[stage] = timings.get(stage, 0.0) + seconds
+        if cache_stats is not None:
+            observe_latent_cache(cache_stats, self._cache_stats)
+            self._cache_stats = cache_stats
+        if status != "ok":
+            raise RuntimeError(payload)
+        DEVICE_JOBS.labels(self.name).inc(len(payload))
+        DEVICE_BUSY_SECONDS.labels(self.name).inc(time.perf_counter() - started)
+        return payload
+
+    def _discard(self) -> None:
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(timeout=5)
+        if self._process.is_alive():
+            # A process stuck in a driver call may not handle SIGTERM.
+            self._process.kill()
+            self._process.join(timeout=5)
+        self._conn.close()
+        self._process = self._conn = None
+        # The restarted process starts with an empty memory tier.
+        observe_latent_cache({}, self._cache_stats)
+        self._cache_stats = {}
+
+
+class DevicePool:
+    """
+    One `DeviceProcess` per `WEAVER_DEVICES` entry; stands in for `CatVTONModel` in `main` for
+    `WEAVER_WORKER_MODE=multi` (see `MultiDeviceWorker`).
+
+    With `CPU_THREADS=0`, CPU device processes split the available cores evenly instead of each
+    sizing its thread pool to all of them.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        cpu_devices = sum(1 for device in settings.devices if device.startswith("cpu"))
+        cpu_threads = settings.cpu_threads
+        if cpu_devices and not cpu_threads:
+            cpu_threads = max(1, available_cores() // cpu_devices)
+        self.devices: list[DeviceProcess] = []
+        for index, device in enumerate(settings.devices):
+            name = f"{device}#{index}" if settings.devices.count(device) > 1 else device
+            device_settings = dataclasses.replace(
+                settings, device=device, cpu_threads=cpu_threads if device.startswith("cpu") else settings.cpu_threads
+            )
+            self.devices.append(DeviceProcess(device_settings, name))
+        self.load_timings: dict[str, float] = {}
+        self._logger = get_logger("weaver.devices")
+
+    def load(self) -> None:
+        """
+        Start every device process in parallel and wait until each is ready or has failed.
+
+        A device that fails to start is left stopped for `MultiDeviceWorker` to restart; only a
+        pool with no device running fails to load.
+        """
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(self.devices)) as executor:
+            futures = [executor.submit(device.start) for device in self.devices]
+        errors = [future.exception() for future in futures]
+        if all(error is not None for error in errors):
+            raise RuntimeError(f"No device started: {errors[0]}") from errors[0]
+        for device, error in zip(self.devices, errors):
+            if error is not None:
+                self._logger.error("Device %s failed to start; retrying in the background: %s", device.name, error)
+        self.load_timings = {"devices": time.perf_counter() - started}
+
+    def warmup(self) -> None:
+        """Device processes warm up before reporting ready."""
+
+    def close(self) -> None:
+        for device in self.devices:
+            device.stop()
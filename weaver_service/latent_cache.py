@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from PIL import Image
+
+from .metrics import LATENT_CACHE_BYTES, LATENT_CACHE_COUNTERS
+from common.config import Settings
+
+
+def image_digest(image: Image.Image) -> str:
+    """Content hash of decoded pixels, so re-encoded copies of the same upload still hit."""
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"{image.mode}:{image.width}x{image.height}:".encode())
+    hasher.update(image.tobytes())
+    return hasher.hexdigest()
+
+
+def latent_cache_key(settings: Settings, kind: str, digest: str) -> str:
+    return (
+        f"{settings.catvton_base_model_path}|{settings.catvton_model_variant}|{settings.mixed_precision}"
+        f"|{kind}|{settings.width}x{settings.height}|{digest}"
+    )
+
+
+class LatentCache:
+    """
+    Content-addressed cache of VAE posterior parameters (mean and log-variance).
+
+    Posterior parameters are stored instead of sampled latents so a cache hit draws a
+    fresh sample exactly like an uncached encode would.
+
+    Two tiers:
+    - memory: LRU of CPU tensors bounded by `max_bytes`.
+    - disk (optional): one safetensors file per entry under `disk_dir`, read back through
+      a memory map, bounded by `disk_max_bytes` with oldest-first eviction.
+
+    Hits, misses, evictions and bytes per tier are exported as Prometheus metrics as they change.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: str | None = None, disk_max_bytes: int = 0) -> None:
+        self._max_bytes = max_bytes
+        self._disk_dir = disk_dir
+        self._disk_max_bytes = disk_max_bytes
+        self._entries: OrderedDict[str, Any] = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(entry.stat().st_size for entry in os.scandir(disk_dir) if entry.is_file())
+            LATENT_CACHE_BYTES.labels("disk").set(self._disk_bytes)
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> LatentCache | None:
+        if settings.latent_cache_max_bytes <= 0 and not settings.latent_cache_dir:
+            return None
+        return cls(
+            max_bytes=settings.latent_cache_max_bytes,
+            disk_dir=settings.latent_cache_dir,
+            disk_max_bytes=settings.latent_cache_disk_max_bytes,
+        )
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            tensor = self._entries.get(key)
+            if tensor is not None:
+                self._entries.move_to_end(key)
+                self._count("memory_hits")
+                return tensor
+
+        tensor = self._read_disk(key)
+        with self._lock:
+            if tensor is None:
+                self._count("misses")
+                return None
+            self._count("disk_hits")
+            self._insert(key, tensor)
+        return tensor
+
+    def put(self, key: str, tensor: Any) -> None:
+        tensor = tensor.detach().to("cpu").contiguous()
+        with self._lock:
+            self._insert(key, tensor)
+        self._write_disk(key, tensor)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                **self._counters,
+                "memory_entries": len(self._entries),
+                "memory_bytes": self._bytes,
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        self._counters[name] += amount
+        LATENT_CACHE_COUNTERS[name].inc(amount)
+
+    def _insert(self, key: str, tensor: Any) -> None:
+        if self._max_bytes <= 0:
+            return
+        size = tensor.element_size() * tensor.nelement()
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.element_size() * previous.nelement()
+        self._entries[key] = tensor
+        self._bytes += size
+        while self._bytes > self._max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.element_size() * evicted.nelement()
+            self._count("memory_evictions")
+        LATENT_CACHE_BYTES.labels("memory").set(self._bytes)
+
+    def _disk_path(self, key: str) -> str:
+        name = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self._disk_dir or "", f"{name}.safetensors")
+
+    def _read_disk(self, key: str) -> Any | None:
+        if not self._disk_dir:
+            return None
+        from safetensors.torch import load_file  # type: ignore
+
+        path = self._disk_path(key)
+        try:
+            tensor = load_file(path)["parameters"]
+            os.utime(path)
+        except (FileNotFoundError, KeyError):
+            return None
+        except Exception:  # noqa: BLE001
+            # Truncated or foreign file: treat as a miss and let the next put overwrite it.
+            return None
+        return tensor
+
+    def _write_disk(self, key: str, tensor: Any) -> None:
+        if not self._disk_dir:
+            return
+        from safetensors.torch import save_file  # type: ignore
+
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        save_file({"parameters": tensor}, tmp_path)
+        replaced = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._disk_bytes += os.path.getsize(path) - replaced
+            LATENT_CACHE_BYTES.labels("disk").set(self._disk_bytes)
+            over_budget = self._disk_max_bytes > 0 and self._disk_bytes > self._disk_max_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        entries = sorted(
+            (entry for entry in os.scandir(self._disk_dir) if entry.name.endswith(".safetensors")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        total = sum(entry.stat().st_size for entry in entries)
+        # Trim to 90% of the budget so eviction is not re-triggered on every write.
+        target = int(self._disk_max_bytes * 0.9)
+        evicted = 0
+        for entry in entries:
+            if total <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self._count("disk_evictions", evicted)
+            LATENT_CACHE_BYTES.labels("disk").set(total)
@@ -1,51 +1,121 @@
 from __future__ import annotations
 
+import os
+import signal
+import time
+
 from .catvton import CatVTONModel
 from common.config import load_settings
+from .continuous import ContinuousWorker
+from .dedup import ResultDeduplicator
+from .devices import DevicePool
+from .encoding import ResultEncoder
 from common.log_utils import get_logger, setup_logging
-from .pipeline import run_jobs
+from common.metrics import start_metrics_server
+from .multi import MultiDeviceWorker
+from .preview import PreviewPublisher
+from .sequential import SequentialWorker
+from .staged import StagedWorker
+from .stats import WorkerStatsReporter
 from common.redis_client import RedisClient
 from common.s3_client import S3ImageStore
 
+# WEAVER_WORKER_MODE -> worker class.
+WORKER_CLASSES = {
+    "sequential": SequentialWorker,
+    "staged": StagedWorker,
+    "continuous": ContinuousWorker,
+    "multi": MultiDeviceWorker,
+}
+
+
+def worker_class(mode: str) -> type:
+    if mode not in WORKER_CLASSES:
+        raise ValueError(f"Unknown WEAVER_WORKER_MODE {mode!r}; expected one of {tuple(WORKER_CLASSES)}")
+    return WORKER_CLASSES[mode]
+
 
 def main() -> None:
     settings = load_settings()
     setup_logging(settings.log_level)
     logger = get_logger("weaver.main")
+    # Before anything slow, so a typo fails the pod at once rather than after the model loads.
+    worker_cls = worker_class(settings.worker_mode)
 
-    redis_client = RedisClient(settings.redis_url)
+    # Not ready until the model is loaded and warmed up (see the readinessProbe).
+    if settings.ready_file and os.path.exists(settings.ready_file):
+        os.remove(settings.ready_file)
+    start_metrics_server(settings.metrics_port, logger)
+
+    started = time.perf_counter()
+    phases: dict[str, float] = {}
+
+    phase = time.perf_counter()
+    redis_client = RedisClient.from_settings(settings)
     if not redis_client.ping():
         raise RuntimeError("Redis ping failed")
+    phases["redis"] = time.perf_counter() - phase
 
+    phase = time.perf_counter()
     store = S3ImageStore(settings)
-    model = CatVTONModel(settings)
+    phases["s3"] = time.perf_counter() - phase
+
+    # In multi mode each device process loads and warms up its own model.
+    model = DevicePool(settings) if settings.worker_mode == "multi" else CatVTONModel(settings)
     model.load()
+    phases.update({f"model.{name}": seconds for name, seconds in model.load_timings.items()})
 
+    phase = time.perf_counter()
+    if settings.worker_mode == "continuous":
+        # The engine thread runs the model, so it compiles and captures the buckets itself.
+        model.start_engine()
+    else:
+        model.warmup()
+    phases["warmup"] = time.perf_counter() - phase
+
+    phase = time.perf_counter()
+    dedup = ResultDeduplicator.from_settings(settings, redis_client, store)
+    stats = WorkerStatsReporter(settings, redis_client, logger)
+    encoder = ResultEncoder(settings)
+    previews = PreviewPublisher.from_settings(settings, redis_client)
+    phases["services"] = time.perf_counter() - phase
+
+    logger.info(
+        "Startup complete in %.2fs (%s)",
+        time.perf_counter() - started,
+        " ".join(f"{name}={seconds:.2f}s" for name, seconds in phases.items()),
+    )
+    if settings.ready_file:
+        with open(settings.ready_file, "w") as ready:
+            ready.write(f"{time.time():.0f}\n")
     logger.info(
-        "Weaver worker started: queue=%s channel=%s backend=%s",
+        "Weaver worker started: queue=%s channel=%s backend=%s mode=%s devices=%s",
         settings.redis_queue,
         settings.redis_events_channel,
         settings.inference_backend,
+        settings.worker_mode,
+        ",".join(settings.devices) if settings.worker_mode == "multi" else settings.device,
     )
 
-    while True:
-        raw_jobs = redis_client.consume_job_weaver(settings.redis_queue, timeout_seconds=5)
-        if raw_jobs is None:
-            continue
-
-        done_events = run_jobs(
-            settings=settings,
-            store=store,
-            model=model,
-            raw_jobs=raw_jobs,
-            logger=logger,
-        )
-
-        for done_event in done_events:
-            redis_client.publish_event(
-                settings.redis_events_channel,
-                done_event.model_dump(mode="json"),
-            )
+    worker = worker_cls(
+        settings=settings,
+        redis_client=redis_client,
+        store=store,
+        model=model,
+        logger=logger,
+        dedup=dedup,
+        stats=stats,
+        encoder=encoder,
+        previews=previews,
+    )
+
+    def shutdown(signum: int, frame: object) -> None:
+        logger.info("Received %s; finishing popped jobs before exiting", signal.Signals(signum).name)
+        worker.stop()
+
+    # Rollouts send SIGTERM: stop popping, but publish what was already popped.
+    signal.signal(signal.SIGTERM, shutdown)
+    worker.run()
 
 
 if __name__ == "__main__":
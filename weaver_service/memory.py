@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+from common.config import Settings
+from common.log_utils import get_logger
+
+# Model calls in a row at the out-of-memory cap that raise it by one job.
+_OOM_RELAX_CALLS = 100
+
+
+def is_out_of_memory(exc: BaseException) -> bool:
+    """True for device (and host) allocation failures, which a smaller batch may avoid."""
+    try:
+        import torch  # type: ignore
+    except ImportError:
+        return False
+    if isinstance(exc, torch.cuda.OutOfMemoryError):
+        return True
+    message = str(exc).lower()
+    return isinstance(exc, RuntimeError) and ("out of memory" in message or "can't allocate memory" in message)
+
+
+class MemoryBudget:
+    """
+    Caps how many jobs go through the model at once so a batch fits in device memory.
+
+    Peak memory above what is already allocated is modelled as `fixed + per_job * jobs`.
+    `calibrate` fits both terms at startup from short runs of one and two jobs, and every
+    tracked batch that peaks higher raises `per_job`. `max_jobs` is how many jobs fit in
+    `MEMORY_BUDGET_FRACTION` of the memory the device still has (free plus cached by the
+    allocator). An out-of-memory batch of n jobs additionally caps later batches at n // 2;
+    every 100 model calls in a row at the cap without another failure raise it by one job, so
+    a transient failure (fragmentation, another process on the device) does not cap the worker
+    for good.
+
+    Jobs are counted at WIDTH x HEIGHT; callers pass fractional jobs for other sizes.
+    Only CUDA reports peak memory; on other devices nothing is calibrated and only the
+    out-of-memory cap applies.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        import torch  # type: ignore
+
+        self._torch = torch
+        self._device = torch.device(settings.device)
+        self._fraction = settings.memory_budget_fraction
+        self._cuda = self._device.type == "cuda" and torch.cuda.is_available() and self._fraction > 0
+        self._fixed = 0.0
+        self._per_job: float | None = None
+        self._oom_ceiling: int | None = None
+        self._calls_at_ceiling = 0
+        self._lock = threading.Lock()
+        self._logger = get_logger("weaver.memory")
+
+    def max_jobs(self) -> int | None:
+        """Largest batch expected to fit right now; None when nothing limits it yet."""
+        limits: list[int] = []
+        with self._lock:
+            if self._oom_ceiling is not None:
+                limits.append(self._oom_ceiling)
+            per_job, fixed = self._per_job, self._fixed
+        if self._cuda and per_job:
+            torch = self._torch
+            free, _ = torch.cuda.mem_get_info(self._device)
+            cached = torch.cuda.memory_reserved(self._device) - torch.cuda.memory_allocated(self._device)
+            available = (free + cached) * self._fraction - fixed
+            limits.append(max(1, int(available // per_job)))
+        return min(limits) if limits else None
+
+    @contextmanager
+    def track(self, jobs: float) -> Iterator[None]:
+        """Measure the peak memory of the enclosed model call for `jobs` jobs; failed calls are ignored."""
+        if not self._cuda:
+            yield
+            return
+        torch = self._torch
+        torch.cuda.synchronize(self._device)
+        torch.cuda.reset_peak_memory_stats(self._device)
+        before = torch.cuda.memory_allocated(self._device)
+        yield
+        self.observe(jobs, torch.cuda.max_memory_allocated(self._device) - before)
+
+    def observe(self, jobs: float, peak_bytes: float) -> None:
+        with self._lock:
+            per_job = (peak_bytes - self._fixed) / jobs
+            if self._per_job is None or per_job > self._per_job:
+                self._per_job = per_job
+
+    def record_success(self, jobs: float) -> None:
+        """Count a model call for `jobs` jobs that fit, relaxing the out-of-memory cap after enough at it."""
+        with self._lock:
+            if self._oom_ceiling is None or jobs < self._oom_ceiling:
+                return
+            self._calls_at_ceiling += 1
+            if self._calls_at_ceiling < _OOM_RELAX_CALLS:
+                return
+            self._calls_at_ceiling = 0
+            self._oom_ceiling += 1
+            self._logger.info("No out-of-memory errors at the cap; raising it to %s jobs", self._oom_ceiling)
+
+    def record_oom(self, jobs: int) -> None:
+        with self._lock:
+            self._calls_at_ceiling = 0
+            ceiling = max(1, jobs // 2)
+            if self._oom_ceiling is None or ceiling < self._oom_ceiling:
+                self._oom_ceiling = ceiling
+                self._logger.warning("Out of device memory at %s jobs; capping batches at %s", jobs, ceiling)
+
+    def calibrate(self, run: Callable[[int], Any]) -> None:
+        """Fit the memory model from `run(1)` and `run(2)`, each a short model call for that many jobs."""
+        if not self._cuda:
+            return
+        peaks: list[float] = []
+        for jobs in (1, 2):
+            torch = self._torch
+            torch.cuda.synchronize(self._device)
+            torch.cuda.reset_peak_memory_stats(self._device)
+            before = torch.cuda.memory_allocated(self._device)
+            run(jobs)
+            torch.cuda.synchronize(self._device)
+            peaks.append(torch.cuda.max_memory_allocated(self._device) - before)
+        per_job = peaks[1] - peaks[0]
+        with self._lock:
+            if per_job > 0:
+                self._per_job, self._fixed = per_job, peaks[0] - per_job
+            else:
+                self._per_job, self._fixed = peaks[1] / 2, 0.0
+            per_job, fixed = self._per_job, self._fixed
+        self._logger.info(
+            "Calibrated batch memory: %.0f MB fixed + %.0f MB per job; %s jobs fit now",
+            fixed / 2**20,
+            per_job / 2**20,
+            self.max_jobs(),
+        )
+
+    def release(self) -> None:
+        """Return cached blocks after an allocation failure so the retry starts from a clean pool."""
+        if self._device.type == "cuda" and self._torch.cuda.is_available():
+            self._torch.cuda.empty_cache()
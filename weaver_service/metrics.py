@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from typing import Any
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from common.metrics import STAGE_BUCKETS
+
+# Hot-path stages in the order a job passes through them. Per-job stages (queue_wait, download,
+# decode, encode, upload) are observed once per job, batch stages (preprocess, vae_encode,
+# vae_decode, inference) once per batch, denoise once per UNet step, preview once per preview
+# taken inside the loop and publish once per event.
+STAGES = (
+    "queue_wait",
+    "download",
+    "decode",
+    "preprocess",
+    "vae_encode",
+    "denoise",
+    "preview",
+    "vae_decode",
+    "inference",
+    "encode",
+    "upload",
+    "publish",
+)
+
+STAGE_SECONDS = Histogram(
+    "weaver_stage_seconds",
+    "Seconds spent in each Weaver hot-path stage.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+BATCH_JOBS = Histogram(
+    "weaver_batch_jobs",
+    "Jobs per inference batch.",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+JOBS = Counter("weaver_jobs_total", "Jobs finished by this worker, by status.", ["status"])
+PREVIEW_PUBLISH_SECONDS = Histogram(
+    "weaver_preview_publish_seconds",
+    "Seconds the preview thread spends encoding and publishing one batch of previews.",
+    buckets=STAGE_BUCKETS,
+)
+TIER_QUEUE_WAIT_SECONDS = Histogram(
+    "weaver_tier_queue_wait_seconds",
+    "Seconds jobs waited in the queue before a Weaver popped them, by fair-queue tier.",
+    ["tier"],
+    buckets=STAGE_BUCKETS,
+)
+DEVICE_JOBS = Counter("weaver_device_jobs_total", "Jobs inferred per device (WEAVER_WORKER_MODE=multi).", ["device"])
+DEVICE_BUSY_SECONDS = Counter(
+    "weaver_device_busy_seconds_total",
+    "Seconds each device spent on batches, transfers included (WEAVER_WORKER_MODE=multi).",
+    ["device"],
+)
+DEVICE_RESTARTS = Counter(
+    "weaver_device_restarts_total",
+    "Device processes restarted after exiting (WEAVER_WORKER_MODE=multi).",
+    ["device"],
+)
+PREVIEWS = Counter("weaver_previews_total", "Job previews, by outcome.", ["outcome"])
+LATENT_CACHE_HITS = Counter("weaver_latent_cache_hits_total", "VAE latent cache hits, by tier.", ["tier"])
+LATENT_CACHE_MISSES = Counter("weaver_latent_cache_misses_total", "VAE latent cache lookups that missed both tiers.")
+LATENT_CACHE_EVICTIONS = Counter(
+    "weaver_latent_cache_evictions_total", "VAE latent cache entries evicted, by tier.", ["tier"]
+)
+LATENT_CACHE_BYTES = Gauge("weaver_latent_cache_bytes", "Bytes held by the VAE latent cache, by tier.", ["tier"])
+# `LatentCache.stats()` counters and the series they are exported as.
+LATENT_CACHE_COUNTERS = {
+    "memory_hits": LATENT_CACHE_HITS.labels("memory"),
+    "disk_hits": LATENT_CACHE_HITS.labels("disk"),
+    "misses": LATENT_CACHE_MISSES,
+    "memory_evictions": LATENT_CACHE_EVICTIONS.labels("memory"),
+    "disk_evictions": LATENT_CACHE_EVICTIONS.labels("disk"),
+}
+
+for _stage in STAGES:
+    STAGE_SECONDS.labels(_stage)
+for _status in ("done", "failed"):
+    JOBS.labels(_status)
+for _outcome in ("published", "dropped", "failed"):
+    PREVIEWS.labels(_outcome)
+for _tier in ("memory", "disk"):
+    LATENT_CACHE_BYTES.labels(_tier)
+
+
+def observe(stage: str, seconds: float, timings: dict[str, float] | None = None) -> None:
+    """Record `seconds` for `stage`, and add them to `timings` (a job's or batch's breakdown) if given."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def observe_latent_cache(stats: dict[str, int], previous: dict[str, int]) -> None:
+    """
+    Export another process's latent cache from its latest `LatentCache.stats()` and the one seen
+    before. Memory bytes add up across processes; disk bytes are taken as reported, since device
+    processes share `LATENT_CACHE_DIR`.
+    """
+    for name, counter in LATENT_CACHE_COUNTERS.items():
+        counter.inc(max(0, stats.get(name, 0) - previous.get(name, 0)))
+    LATENT_CACHE_BYTES.labels("memory").inc(stats.get("memory_bytes", 0) - previous.get("memory_bytes", 0))
+    if "disk_bytes" in stats:
+        LATENT_CACHE_BYTES.labels("disk").set(stats["disk_bytes"])
+
+
+class StageClock:
+    """
+    Times consecutive stages of work on the inference device.
+
+    Each `mark(stage)` ends `stage`, which began at the previous mark (or when the clock was
+    created); `mark(None)` starts a new interval without recording the time since the last
+    mark. On CUDA a mark only records an event on the current stream, so timing adds no
+    host-device syncs to the denoising loop: elapsed times are read in `flush`, which by
+    default waits for the last mark and otherwise records only the marks the device has
+    already passed.
+    """
+
+    def __init__(self, device: str, timings: dict[str, float] | None = None) -> None:
+        import torch  # type: ignore
+
+        self._torch = torch
+        self._cuda = str(device).startswith("cuda") and torch.cuda.is_available()
+        self._timings = timings
+        self._pending: deque[tuple[str | None, Any]] = deque()
+        self._previous = self._now()
+
+    def mark(self, stage: str | None) -> None:
+        self._pending.append((stage, self._now()))
+
+    def flush(self, wait: bool = True) -> None:
+        if self._cuda and wait and self._pending:
+            self._pending[-1][1].synchronize()
+        while self._pending:
+            stage, point = self._pending[0]
+            if self._cuda and not point.query():
+                return
+            self._pending.popleft()
+            if stage is not None:
+                seconds = self._previous.elapsed_time(point) / 1000 if self._cuda else point - self._previous
+                observe(stage, seconds, self._timings)
+            self._previous = point
+
+    def _now(self) -> Any:
+        if not self._cuda:
+            return time.perf_counter()
+        event = self._torch.cuda.Event(enable_timing=True)
+        event.record()
+        return event
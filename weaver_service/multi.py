@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import functools
+import queue
+
+from .dedup import ResultDeduplicator
+from .devices import DevicePool, DeviceProcess, RemotePreviews
+from .encoding import ResultEncoder
+from .pipeline import PreparedBatch
+from .preview import PreviewPublisher
+from .staged import StagedWorker
+from .stats import WorkerStatsReporter
+from common.config import Settings
+from common.log_utils import JobContextAdapter
+from common.redis_client import RedisClient
+from common.s3_client import S3ImageStore
+
+# Seconds between attempts to start a device process that failed to start.
+_RESTART_BACKOFF_SECONDS = 10.0
+
+
+class MultiDeviceWorker(StagedWorker):
+    """
+    Worker for `WEAVER_WORKER_MODE=multi`: the staged pipeline with one inference thread per
+    `WEAVER_DEVICES` entry, each driving a model in its own process (`DevicePool`).
+
+    Intake (pop, download, decode) and publish (encode, upload, events) run once in this
+    process for all devices. Every device thread takes the next prepared batch as soon as its
+    device is idle, so batches go to whichever device frees up first. A device process that
+    exits is restarted; see `DeviceProcess` for what happens to the batch it was running.
+
+    Each device reports its batch latencies to the Arbitrator as a replica of its own
+    (`<worker id>/<device>`).
+    """
+
+    def __init__(
+        self,
+        *,
+        settings: Settings,
+        redis_client: RedisClient,
+        store: S3ImageStore,
+        model: DevicePool,
+        logger: JobContextAdapter,
+        dedup: ResultDeduplicator | None = None,
+        stats: WorkerStatsReporter | None = None,
+        encoder: ResultEncoder | None = None,
+        previews: PreviewPublisher | None = None,
+    ) -> None:
+        super().__init__(
+            settings=settings,
+            redis_client=redis_client,
+            store=store,
+            model=model,
+            logger=logger,
+            dedup=dedup,
+            stats=stats,
+            encoder=encoder,
+            previews=previews,
+        )
+        devices = len(model.devices)
+        self._prefetched = queue.Queue(maxsize=settings.prefetch_queue_depth * devices)
+        self._finished = queue.Queue(maxsize=settings.publish_queue_depth * devices)
+        self._device_stats: list[WorkerStatsReporter | None] = [None] * devices
+        if stats is not None:
+            self._device_stats = [
+                WorkerStatsReporter(settings, redis_client, logger, worker_id=f"{stats.worker_id}/{device.name}")
+                for device in model.devices
+            ]
+            # Popped counts go out under the first device: the process itself is not a replica.
+            self._stats = self._device_stats[0]
+        # Device processes publish previews themselves; they only need the batch's jobs.
+        self._device_previews = RemotePreviews() if previews is not None else None
+
+    def run(self) -> None:
+        for device, stats in zip(self._model.devices, self._device_stats):
+            if stats is not None:
+                # A device whose process is down or restarting is not a replica.
+                stats.start_heartbeats(self._done, alive=lambda device=device: device.running)
+        try:
+            self._run_stages(self._run_devices)
+        finally:
+            self._model.close()
+
+    def _run_devices(self) -> None:
+        threads = [
+            self._stage_thread(functools.partial(self._device_loop, device, stats), f"weaver-{device.name}")
+            for device, stats in zip(self._model.devices, self._device_stats)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _device_loop(self, device: DeviceProcess, stats: WorkerStatsReporter | None) -> None:
+        while not self._abort.is_set():
+            if not device.running:
+                if self._stop.is_set():
+                    # Not restarted while shutting down; the running devices drain the queue.
+                    return
+                try:
+                    device.start()
+                except Exception:  # noqa: BLE001
+                    self._logger.exception("Failed to restart device %s", device.name)
+                    self._stop.wait(_RESTART_BACKOFF_SECONDS)
+                    continue
+            batch: PreparedBatch | None = self._get(self._prefetched)
+            if batch is None:
+                if self._drained(self._prefetched, self._intake_done):
+                    return
+                continue
+            self._infer(device, batch, stats, self._device_previews)
@@ -1,17 +1,57 @@
 from __future__ import annotations
 
-from datetime import datetime
+import dataclasses
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from PIL import Image
 
 from .catvton import CatVTONModel
+from .dedup import ResultDeduplicator
+from .encoding import ResultEncoder, rendition_keys, result_extension
+from .metrics import BATCH_JOBS, JOBS, STAGES, TIER_QUEUE_WAIT_SECONDS, observe
+from .preview import PreviewPublisher
+from .profiles import InferenceParams, group_compatible, resolve_params
+from .stats import WorkerStatsReporter
 from common.config import Settings
 from common.job_schema import WeaverJob, WeaverJobDoneEvent
 from common.log_utils import JobContextAdapter, bind_job
+from common.redis_client import STREAM_DELIVERIES_EXCEEDED_FIELD, RedisClient
 from common.s3_client import S3ImageStore
 
 
+@dataclass
+class PreparedBatch:
+    """
+    One popped batch as it moves through the worker stages.
+
+    `events` collects per-job outcomes as they are decided; jobs that fail in an
+    earlier stage are dropped from `jobs` so later stages never see them.
+    """
+
+    raw_jobs: list[dict]
+    events: list[WeaverJobDoneEvent] = field(default_factory=list)
+    jobs: list[WeaverJob] = field(default_factory=list)
+    # Inference parameters per entry of `jobs` (profile over settings).
+    params: list[InferenceParams] = field(default_factory=list)
+    # Dedup fingerprint per entry of `jobs` (None when dedup is off or inputs could not be hashed).
+    fingerprints: list[str | None] = field(default_factory=list)
+    # Jobs identical to an earlier job in this batch; they take that job's result in finalize.
+    followers: list[tuple[WeaverJob, str]] = field(default_factory=list)
+    leader_ids: dict[str, str] = field(default_factory=dict)
+    person_imgs: list[Image.Image] = field(default_factory=list)
+    outfit_imgs: list[Image.Image] = field(default_factory=list)
+    outputs: list[Image.Image] = field(default_factory=list)
+    # Stage seconds shared by every job of the batch (preprocess, VAE passes, denoising, ...).
+    timings: dict[str, float] = field(default_factory=dict)
+    # Stage seconds of each job on its own (queue wait, download, decode, encode, upload), by job id.
+    job_timings: dict[str, dict[str, float]] = field(default_factory=dict)
+
+
 def _result_key(settings: Settings, job: WeaverJob) -> str:
     ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-    return f"{settings.s3_result_prefix}/{job.user_id}/{job.vton_id}/{job.id}_{ts}.png"
+    return f"{settings.s3_result_prefix}/{job.user_id}/{job.vton_id}/{job.id}_{ts}.{result_extension(settings)}"
 
 
 def _failed_event(raw_job: dict, error: str) -> WeaverJobDoneEvent:
@@ -24,103 +64,387 @@ def _failed_event(raw_job: dict, error: str) -> WeaverJobDoneEvent:
     )
 
 
-def run_jobs(
+def _job_failed_event(job: WeaverJob, error: str) -> WeaverJobDoneEvent:
+    return WeaverJobDoneEvent(
+        job_id=job.id,
+        status="failed",
+        user_id=job.user_id,
+        vton_id=job.vton_id,
+        error=error,
+    )
+
+
+def _done_event(settings: Settings, batch: PreparedBatch, job: WeaverJob, result_key: str) -> WeaverJobDoneEvent:
+    return WeaverJobDoneEvent(
+        job_id=job.id,
+        status="done",
+        user_id=job.user_id,
+        vton_id=job.vton_id,
+        result_s3_key=result_key,
+        renditions=rendition_keys(settings, result_key),
+        timings=_event_timings(settings, batch, job),
+    )
+
+
+def _event_timings(settings: Settings, batch: PreparedBatch, job: WeaverJob) -> dict[str, float] | None:
+    """The job's stage breakdown for its done event (`EVENT_TIMINGS`), in hot-path order."""
+    if not settings.event_timings:
+        return None
+    timings = {**batch.timings, **batch.job_timings.get(job.id, {})}
+    return {stage: round(timings[stage], 4) for stage in STAGES if stage in timings}
+
+
+def _queue_wait(job: WeaverJob, now: datetime) -> float | None:
+    if job.created_at is None:
+        return None
+    created_at = job.created_at if job.created_at.tzinfo is not None else job.created_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (now - created_at).total_seconds())
+
+
+def _fail_batch(batch: PreparedBatch, error: str) -> None:
+    for job in batch.jobs:
+        batch.events.append(_job_failed_event(job, error))
+    batch.jobs = []
+    batch.params = []
+    batch.fingerprints = []
+    batch.person_imgs = []
+    batch.outfit_imgs = []
+    batch.outputs = []
+
+
+def prepare_jobs(
     *,
     settings: Settings,
     store: S3ImageStore,
-    model: CatVTONModel,
     raw_jobs: list[dict],
     logger: JobContextAdapter,
-) -> list[WeaverJobDoneEvent]:
-    events: list[WeaverJobDoneEvent] = []
+    dedup: ResultDeduplicator | None = None,
+) -> PreparedBatch:
+    """Validate payloads, serve repeat requests from earlier results and download inputs for the rest."""
+    batch = PreparedBatch(raw_jobs=raw_jobs)
     valid_jobs: list[WeaverJob] = []
-    person_imgs = []
-    outfit_imgs = []
+    params: list[InferenceParams] = []
+    popped_at = datetime.now(timezone.utc)
 
     for raw_job in raw_jobs:
+        deliveries = raw_job.get(STREAM_DELIVERIES_EXCEEDED_FIELD)
+        if deliveries:
+            batch.events.append(_failed_event(raw_job, f"max_deliveries_exceeded: delivered {deliveries} times"))
+            logger.error("Job %s delivered %s times; failing it", raw_job.get("id", "unknown"), deliveries)
+            continue
         try:
             job = WeaverJob.model_validate(raw_job)
         except Exception as exc:  # noqa: BLE001
-            events.append(_failed_event(raw_job, f"invalid_job_payload: {exc}"))
+            batch.events.append(_failed_event(raw_job, f"invalid_job_payload: {exc}"))
             logger.exception("Invalid weaver job payload")
             continue
-
         job_logger = bind_job(logger, job.id, job.user_id, job.vton_id)
-        job_logger.info("Preparing weaver job")
         try:
-            person_imgs.append(store.download_image(job.user_snap_s3))
-            outfit_imgs.append(store.download_image(job.uncleaned_outfit_s3))
-            valid_jobs.append(job)
-        except Exception as exc:  # noqa: BLE001
-            events.append(
-                WeaverJobDoneEvent(
-                    job_id=job.id,
-                    status="failed",
-                    user_id=job.user_id,
-                    vton_id=job.vton_id,
-                    error=f"image_download_failed: {exc}",
-                )
-            )
-            job_logger.exception("Failed to download job inputs")
+            job_params = resolve_params(settings, job)
+        except ValueError as exc:
+            batch.events.append(_job_failed_event(job, f"invalid_profile: {exc}"))
+            job_logger.error("Invalid inference profile: %s", exc)
+            continue
+        job_logger.info("Preparing weaver job")
+        valid_jobs.append(job)
+        params.append(job_params)
+        job_timings = batch.job_timings.setdefault(job.id, {})
+        queue_wait = _queue_wait(job, popped_at)
+        if queue_wait is not None:
+            observe("queue_wait", queue_wait, job_timings)
+            if job.tier is not None:
+                TIER_QUEUE_WAIT_SECONDS.labels(job.tier).observe(queue_wait)
+
+    fingerprints: list[str | None] = [None] * len(valid_jobs)
+    if dedup is not None and valid_jobs:
+        valid_jobs, params, fingerprints = _dedup_jobs(settings, dedup, batch, valid_jobs, params, logger)
 
     if not valid_jobs:
-        return events
+        return batch
 
-    try:
-        outputs = model.infer_batch(person_imgs, outfit_imgs)
-    except Exception as exc:  # noqa: BLE001
-        for job in valid_jobs:
-            events.append(
-                WeaverJobDoneEvent(
-                    job_id=job.id,
-                    status="failed",
-                    user_id=job.user_id,
-                    vton_id=job.vton_id,
-                    error=f"batch_inference_failed: {exc}",
-                )
-            )
-        logger.exception("Batch inference failed")
-        return events
-    if len(outputs) != len(valid_jobs):
-        err = f"batch_output_mismatch: expected {len(valid_jobs)} got {len(outputs)}"
-        logger.error(err)
-        for job in valid_jobs:
-            events.append(
-                WeaverJobDoneEvent(
-                    job_id=job.id,
-                    status="failed",
-                    user_id=job.user_id,
-                    vton_id=job.vton_id,
-                    error=err,
-                )
+    # Person and outfit keys interleaved so each job's pair sits at [2i, 2i + 1].
+    keys = [key for job in valid_jobs for key in (job.user_snap_s3, job.uncleaned_outfit_s3)]
+    target_sizes = [(p.width, p.height) for p in params for _ in range(2)] if settings.input_draft_decode else None
+    object_timings: list[dict[str, float]] = []
+    images = store.download_images(keys, target_sizes, timings=object_timings)
+
+    for i, job in enumerate(valid_jobs):
+        person_img, outfit_img = images[2 * i], images[2 * i + 1]
+        error = next((img for img in (person_img, outfit_img) if isinstance(img, Exception)), None)
+        if error is not None:
+            batch.events.append(_job_failed_event(job, f"image_download_failed: {error}"))
+            bind_job(logger, job.id, job.user_id, job.vton_id).error(
+                "Failed to download job inputs: %s", error
             )
-        return events
+            continue
+        for stage in ("download", "decode"):
+            seconds = sum(object_timings[j].get(stage, 0.0) for j in (2 * i, 2 * i + 1))
+            observe(stage, seconds, batch.job_timings[job.id])
+        batch.jobs.append(job)
+        batch.params.append(params[i])
+        batch.fingerprints.append(fingerprints[i])
+        batch.person_imgs.append(person_img)
+        batch.outfit_imgs.append(outfit_img)
 
-    for job, output in zip(valid_jobs, outputs):
-        job_logger = bind_job(logger, job.id, job.user_id, job.vton_id)
+    return batch
+
+
+def _dedup_jobs(
+    settings: Settings,
+    dedup: ResultDeduplicator,
+    batch: PreparedBatch,
+    jobs: list[WeaverJob],
+    params: list[InferenceParams],
+    logger: JobContextAdapter,
+) -> tuple[list[WeaverJob], list[InferenceParams], list[str | None]]:
+    """Complete jobs with a known result and return the jobs (params, fingerprints) that still need inference."""
+    try:
+        fingerprints = dedup.fingerprint(jobs, params)
+        cached_keys = dedup.lookup(fingerprints)
+    except Exception:  # noqa: BLE001
+        logger.exception("Result dedup lookup failed; running batch without dedup")
+        return jobs, params, [None] * len(jobs)
+
+    hits = [(i, cached_key) for i, cached_key in enumerate(cached_keys) if cached_key is not None]
+    resolved = dedup.resolve([(cached_key, _result_key(settings, jobs[i])) for i, cached_key in hits])
+    served: set[int] = set()
+    for (i, cached_key), result in zip(hits, resolved):
+        job_logger = bind_job(logger, jobs[i].id, jobs[i].user_id, jobs[i].vton_id)
+        if isinstance(result, Exception):
+            job_logger.warning("Cached result %s unusable, running inference: %s", cached_key, result)
+            continue
+        batch.events.append(_done_event(settings, batch, jobs[i], result))
+        served.add(i)
+        job_logger.info("Completed weaver job from cached result %s", cached_key)
+
+    remaining_jobs: list[WeaverJob] = []
+    remaining_params: list[InferenceParams] = []
+    remaining_fingerprints: list[str | None] = []
+    for i, (job, job_params, fingerprint) in enumerate(zip(jobs, params, fingerprints)):
+        if i in served:
+            continue
+        if fingerprint is not None and fingerprint in batch.leader_ids:
+            batch.followers.append((job, fingerprint))
+            continue
+        if fingerprint is not None:
+            batch.leader_ids[fingerprint] = job.id
+        remaining_jobs.append(job)
+        remaining_params.append(job_params)
+        remaining_fingerprints.append(fingerprint)
+    return remaining_jobs, remaining_params, remaining_fingerprints
+
+
+def infer_prepared(
+    *,
+    model: CatVTONModel,
+    batch: PreparedBatch,
+    logger: JobContextAdapter,
+    stats: WorkerStatsReporter | None = None,
+    previews: PreviewPublisher | None = None,
+) -> None:
+    """
+    Run inference for the surviving jobs of `batch`, filling `batch.outputs`.
+
+    Jobs run in groups of compatible parameters (same size, steps and guidance), one
+    `infer_batch` call per group; a group that fails only fails its own jobs.
+    """
+    if not batch.jobs:
+        return
+
+    started = time.perf_counter()
+    outputs: list[Image.Image | None] = [None] * len(batch.jobs)
+    errors: dict[int, str] = {}
+    for group in group_compatible(batch.params):
+        jobs = [batch.jobs[i] for i in group]
+        preview = previews.for_jobs(jobs) if previews is not None else None
         try:
-            output_key = _result_key(settings, job)
-            store.upload_png(output_key, output)
-            events.append(
-                WeaverJobDoneEvent(
-                    job_id=job.id,
-                    status="done",
-                    user_id=job.user_id,
-                    vton_id=job.vton_id,
-                    result_s3_key=output_key,
-                )
+            group_outputs = model.infer_batch(
+                [batch.person_imgs[i] for i in group],
+                [batch.outfit_imgs[i] for i in group],
+                batch.timings,
+                preview,
+                [batch.params[i] for i in group],
             )
-            job_logger.info("Completed weaver job")
         except Exception as exc:  # noqa: BLE001
-            events.append(
-                WeaverJobDoneEvent(
-                    job_id=job.id,
-                    status="failed",
-                    user_id=job.user_id,
-                    vton_id=job.vton_id,
-                    error=f"upload_failed: {exc}",
-                )
-            )
-            job_logger.exception("Failed to upload output image")
+            logger.exception("Batch inference failed")
+            errors.update((i, f"batch_inference_failed: {exc}") for i in group)
+            continue
+        if len(group_outputs) != len(group):
+            err = f"batch_output_mismatch: expected {len(group)} got {len(group_outputs)}"
+            logger.error(err)
+            errors.update((i, err) for i in group)
+            continue
+        BATCH_JOBS.observe(len(group))
+        for i, output in zip(group, group_outputs):
+            outputs[i] = output
+
+    if errors:
+        for i, err in errors.items():
+            batch.events.append(_job_failed_event(batch.jobs[i], err))
+        kept = [i for i in range(len(batch.jobs)) if i not in errors]
+        batch.jobs = [batch.jobs[i] for i in kept]
+        batch.params = [batch.params[i] for i in kept]
+        batch.fingerprints = [batch.fingerprints[i] for i in kept]
+        outputs = [outputs[i] for i in kept]
+    batch.outputs = outputs
+    # Inputs are no longer needed; release them before the batch waits on the publish queue.
+    batch.person_imgs = []
+    batch.outfit_imgs = []
+    if not batch.jobs:
+        return
+
+    elapsed = time.perf_counter() - started
+    observe("inference", elapsed, batch.timings)
+    if stats is not None:
+        stats.record_batch(len(batch.jobs), elapsed)
+
+
+def finalize_jobs(
+    *,
+    settings: Settings,
+    store: S3ImageStore,
+    batch: PreparedBatch,
+    logger: JobContextAdapter,
+    dedup: ResultDeduplicator | None = None,
+    encoder: ResultEncoder | None = None,
+) -> list[WeaverJobDoneEvent]:
+    """Encode and upload outputs for `batch` and return the done events for every popped job."""
+    encoder = encoder or ResultEncoder(dataclasses.replace(settings, result_encode_workers=0))
+    encoded = encoder.encode_batch(batch.outputs)
+    batch.outputs = []
+    output_keys = [_result_key(settings, job) for job in batch.jobs]
+
+    # One upload per rendition; `owners[i]` is the index in `batch.jobs` of upload i.
+    uploads: list[tuple[str, bytes, str]] = []
+    owners: list[int] = []
+    for i, (output_key, result) in enumerate(zip(output_keys, encoded)):
+        if isinstance(result, Exception):
+            continue
+        keys = rendition_keys(settings, output_key)
+        for name, image in (("full", result.full), ("thumbnail", result.thumbnail)):
+            if image is not None and name in keys:
+                uploads.append((keys[name], image.data, image.content_type))
+                owners.append(i)
+    upload_timings: list[float] = []
+    upload_errors: dict[int, Exception] = {}
+    upload_seconds: dict[int, float] = {}
+    for owner, uploaded, seconds in zip(owners, store.upload_objects(uploads, timings=upload_timings), upload_timings):
+        upload_seconds[owner] = upload_seconds.get(owner, 0.0) + seconds
+        if isinstance(uploaded, Exception):
+            upload_errors.setdefault(owner, uploaded)
+    produced: list[tuple[str, str]] = []
 
-    return events
+    for i, (job, fingerprint, output_key, result) in enumerate(zip(batch.jobs, batch.fingerprints, output_keys, encoded)):
+        job_logger = bind_job(logger, job.id, job.user_id, job.vton_id)
+        if isinstance(result, Exception):
+            batch.events.append(_job_failed_event(job, f"encode_failed: {result}"))
+            job_logger.error("Failed to encode output image: %s", result)
+            continue
+        job_timings = batch.job_timings.setdefault(job.id, {})
+        observe("encode", result.encode_seconds, job_timings)
+        observe("upload", upload_seconds.get(i, 0.0), job_timings)
+        if i in upload_errors:
+            batch.events.append(_job_failed_event(job, f"upload_failed: {upload_errors[i]}"))
+            job_logger.error("Failed to upload output image: %s", upload_errors[i])
+            continue
+        batch.events.append(_done_event(settings, batch, job, output_key))
+        if fingerprint is not None:
+            produced.append((fingerprint, output_key))
+        job_logger.info("Completed weaver job")
+
+    if dedup is not None:
+        _finalize_followers(settings, dedup, batch, logger)
+        try:
+            dedup.record(produced)
+        except Exception:  # noqa: BLE001
+            logger.exception("Failed to record dedup results")
+    return batch.events
+
+
+def _finalize_followers(
+    settings: Settings,
+    dedup: ResultDeduplicator,
+    batch: PreparedBatch,
+    logger: JobContextAdapter,
+) -> None:
+    if not batch.followers:
+        return
+    events_by_job = {event.job_id: event for event in batch.events}
+    pending: list[tuple[WeaverJob, str]] = []
+    for job, fingerprint in batch.followers:
+        leader_event = events_by_job.get(batch.leader_ids[fingerprint])
+        if leader_event is None or leader_event.status != "done" or leader_event.result_s3_key is None:
+            error = leader_event.error if leader_event is not None else "missing"
+            batch.events.append(_job_failed_event(job, f"duplicate_job_failed: {error}"))
+            continue
+        pending.append((job, leader_event.result_s3_key))
+
+    resolved = dedup.resolve([(leader_key, _result_key(settings, job)) for job, leader_key in pending])
+    for (job, leader_key), result in zip(pending, resolved):
+        job_logger = bind_job(logger, job.id, job.user_id, job.vton_id)
+        if isinstance(result, Exception):
+            batch.events.append(_job_failed_event(job, f"upload_failed: {result}"))
+            job_logger.error("Failed to copy result of duplicate job: %s", result)
+            continue
+        batch.events.append(_done_event(settings, batch, job, result))
+        job_logger.info("Completed weaver job as duplicate of %s", leader_key)
+    batch.followers = []
+
+
+def publish_events(
+    *,
+    settings: Settings,
+    redis_client: RedisClient,
+    events: list[WeaverJobDoneEvent],
+    published: set[str] | None = None,
+) -> None:
+    """Publish `events` in order, adding each job id to `published` once its event is out."""
+    for done_event in events:
+        started = time.perf_counter()
+        redis_client.publish_event(
+            settings.redis_events_channel,
+            done_event.model_dump(mode="json"),
+        )
+        observe("publish", time.perf_counter() - started)
+        JOBS.labels(done_event.status).inc()
+        if published is not None:
+            published.add(done_event.job_id)
+
+
+def fail_popped_jobs(
+    *,
+    settings: Settings,
+    redis_client: RedisClient,
+    raw_jobs: list[dict],
+    error: str,
+    logger: JobContextAdapter,
+    published: set[str] | None = None,
+) -> None:
+    """
+    Fail and ack popped jobs after a stage error, so clients are not left waiting on them.
+    Jobs in `published` already have their event out and are only acked.
+    """
+    published = published or set()
+    events = [_failed_event(raw_job, error) for raw_job in raw_jobs if raw_job.get("id") not in published]
+    try:
+        publish_events(settings=settings, redis_client=redis_client, events=events)
+        redis_client.ack_jobs(settings.redis_queue, raw_jobs)
+    except Exception:  # noqa: BLE001
+        logger.exception("Failed to fail %s popped jobs; leaving them unacked", len(raw_jobs))
+
+
+def run_jobs(
+    *,
+    settings: Settings,
+    store: S3ImageStore,
+    model: CatVTONModel,
+    raw_jobs: list[dict],
+    logger: JobContextAdapter,
+    dedup: ResultDeduplicator | None = None,
+    stats: WorkerStatsReporter | None = None,
+    encoder: ResultEncoder | None = None,
+    previews: PreviewPublisher | None = None,
+) -> list[WeaverJobDoneEvent]:
+    batch = prepare_jobs(settings=settings, store=store, raw_jobs=raw_jobs, logger=logger, dedup=dedup)
+    infer_prepared(model=model, batch=batch, logger=logger, stats=stats, previews=previews)
+    return finalize_jobs(settings=settings, store=store, batch=batch, logger=logger, dedup=dedup, encoder=encoder)
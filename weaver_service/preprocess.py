@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import numpy as np
+from PIL import Image
+
+from .latent_cache import image_digest
+
+ResizeFn = Callable[[Image.Image, tuple[int, int]], Image.Image]
+
+
+@dataclass
+class PreprocessedBatch:
+    # Normalised NCHW tensors in [-1, 1] on the target device and dtype.
+    person: Any
+    cloth: Any
+    # Digests of the resized inputs (latent cache keys); None unless requested.
+    person_digests: list[str] | None = None
+    cloth_digests: list[str] | None = None
+
+
+class BatchPreprocessor:
+    """
+    Resizes a batch of person/garment images and produces the model's input tensors.
+
+    Replaces per-image `prepare_image` + `torch.cat` + `.to(device)`:
+
+    - resized RGB pixels are written straight into one uint8 NHWC staging buffer
+      (pinned when the target is CUDA), reused across batches of the same size;
+    - the buffer crosses to the device in a single non-blocking copy, and the
+      permute to NCHW, float conversion and [-1, 1] normalisation run on the device;
+    - with `workers > 0` the PIL resizes run on a thread pool (PIL releases the GIL
+      while resampling).
+
+    Person images occupy rows [0, N) and garments rows [N, 2N) of the staging buffer. A call
+    may resize to a `size` other than the default; each size keeps its own staging buffers.
+    """
+
+    def __init__(
+        self,
+        size: tuple[int, int],
+        device: str,
+        dtype: Any,
+        resize_person: ResizeFn,
+        resize_cloth: ResizeFn,
+        workers: int = 0,
+    ) -> None:
+        import torch  # type: ignore
+
+        self._torch = torch
+        self._size = size
+        self._device = torch.device(device)
+        self._dtype = dtype
+        self._resize_person = resize_person
+        self._resize_cloth = resize_cloth
+        self._pin = self._device.type == "cuda" and torch.cuda.is_available()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preprocess") if workers > 0 else None
+        self._buffers: dict[tuple[int, tuple[int, int]], Any] = {}
+        # Completion of the last copy out of each staging buffer; waited on before it is refilled.
+        self._copy_done: dict[tuple[int, tuple[int, int]], Any] = {}
+        self._lock = threading.Lock()
+
+    def __call__(
+        self,
+        person_imgs: list[Image.Image],
+        outfit_imgs: list[Image.Image],
+        with_digests: bool = False,
+        size: tuple[int, int] | None = None,
+    ) -> PreprocessedBatch:
+        if len(person_imgs) != len(outfit_imgs):
+            raise ValueError("person_imgs and outfit_imgs must have the same length")
+        with self._lock:
+            return self._prepare(person_imgs, outfit_imgs, with_digests, size or self._size)
+
+    def _prepare(
+        self,
+        person_imgs: list[Image.Image],
+        outfit_imgs: list[Image.Image],
+        with_digests: bool,
+        size: tuple[int, int],
+    ) -> PreprocessedBatch:
+        n = len(person_imgs)
+        staging = self._staging_buffer(2 * n, size)
+        staging_np = staging.numpy()
+
+        def fill(row: int) -> str | None:
+            if row < n:
+                resized = self._resize_person(person_imgs[row].convert("RGB"), size)
+            else:
+                resized = self._resize_cloth(outfit_imgs[row - n].convert("RGB"), size)
+            staging_np[row] = np.asarray(resized)
+            return image_digest(resized) if with_digests else None
+
+        rows = range(2 * n)
+        digests = list(self._pool.map(fill, rows)) if self._pool is not None else [fill(row) for row in rows]
+
+        torch = self._torch
+        device_batch = staging.to(self._device, non_blocking=self._pin)
+        if self._pin:
+            event = torch.cuda.Event()
+            event.record()
+            self._copy_done[(2 * n, size)] = event
+        # Same arithmetic as VaeImageProcessor (x / 255 * 2 - 1 in float32), then the model dtype.
+        batch = device_batch.permute(0, 3, 1, 2).float().div_(255.0).mul_(2.0).sub_(1.0)
+        batch = batch.to(self._dtype).contiguous()
+
+        return PreprocessedBatch(
+            person=batch[:n],
+            cloth=batch[n:],
+            person_digests=digests[:n] if with_digests else None,
+            cloth_digests=digests[n:] if with_digests else None,
+        )
+
+    def _staging_buffer(self, rows: int, size: tuple[int, int]) -> Any:
+        pending = self._copy_done.pop((rows, size), None)
+        if pending is not None:
+            pending.synchronize()
+        buffer = self._buffers.get((rows, size))
+        if buffer is None:
+            width, height = size
+            buffer = self._torch.empty((rows, height, width, 3), dtype=self._torch.uint8, pin_memory=self._pin)
+            self._buffers[(rows, size)] = buffer
+        return buffer
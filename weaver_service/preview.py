@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import base64
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Callable
+
+from PIL import Image
+
+from .metrics import PREVIEW_PUBLISH_SECONDS, PREVIEWS
+from common.config import Settings
+from common.job_schema import WeaverJob, WeaverJobProgressEvent
+from common.log_utils import get_logger
+from common.redis_client import RedisClient
+
+# (step, total_steps, uint8 NHWC previews on the device, index of the first row in the batch)
+PreviewSink = Callable[[int, int, Any, int], None]
+
+# Preview batches waiting on the preview thread before new previews are dropped.
+_MAX_PENDING = 2
+
+
+class PreviewPublisher:
+    """
+    Publishes low-resolution previews of jobs that are still denoising (`PREVIEW_INTERVAL_STEPS`).
+
+    The pipeline projects latents to RGB on the device (`latents_to_preview`); the inference
+    thread then only queues a non-blocking copy of those pixels into pinned host memory. A
+    single background thread waits for the copy, JPEG-encodes one image per job and publishes
+    a `WeaverJobProgressEvent` on `REDIS_PROGRESS_CHANNEL`. When that thread falls behind,
+    new previews are dropped instead of holding up the denoising loop.
+    """
+
+    def __init__(self, settings: Settings, redis_client: RedisClient) -> None:
+        import torch  # type: ignore
+
+        self._torch = torch
+        self._redis = redis_client
+        self._channel = settings.redis_progress_channel
+        self._quality = settings.preview_quality
+        self._pin = torch.device(settings.device).type == "cuda" and torch.cuda.is_available()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="weaver-preview")
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._logger = get_logger("weaver.preview")
+
+    @classmethod
+    def from_settings(cls, settings: Settings, redis_client: RedisClient) -> PreviewPublisher | None:
+        if settings.preview_interval_steps <= 0 or settings.inference_backend == "stub":
+            return None
+        return cls(settings, redis_client)
+
+    def for_jobs(self, jobs: list[WeaverJob]) -> PreviewSink:
+        """Preview callback for a batch whose rows are `jobs`, in order."""
+
+        def sink(step: int, total_steps: int, pixels: Any, offset: int) -> None:
+            self._submit(jobs[offset : offset + pixels.shape[0]], step, total_steps, pixels)
+
+        return sink
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, jobs: list[WeaverJob], step: int, total_steps: int, pixels: Any) -> None:
+        with self._lock:
+            if self._pending >= _MAX_PENDING:
+                PREVIEWS.labels("dropped").inc(len(jobs))
+                return
+            self._pending += 1
+        torch = self._torch
+        try:
+            host = torch.empty(pixels.shape, dtype=pixels.dtype, pin_memory=self._pin)
+            host.copy_(pixels, non_blocking=self._pin)
+            copied = None
+            if self._pin:
+                copied = torch.cuda.Event()
+                copied.record()
+            self._executor.submit(self._publish, jobs, step, total_steps, host, copied)
+        except Exception:  # noqa: BLE001
+            # `_publish` will not run to release the slot; a lost preview must not fail the batch.
+            with self._lock:
+                self._pending -= 1
+            PREVIEWS.labels("failed").inc(len(jobs))
+            self._logger.exception("Failed to queue previews")
+
+    def _publish(self, jobs: list[WeaverJob], step: int, total_steps: int, host: Any, copied: Any) -> None:
+        started = time.perf_counter()
+        try:
+            if copied is not None:
+                copied.synchronize()
+            for job, pixels in zip(jobs, host.numpy()):
+                buffer = BytesIO()
+                Image.fromarray(pixels).save(buffer, format="JPEG", quality=self._quality)
+                event = WeaverJobProgressEvent(
+                    job_id=job.id,
+                    user_id=job.user_id,
+                    vton_id=job.vton_id,
+                    step=step,
+                    total_steps=total_steps,
+                    percent=round(100 * step / total_steps, 1),
+                    preview_jpeg=base64.b64encode(buffer.getvalue()).decode("ascii"),
+                    width=pixels.shape[1],
+                    height=pixels.shape[0],
+                )
+                self._redis.publish_event(self._channel, event.model_dump(mode="json"))
+            PREVIEWS.labels("published").inc(len(jobs))
+        except Exception:  # noqa: BLE001
+            PREVIEWS.labels("failed").inc(len(jobs))
+            self._logger.exception("Failed to publish previews")
+        finally:
+            PREVIEW_PUBLISH_SECONDS.observe(time.perf_counter() - started)
+            with self._lock:
+                self._pending -= 1
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+
+from common.config import Settings
+from common.job_schema import WeaverJob
+
+
+@dataclass(frozen=True)
+class InferenceParams:
+    """The inference parameters one job runs with: its profile with the Weaver's settings filled in."""
+
+    width: int
+    height: int
+    steps: int
+    guidance_scale: float
+    # None draws fresh noise for every run (SEED=-1 and no seed in the profile).
+    seed: int | None
+
+    @property
+    def batch_key(self) -> tuple[int, int, int, float]:
+        """Jobs with equal keys can share a pipeline call: same tensor shapes and denoising schedule."""
+        return self.width, self.height, self.steps, self.guidance_scale
+
+
+def default_params(settings: Settings) -> InferenceParams:
+    return InferenceParams(
+        width=settings.width,
+        height=settings.height,
+        steps=settings.num_inference_steps,
+        guidance_scale=settings.guidance_scale,
+        seed=settings.seed if settings.seed >= 0 else None,
+    )
+
+
+def resolve_params(settings: Settings, job: WeaverJob) -> InferenceParams:
+    """
+    `job`'s parameters: its profile over the settings defaults. Raises ValueError when the
+    profile asks for a size outside `PROFILE_SIZES` or more steps than `PROFILE_MAX_STEPS`.
+    """
+    params = default_params(settings)
+    profile = job.profile
+    if profile is None:
+        return params
+    width, height = (profile.width, profile.height) if profile.width is not None else (params.width, params.height)
+    if (width, height) not in settings.profile_sizes:
+        allowed = ", ".join(f"{w}x{h}" for w, h in settings.profile_sizes)
+        raise ValueError(f"size {width}x{height} not allowed (PROFILE_SIZES: {allowed})")
+    steps = profile.steps if profile.steps is not None else params.steps
+    if steps > settings.profile_max_steps:
+        raise ValueError(f"{steps} steps exceeds PROFILE_MAX_STEPS={settings.profile_max_steps}")
+    return InferenceParams(
+        width=width,
+        height=height,
+        steps=steps,
+        guidance_scale=profile.guidance_scale if profile.guidance_scale is not None else params.guidance_scale,
+        seed=profile.seed if profile.seed is not None else params.seed,
+    )
+
+
+def batch_seeds(params: list[InferenceParams]) -> list[int | None]:
+    """
+    One seed per row of a batch: all None (the pipeline's global RNG) when no row is seeded.
+    Noise is drawn from per-row generators or not at all, so a seeded batch gives its
+    unseeded rows a random seed.
+    """
+    seeds = [row.seed for row in params]
+    if all(seed is None for seed in seeds):
+        return seeds
+    return [seed if seed is not None else random.getrandbits(63) for seed in seeds]
+
+
+def group_compatible(params: list[InferenceParams]) -> list[list[int]]:
+    """Indices of `params` grouped by `batch_key`, groups in order of their first job."""
+    groups: dict[tuple[int, int, int, float], list[int]] = {}
+    for i, job_params in enumerate(params):
+        groups.setdefault(job_params.batch_key, []).append(i)
+    return list(groups.values())
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import threading
+
+from .catvton import CatVTONModel
+from .dedup import ResultDeduplicator
+from .encoding import ResultEncoder
+from .pipeline import publish_events, run_jobs
+from .preview import PreviewPublisher
+from .stats import WorkerStatsReporter
+from common.config import Settings
+from common.log_utils import JobContextAdapter
+from common.redis_client import RedisClient
+from common.s3_client import S3ImageStore
+
+
+class SequentialWorker:
+    """
+    Worker for `WEAVER_WORKER_MODE=sequential`: pop a batch, run it end to end, publish, ack.
+
+    Nothing overlaps, so a batch's download and upload time adds directly to every job's
+    latency; see `StagedWorker` and `ContinuousWorker` for the overlapped modes.
+    """
+
+    def __init__(
+        self,
+        *,
+        settings: Settings,
+        redis_client: RedisClient,
+        store: S3ImageStore,
+        model: CatVTONModel,
+        logger: JobContextAdapter,
+        dedup: ResultDeduplicator | None = None,
+        stats: WorkerStatsReporter | None = None,
+        encoder: ResultEncoder | None = None,
+        previews: PreviewPublisher | None = None,
+    ) -> None:
+        self._settings = settings
+        self._redis = redis_client
+        self._store = store
+        self._model = model
+        self._logger = logger
+        self._dedup = dedup
+        self._stats = stats
+        self._encoder = encoder
+        self._previews = previews
+        self._stop = threading.Event()
+
+    def run(self) -> None:
+        if self._stats is not None:
+            self._stats.start_heartbeats(self._stop)
+        while not self._stop.is_set():
+            raw_jobs = self._redis.consume_job_weaver(self._settings.redis_queue, timeout_seconds=5)
+            if raw_jobs is None:
+                continue
+            if self._stats is not None:
+                self._stats.record_popped(len(raw_jobs))
+
+            done_events = run_jobs(
+                settings=self._settings,
+                store=self._store,
+                model=self._model,
+                raw_jobs=raw_jobs,
+                logger=self._logger,
+                dedup=self._dedup,
+                stats=self._stats,
+                encoder=self._encoder,
+                previews=self._previews,
+            )
+
+            publish_events(settings=self._settings, redis_client=self._redis, events=done_events)
+            self._redis.ack_jobs(self._settings.redis_queue, raw_jobs)
+
+    def stop(self) -> None:
+        self._stop.set()
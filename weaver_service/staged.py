@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import queue
+import threading
+from typing import Any, Callable
+
+from .catvton import CatVTONModel
+from .dedup import ResultDeduplicator
+from .encoding import ResultEncoder
+from .pipeline import (
+    PreparedBatch,
+    _fail_batch,
+    fail_popped_jobs,
+    finalize_jobs,
+    infer_prepared,
+    prepare_jobs,
+    publish_events,
+)
+from .preview import PreviewPublisher
+from .stats import WorkerStatsReporter
+from common.config import Settings
+from common.log_utils import JobContextAdapter
+from common.redis_client import RedisClient
+from common.s3_client import S3ImageStore
+
+
+class StagedWorker:
+    """
+    Overlapped worker: intake -> inference -> publish, connected by bounded queues.
+
+    - The intake thread pops and downloads batch N+1 while batch N is on the model.
+    - The calling thread owns the model and only ever runs inference.
+    - The publish thread uploads outputs and publishes done events for batch N-1.
+
+    Queue depths bound how many popped-but-unfinished batches a single worker holds,
+    so a slow stage applies back-pressure instead of hoarding jobs from other replicas.
+
+    `stop` only stops intake: every batch already popped still goes through inference and
+    publish before `run` returns. A batch whose intake, inference or publish fails has its
+    jobs failed and acked. An error that escapes a stage aborts the worker: batches still
+    queued are failed, and `run` re-raises the error so the process exits and is restarted
+    instead of running on without that stage.
+    """
+
+    def __init__(
+        self,
+        *,
+        settings: Settings,
+        redis_client: RedisClient,
+        store: S3ImageStore,
+        model: CatVTONModel,
+        logger: JobContextAdapter,
+        dedup: ResultDeduplicator | None = None,
+        stats: WorkerStatsReporter | None = None,
+        encoder: ResultEncoder | None = None,
+        previews: PreviewPublisher | None = None,
+    ) -> None:
+        self._settings = settings
+        self._redis = redis_client
+        self._store = store
+        self._model = model
+        self._logger = logger
+        self._dedup = dedup
+        self._stats = stats
+        self._encoder = encoder
+        self._previews = previews
+        # Stop popping; set by `stop`.
+        self._stop = threading.Event()
+        # A stage died: give up on the batches in flight.
+        self._abort = threading.Event()
+        self._intake_done = threading.Event()
+        self._inference_done = threading.Event()
+        self._done = threading.Event()
+        self._prefetched: queue.Queue[PreparedBatch] = queue.Queue(maxsize=settings.prefetch_queue_depth)
+        self._finished: queue.Queue[PreparedBatch] = queue.Queue(maxsize=settings.publish_queue_depth)
+        self._stage_error: BaseException | None = None
+
+    def run(self) -> None:
+        if self._stats is not None:
+            self._stats.start_heartbeats(self._done)
+        self._run_stages(self._infer_loop)
+
+    def stop(self) -> None:
+        """Stop popping new jobs; batches already popped are still inferred and published."""
+        self._stop.set()
+
+    def _run_stages(self, inference: Callable[[], None]) -> None:
+        """Run intake and publish threads around `inference` (on this thread) until stopped and drained."""
+        intake = self._stage_thread(self._intake_loop, "weaver-intake")
+        publish = self._stage_thread(self._publish_loop, "weaver-publish")
+        intake.start()
+        publish.start()
+        try:
+            self._guarded(inference, "weaver-inference")()
+        finally:
+            self._inference_done.set()
+            intake.join()
+            publish.join()
+            self._fail_abandoned()
+            self._done.set()
+        self._raise_stage_error()
+
+    def _guarded(self, target: Callable[[], None], name: str) -> Callable[[], None]:
+        """`target`, made to abort the worker instead of raising."""
+
+        def run_stage() -> None:
+            try:
+                target()
+            except Exception as exc:  # noqa: BLE001
+                self._logger.exception("Stage %s died; stopping the worker", name)
+                self._stage_error = exc
+                self._stop.set()
+                self._abort.set()
+
+        return run_stage
+
+    def _stage_thread(self, target: Callable[[], None], name: str) -> threading.Thread:
+        return threading.Thread(target=self._guarded(target, name), name=name, daemon=True)
+
+    def _raise_stage_error(self) -> None:
+        if self._stage_error is not None:
+            raise RuntimeError(f"Worker stopped after a stage failure: {self._stage_error}") from self._stage_error
+
+    def _put(self, target: queue.Queue[PreparedBatch], batch: PreparedBatch) -> None:
+        while not self._abort.is_set():
+            try:
+                target.put(batch, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        self._abandon(batch)
+
+    def _get(self, source: queue.Queue[PreparedBatch]) -> PreparedBatch | None:
+        try:
+            return source.get(timeout=0.5)
+        except queue.Empty:
+            return None
+
+    @staticmethod
+    def _drained(source: queue.Queue[PreparedBatch], upstream_done: threading.Event) -> bool:
+        # `upstream_done` first: once it is set nothing more is put, so `empty` is final.
+        return upstream_done.is_set() and source.empty()
+
+    def _abandon(self, batch: PreparedBatch) -> None:
+        fail_popped_jobs(
+            settings=self._settings,
+            redis_client=self._redis,
+            raw_jobs=batch.raw_jobs,
+            error="worker_stopped",
+            logger=self._logger,
+        )
+
+    def _fail_abandoned(self) -> None:
+        for source in (self._prefetched, self._finished):
+            while (batch := self._get_nowait(source)) is not None:
+                self._abandon(batch)
+
+    @staticmethod
+    def _get_nowait(source: queue.Queue[PreparedBatch]) -> PreparedBatch | None:
+        try:
+            return source.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _intake_loop(self) -> None:
+        try:
+            self._pop_batches()
+        finally:
+            self._intake_done.set()
+
+    def _pop_batches(self) -> None:
+        while not self._stop.is_set():
+            raw_jobs = None
+            try:
+                raw_jobs = self._redis.consume_job_weaver(self._settings.redis_queue, timeout_seconds=5)
+                if raw_jobs is None:
+                    continue
+                if self._stats is not None:
+                    self._stats.record_popped(len(raw_jobs))
+                batch = prepare_jobs(
+                    settings=self._settings,
+                    store=self._store,
+                    raw_jobs=raw_jobs,
+                    logger=self._logger,
+                    dedup=self._dedup,
+                )
+            except Exception as exc:  # noqa: BLE001
+                self._logger.exception("Intake stage failed")
+                if raw_jobs:
+                    fail_popped_jobs(
+                        settings=self._settings,
+                        redis_client=self._redis,
+                        raw_jobs=raw_jobs,
+                        error=f"batch_intake_failed: {exc}",
+                        logger=self._logger,
+                    )
+                continue
+            self._put(self._prefetched, batch)
+
+    def _infer_loop(self) -> None:
+        while not self._abort.is_set():
+            batch = self._get(self._prefetched)
+            if batch is None:
+                if self._drained(self._prefetched, self._intake_done):
+                    return
+                continue
+            self._infer(self._model, batch, self._stats, self._previews)
+
+    def _infer(
+        self,
+        model: Any,
+        batch: PreparedBatch,
+        stats: WorkerStatsReporter | None,
+        previews: Any,
+    ) -> None:
+        """Run `batch` on `model` and hand it to publish; a failure fails the batch's jobs."""
+        try:
+            infer_prepared(model=model, batch=batch, logger=self._logger, stats=stats, previews=previews)
+        except Exception as exc:  # noqa: BLE001
+            self._logger.exception("Inference stage failed")
+            _fail_batch(batch, f"batch_inference_failed: {exc}")
+        self._put(self._finished, batch)
+
+    def _publish_loop(self) -> None:
+        while not self._abort.is_set():
+            batch = self._get(self._finished)
+            if batch is None:
+                if self._drained(self._finished, self._inference_done):
+                    return
+                continue
+            published: set[str] = set()
+            try:
+                events = finalize_jobs(
+                    settings=self._settings,
+                    store=self._store,
+                    batch=batch,
+                    logger=self._logger,
+                    dedup=self._dedup,
+                    encoder=self._encoder,
+                )
+                publish_events(settings=self._settings, redis_client=self._redis, events=events, published=published)
+                self._redis.ack_jobs(self._settings.redis_queue, batch.raw_jobs)
+            except Exception as exc:  # noqa: BLE001
+                self._logger.exception("Publish stage failed")
+                fail_popped_jobs(
+                    settings=self._settings,
+                    redis_client=self._redis,
+                    raw_jobs=batch.raw_jobs,
+                    error=f"batch_publish_failed: {exc}",
+                    logger=self._logger,
+                    published=published,
+                )
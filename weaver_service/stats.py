@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+from typing import Callable
+
+from common.config import Settings
+from common.log_utils import JobContextAdapter
+from common.redis_client import RedisClient
+
+
+class WorkerStatsReporter:
+    """
+    Publishes this worker's heartbeat, popped-job count and per-batch-size inference latency
+    to Redis for the Arbitrator's throughput model, tagged with the worker's `WEAVER_POOL` so
+    CPU and GPU workers are modelled separately.
+
+    Latencies are smoothed locally (EWMA per batch size) so one slow batch does not swing the
+    fleet's batch size. Reporting failures are logged and never interrupt the worker.
+
+    Heartbeats come from a background thread (`start_heartbeats`) so a batch that runs longer
+    than `WEAVER_HEARTBEAT_TTL_SECONDS` does not drop the worker from the Arbitrator's fleet.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        redis_client: RedisClient,
+        logger: JobContextAdapter,
+        worker_id: str | None = None,
+        smoothing: float = 0.3,
+    ) -> None:
+        self._redis = redis_client
+        self._logger = logger
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self._smoothing = smoothing
+        self._pool = settings.worker_pool
+        self._heartbeat_interval = max(1.0, settings.weaver_heartbeat_ttl_seconds / 3)
+        self._last_heartbeat = 0.0
+        self._latency_by_batch_size: dict[int, float] = {}
+
+    def record_popped(self, jobs_popped: int) -> None:
+        try:
+            self._redis.record_weaver_popped(self.worker_id, jobs_popped, pool=self._pool)
+            self._last_heartbeat = time.monotonic()
+        except Exception:  # noqa: BLE001
+            self._logger.exception("Failed to report popped jobs")
+
+    def heartbeat(self) -> None:
+        if time.monotonic() - self._last_heartbeat < self._heartbeat_interval:
+            return
+        self.record_popped(0)
+
+    def start_heartbeats(self, stop: threading.Event, alive: Callable[[], bool] | None = None) -> None:
+        """Heartbeat every third of the TTL until `stop` is set, skipping beats while `alive()` is false."""
+
+        def beat() -> None:
+            while not stop.wait(self._heartbeat_interval):
+                if alive is None or alive():
+                    self.heartbeat()
+
+        threading.Thread(target=beat, name=f"weaver-heartbeat-{self.worker_id}", daemon=True).start()
+
+    def record_batch(self, batch_size: int, seconds: float) -> None:
+        previous = self._latency_by_batch_size.get(batch_size)
+        smoothed = seconds if previous is None else previous + self._smoothing * (seconds - previous)
+        self._latency_by_batch_size[batch_size] = smoothed
+        try:
+            self._redis.record_weaver_latency(self.worker_id, {batch_size: smoothed}, pool=self._pool)
+            self._last_heartbeat = time.monotonic()
+        except Exception:  # noqa: BLE001
+            self._logger.exception("Failed to report batch latency")